@@ -20,6 +20,10 @@ init_auth(app)
 from routes import register_blueprints
 register_blueprints(app)
 
+# 导入旧版 .bak 备份（只在启动时执行，读取接口不做迁移）
+from core.backups import migrate_legacy_backups
+migrate_legacy_backups()
+
 # 启动后台监控线程
 from core.watcher import start_watchers
 start_watchers()
@@ -0,0 +1,23 @@
+# benchmarks/bench_lexer.py - 词法分析与解析基准
+# 功能: 在 1k-50k 行合成 crontab 上测量 tokenize / 解析 / 验证吞吐
+# 运行: python benchmarks/bench_lexer.py [行数 ...]
+
+import sys
+
+from common import make_crontab, timeit, report
+from core.crontab import tokenize_crontab, parse_crontab_content, validate_crontab_content
+
+
+def main(sizes):
+    for lines in sizes:
+        raw = make_crontab(lines)
+        repeat = max(3, 50000 // lines)
+        print(f'--- {lines} lines ---')
+        report('tokenize_crontab', timeit(lambda: tokenize_crontab(raw), repeat), lines)
+        report('tokenize_crontab(validate=True)', timeit(lambda: tokenize_crontab(raw, validate=True), repeat), lines)
+        report('parse_crontab_content (uncached)', timeit(lambda: parse_crontab_content(raw, cache=False), repeat), lines)
+        report('validate_crontab_content', timeit(lambda: validate_crontab_content(raw), repeat), lines)
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 50000])
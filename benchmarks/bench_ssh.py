@@ -0,0 +1,96 @@
+# benchmarks/bench_ssh.py - SSHExecutor 基准（本地 SSH 替身服务器）
+# 功能: 在不同人为 RTT 下测量建连耗时、连接复用下单命令耗时、批量读取与逐用户读取、
+#       条件保存，以及不同 max_channels 下的并发吞吐
+# 运行: python benchmarks/bench_ssh.py [--rtt 0,0.01,0.05] [--users 10] [--time 1]
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import make_crontab, measure, summarize
+from ssh_server import SSHStandIn
+
+from core.crontab import content_hash
+from executor import get_executor
+
+
+def _print(name, result):
+    print(f'{name:<40} {result["ops"]:>10,.1f} ops/s  p50 {result["p50_ms"]:>9.2f} ms  p99 {result["p99_ms"]:>9.2f} ms',
+          flush=True)
+
+
+def concurrent_throughput(server, max_channels, threads, seconds, user):
+    """threads 个线程共用一个执行器持续读取 crontab，返回每秒完成的调用数"""
+    executor = get_executor(server.machine_config(max_channels=max_channels))
+    executor.test_connection()
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def loop(i):
+        while time.perf_counter() < deadline:
+            executor.get_crontab(user)
+            counts[i] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(loop, range(threads)))
+    elapsed = time.perf_counter() - start
+    executor.close()
+    return sum(counts) / elapsed
+
+
+def bench(rtt, users, lines, seconds):
+    content = make_crontab(lines)
+    names = [f'user{i:02d}' for i in range(users)]
+    with SSHStandIn(rtt=rtt, crontabs={u: content for u in names}) as server:
+        print(f'--- rtt {rtt * 1000:.0f} ms, {users} users × {lines} lines ---')
+
+        def connect():
+            executor = get_executor(server.machine_config())
+            executor.test_connection()
+            executor.close()
+
+        _print('connect + first command', summarize(measure(connect, min_time=seconds)))
+
+        executor = get_executor(server.machine_config())
+        executor.test_connection()
+        _print('reused connection: echo', summarize(measure(executor.test_connection, min_time=seconds)))
+        _print('get_crontab (1 user)', summarize(measure(lambda: executor.get_crontab(names[0]), min_time=seconds)))
+        _print(f'get_crontabs ({users} users, 1 call)',
+               summarize(measure(lambda: executor.get_crontabs(names), min_time=seconds)))
+        _print(f'get_crontab × {users} (sequential)',
+               summarize(measure(lambda: [executor.get_crontab(u) for u in names], min_time=seconds)))
+        _print(f'get_crontab_hashes ({users} users)',
+               summarize(measure(lambda: executor.get_crontab_hashes(names), min_time=seconds)))
+
+        current = {'hash': content_hash(content)}
+
+        def save_if():
+            ok, error = executor.save_crontab_if(content, names[0], current['hash'])
+            if not ok:
+                raise RuntimeError(error)
+
+        _print('save_crontab_if', summarize(measure(save_if, min_time=seconds)))
+        executor.close()
+
+        for max_channels in (1, 4, 8):
+            ops = concurrent_throughput(server, max_channels, 8, seconds, names[0])
+            print(f'{f"8 threads, max_channels={max_channels}":<40} {ops:>10,.1f} ops/s', flush=True)
+        print(f'{"ssh connections accepted":<40} {server.connections:>10}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SSHExecutor 基准')
+    parser.add_argument('--rtt', default='0,0.01,0.05', help='人为往返延迟（秒），逗号分隔')
+    parser.add_argument('--users', type=int, default=10, help='Linux 用户数')
+    parser.add_argument('--lines', type=int, default=200, help='每个 crontab 的行数')
+    parser.add_argument('--time', type=float, default=1.0, help='每项最少运行秒数')
+    args = parser.parse_args(argv)
+    for rtt in (float(r) for r in args.rtt.split(',') if r):
+        bench(rtt, args.users, args.lines, args.time)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
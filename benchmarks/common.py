@@ -0,0 +1,139 @@
+# benchmarks/common.py - 基准测试公共工具
+# 功能: 生成指定行数的合成 crontab、计时与结果输出、隔离的 Flask 测试环境
+
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCHEDULES = [
+    '0 3 * * *', '*/5 * * * *', '30 2 * * 1-5', '0 */4 * * *', '15 1 1 * *',
+    '@daily', '@hourly', '0 9 * jan-jun mon', '0 0 * * sun', '@reboot',
+]
+
+
+def make_crontab(lines: int, seed: int = 0) -> str:
+    """生成约 lines 行的 crontab: 环境变量、组标题、任务名、启用/禁用任务、空行混合"""
+    rnd = random.Random(seed)
+    out = ['SHELL=/bin/bash', 'PATH=/usr/local/bin:/usr/bin:/bin', '']
+    group = 0
+    while len(out) < lines:
+        group += 1
+        out.append(f'# 任务组 {group}')
+        for task in range(rnd.randint(1, 8)):
+            if rnd.random() < 0.4:
+                out.append(f'# 任务 {group}-{task}')
+            line = f'{rnd.choice(SCHEDULES)} /opt/jobs/job_{group}_{task}.sh >> /var/log/job.log 2>&1'
+            out.append(line if rnd.random() < 0.7 else '#' + line)
+        out.append('')
+    return '\n'.join(out[:lines]) + '\n'
+
+
+def timeit(fn, repeat: int = 5, number: int = 1):
+    """运行 repeat 轮（每轮 number 次），返回每次调用耗时（秒）列表"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def report(name: str, samples, items: int = None):
+    """输出最快一轮耗时（及每秒处理条数）"""
+    best = min(samples)
+    line = f'{name:<40} {best * 1000:10.2f} ms'
+    if items:
+        line += f'  {items / best:12,.0f} lines/s'
+    print(line)
+
+
+def percentile(sorted_values, pct):
+    """已排序列表的百分位数（最近秩）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, setup=None, min_time=0.5, min_runs=5, max_runs=10000):
+    """重复调用 fn（每次调用前执行 setup，不计时）直到总耗时达到 min_time，返回每次耗时（秒）"""
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() < deadline):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def summarize(samples):
+    """耗时样本（秒） → {runs, ops, p50_ms, p99_ms}"""
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'ops': round(len(samples) / sum(samples), 2) if sum(samples) else None,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 4),
+    }
+
+
+class BenchEnvironment:
+    """
+    基准环境: 免登录 admin、指定的机器与执行器、临时备份/审计/at 历史文件、关闭读取缓存
+    不导入 app.py（其导入时会启动后台检测线程），自行创建 Flask 应用
+    """
+
+    def __init__(self, machines, executors=None):
+        self.machines = machines
+        self.executors = executors or {}
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stack = ExitStack()
+
+    def __enter__(self):
+        from flask import Flask
+        from core import config
+        from core import crontab as core_crontab
+        from core.auth import init_auth
+        from routes import register_blueprints
+
+        for p in [
+            patch.object(config, 'AUTH_ENABLED', False),
+            patch.object(config, 'AUTH_BYPASS_USERNAME', 'admin'),
+            patch.object(config, 'USERS', {'admin': {'password': 'x', 'role': 'admin', 'machines': ['*']}}),
+            patch.object(config, 'MACHINES', self.machines),
+            patch.object(config, 'BACKUP_DIR', os.path.join(self.tmpdir.name, 'backups')),
+            patch.object(config, 'AUDIT_LOG', os.path.join(self.tmpdir.name, 'audit.log')),
+            patch.object(config, 'AT_HISTORY_FILE', os.path.join(self.tmpdir.name, 'at_history.json')),
+            patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 0}),
+            patch.dict(core_crontab._executors, self.executors, clear=True),
+        ]:
+            self.stack.enter_context(p)
+        app = Flask(__name__)
+        app.secret_key = 'bench'
+        init_auth(app)
+        register_blueprints(app)
+        self.app = app
+        self.client = app.test_client()
+        return self
+
+    def __exit__(self, *exc):
+        from core import audit
+        audit.flush()
+        self.stack.close()
+        self.tmpdir.cleanup()
+
+    def post(self, url, body, client=None):
+        """POST JSON，非 200 时抛出 RuntimeError"""
+        resp = (client or self.client).post(url, json=body)
+        if resp.status_code != 200:
+            raise RuntimeError(f'{url} -> {resp.status_code} {resp.get_data(as_text=True)[:200]}')
+        return resp
@@ -0,0 +1,142 @@
+# benchmarks/fleet.py - 模拟机器群压测
+# 功能: 用 N 台 type=simulated 的机器（可配置延迟、抖动、失败率、crontab 大小）驱动变化检测、
+#       读写路由与 at 任务历史，输出检测轮次耗时、路由延迟分布与 at 完成检测耗时，用于部署容量评估
+# 运行: python benchmarks/fleet.py --machines 1000 --latency 0.02 --jitter 0.01 --failure-rate 0.01
+# 说明: 所有状态在进程内，不访问任何真实主机；备份、审计日志与 at 历史写入临时目录
+
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentile, BenchEnvironment
+
+from core import config
+from core.at_jobs import check_at_done_files, load_at_history
+from core.watcher import CrontabWatcher
+
+USER = 'root'
+
+
+def _ms(sorted_values, pct):
+    value = percentile(sorted_values, pct)
+    return round(value * 1000, 1) if value is not None else None
+
+
+def run_watcher(args):
+    """以 interval 秒间隔持续检测所有机器 duration 秒，返回检测器统计（检测线程随进程退出）"""
+    watcher = CrontabWatcher(interval=args.interval, max_workers=args.workers, deadline=args.deadline,
+                             jitter=0.0, max_backoff=args.interval * 4)
+    watcher.start()
+    time.sleep(args.duration)
+    return watcher, watcher.stats()
+
+
+def run_routes(env, machine_ids, args):
+    """clients 个并发客户端在 duration 秒内随机读取/切换任务，返回 {类型: 延迟列表}, 错误数"""
+    latencies = {'read': [], 'toggle': [], 'next_runs': []}
+    errors = {'count': 0}
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+
+    def client_loop(seed):
+        rnd = random.Random(seed)
+        client = env.app.test_client()
+        while time.time() < deadline:
+            machine_id = rnd.choice(machine_ids)
+            kind = rnd.choices(['read', 'toggle', 'next_runs'], weights=[6, 2, 2])[0]
+            start = time.perf_counter()
+            if kind == 'read':
+                resp = client.get(f'/api/tasks/{machine_id}/{USER}')
+            elif kind == 'toggle':
+                resp = client.post('/api/toggle/0', json={'machine_id': machine_id, 'linux_user': USER})
+            else:
+                resp = client.get(f'/api/next_runs/{machine_id}?count=3')
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+                errors['count'] += resp.status_code != 200 or not resp.get_json().get('success', True)
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(client_loop, range(args.clients)))
+    return latencies, errors['count']
+
+
+def run_at_jobs(env, machine_ids, args):
+    """每台机器各创建一个立即执行的 at 任务，再计时一次完成标记检测，返回 (创建延迟, 创建失败数, 检测耗时, 已完成数)"""
+    targets = machine_ids[:args.at_jobs]
+    created, failed = [], 0
+
+    def create(machine_id):
+        client = env.app.test_client()
+        start = time.perf_counter()
+        resp = client.post(f'/api/at_jobs/{machine_id}/{USER}', json={'command': 'echo bench', 'time_spec': 'now'})
+        return time.perf_counter() - start, resp.status_code == 200 and resp.get_json().get('success')
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for elapsed, ok in pool.map(create, targets):
+            created.append(elapsed)
+            failed += not ok
+
+    start = time.perf_counter()
+    check_at_done_files()
+    check_seconds = time.perf_counter() - start
+    executed = sum(1 for r in load_at_history()['history'] if r['status'] == 'executed')
+    return created, failed, check_seconds, executed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='模拟机器群压测')
+    parser.add_argument('--machines', type=int, default=1000, help='模拟机器数')
+    parser.add_argument('--latency', type=float, default=0.02, help='每次远程调用延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.01, help='延迟抖动（秒）')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='每次调用失败概率')
+    parser.add_argument('--payload-lines', type=int, default=50, help='每个 crontab 的行数')
+    parser.add_argument('--change-rate', type=float, default=0.05, help='每次检测时 crontab 被外部修改的概率')
+    parser.add_argument('--workers', type=int, default=config.WATCHER_CONFIG['max_workers'], help='检测线程数')
+    parser.add_argument('--interval', type=float, default=5, help='检测间隔（秒）')
+    parser.add_argument('--deadline', type=float, default=config.WATCHER_CONFIG['deadline'], help='单机检测超时（秒）')
+    parser.add_argument('--duration', type=float, default=20, help='检测与路由阶段各自的持续时间（秒）')
+    parser.add_argument('--clients', type=int, default=8, help='并发路由客户端数')
+    parser.add_argument('--at-jobs', type=int, default=200, help='创建 at 任务的机器数')
+    args = parser.parse_args(argv)
+
+    machines = config.simulated_fleet(
+        args.machines, latency=args.latency, jitter=args.jitter, failure_rate=args.failure_rate,
+        payload_lines=args.payload_lines, change_rate=args.change_rate, linux_users=[USER],
+    )
+    machine_ids = list(machines)
+    print(f'{args.machines} simulated machines, latency {args.latency * 1000:.0f}±{args.jitter * 1000:.0f} ms, '
+          f'failure rate {args.failure_rate:.1%}, {args.payload_lines} lines/crontab')
+
+    with BenchEnvironment(machines) as env:
+        env.app.logger.disabled = True  # 模拟失败导致的 500 只计数，不打印堆栈
+        _, stats = run_watcher(args)
+        print(f'\n[watcher] {args.workers} workers, interval {args.interval}s, {args.duration}s')
+        print(f'  checks {stats["checks"]}  failures {stats["failures"]}  timeouts {stats["timeouts"]}  '
+              f'changes {stats["changes"]}')
+        print(f'  check p50 {stats["check_seconds"]["p50"]}s  p95 {stats["check_seconds"]["p95"]}s  '
+              f'max {stats["check_seconds"]["max"]}s')
+        print(f'  cycle last {stats["cycle_seconds"]["last"]}s  max {stats["cycle_seconds"]["max"]}s  '
+              f'max staleness {stats["max_staleness"]}s')
+
+        # 检测线程继续运行，路由与 at 阶段在检测负载下进行
+        latencies, errors = run_routes(env, machine_ids, args)
+        total = sum(len(v) for v in latencies.values())
+        print(f'\n[routes] {args.clients} clients, {args.duration}s, {total / args.duration:.1f} req/s, {errors} errors')
+        for kind, values in latencies.items():
+            values.sort()
+            print(f'  {kind:<10} n={len(values):<6} p50 {_ms(values, 50)} ms  p99 {_ms(values, 99)} ms')
+
+        created, failed, check_seconds, executed = run_at_jobs(env, machine_ids, args)
+        created.sort()
+        print(f'\n[at jobs] {len(created)} created ({failed} failed), '
+              f'create p50 {_ms(created, 50)} ms  p99 {_ms(created, 99)} ms')
+        print(f'  check_at_done_files {check_seconds:.2f}s, {executed} marked executed')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
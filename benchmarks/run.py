@@ -0,0 +1,156 @@
+# benchmarks/run.py - 核心函数与修改路由基准
+# 功能: 在 10-50k 行合成 crontab 上测量解析、验证、备份与每个修改路由，输出 ops/s、p50、p99，
+#       与保存的基线（默认为仓库中的 benchmarks/baseline.json）比较，p50 变慢超过阈值时返回非零退出码
+# 运行: python benchmarks/run.py [--sizes 10,1000,10000,50000] [--only 关键字] [--time 秒]
+#       [--save baseline.json] [--baseline baseline.json | --no-baseline] [--threshold 0.25]
+# 说明: 路由通过 Flask test client 调用，执行器为内存实现，备份与审计日志写入临时目录
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+from common import make_crontab, measure, summarize, BenchEnvironment
+
+from core import crontab as core_crontab
+from tests.helpers import MemoryExecutor
+
+MACHINE = 'bench'
+USER = 'root'
+DEFAULT_SIZES = [10, 1000, 10000, 50000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def route_cases(content):
+    """每个修改路由的 (名称, URL, 请求体)，任务/组 ID 取文档中部"""
+    groups = core_crontab.parse_crontab_content(content, cache=False)
+    tasks = core_crontab.flatten_tasks(groups)
+    task = tasks[len(tasks) // 2]
+    other = tasks[-1] if tasks[-1]['id'] != task['id'] else tasks[0]
+    group = next(g for g in groups if any(t['id'] == task['id'] for t in g['tasks']))
+    last_group = groups[-1]
+    return [
+        ('toggle', f'/api/toggle/{task["id"]}', {}),
+        ('add', '/api/add', {'schedule': '0 5 * * *', 'command': '/bench/add.sh'}),
+        ('update', f'/api/update/{task["id"]}', {'schedule': '0 6 * * *', 'command': '/bench/update.sh'}),
+        ('update_task_name', f'/api/update_task_name/{task["id"]}', {'name': 'bench'}),
+        ('delete', f'/api/delete/{task["id"]}', {}),
+        ('toggle_group', f'/api/toggle_group/{group["id"]}', {'enable': False}),
+        ('update_group_title', f'/api/update_group_title/{group["id"]}', {'title': 'bench'}),
+        ('add_to_group', f'/api/add_to_group/{group["id"]}',
+         {'schedule': '0 7 * * *', 'command': '/bench/group.sh', 'name': 'bench'}),
+        ('create_group', '/api/create_group', {'title': 'bench'}),
+        ('delete_group', f'/api/delete_group/{group["id"]}', {}),
+        ('reorder_groups', '/api/reorder_groups', {'from_id': group['id'], 'to_id': last_group['id'],
+                                                   'insert_before': False}),
+        ('move_task_to_end', '/api/move_task_to_end', {'task_id': task['id'], 'from_group_id': group['id'],
+                                                       'to_group_id': last_group['id']}),
+        ('reorder_tasks', '/api/reorder_tasks', {'from_task_id': task['id'], 'from_group_id': group['id'],
+                                                 'to_task_id': other['id'], 'to_group_id': 0}),
+        ('save', '/api/save', {'content': content + '0 8 * * * /bench/save.sh\n'}),
+        ('batch', '/api/batch', {'operations': [
+            {'op': 'toggle', 'task_id': task['id']},
+            {'op': 'rename', 'group_id': group['id'], 'title': 'bench'},
+            {'op': 'update', 'task_id': other['id'], 'schedule': '0 9 * * *', 'command': '/bench/batch.sh'},
+        ]}),
+    ]
+
+
+def run(sizes, only=None, min_time=0.5):
+    """运行所有基准，返回 {名称[行数]: 统计}"""
+    results = {}
+
+    def record(name, lines, samples):
+        key = f'{name}[{lines}]'
+        results[key] = summarize(samples)
+        r = results[key]
+        print(f'{key:<36} {r["ops"]:>12,.1f} ops/s  p50 {r["p50_ms"]:>10.3f} ms  p99 {r["p99_ms"]:>10.3f} ms',
+              flush=True)
+
+    executor = MemoryExecutor()
+    with BenchEnvironment({MACHINE: {'type': 'local', 'linux_users': [USER]}}, {MACHINE: executor}) as env:
+        for lines in sizes:
+            content = make_crontab(lines)
+            budget = min_time if lines < 10000 else max(min_time, 1.0)
+            cases = [
+                ('parse_crontab', lambda: core_crontab.parse_crontab(MACHINE, USER), None),
+                ('parse_crontab_content', lambda: core_crontab.parse_crontab_content(content, cache=False), None),
+                ('validate_crontab_content', lambda: core_crontab.validate_crontab_content(content), None),
+            ]
+            variants = itertools.cycle([content, content + '# bench\n'])
+            cases.append(('backup_crontab', lambda: core_crontab.backup_crontab(
+                'bench', MACHINE, USER, content=next(variants)), None))
+
+            def reset():
+                executor.crontabs[USER] = content
+
+            for name, url, body in route_cases(content):
+                cases.append((f'route:{name}', lambda url=url, body=body: env.post(url, {'machine_id': MACHINE, 'linux_user': USER, **body}),
+                              reset))
+
+            reset()
+            for name, fn, setup in cases:
+                if only and not any(word in name for word in only):
+                    continue
+                record(name, lines, measure(fn, setup, budget))
+    return results
+
+
+def compare(results, baseline, threshold):
+    """与基线比较 p50，返回变慢超过 threshold（比例）的条目列表"""
+    regressions = []
+    print(f'\n{"benchmark":<36} {"baseline p50":>14} {"current p50":>14} {"change":>9}')
+    for key, current in results.items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        change = current['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f'{key:<36} {base["p50_ms"]:>11.3f} ms {current["p50_ms"]:>11.3f} ms {change:>+8.1%}{flag}')
+        if change > threshold:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='crontab 核心函数与修改路由基准')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='crontab 行数，逗号分隔')
+    parser.add_argument('--only', default='', help='只运行名称包含这些关键字的基准，逗号分隔')
+    parser.add_argument('--time', type=float, default=0.5, help='每项最少运行秒数')
+    parser.add_argument('--save', help='将结果保存为基线 JSON')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='与基线 JSON 比较（默认 benchmarks/baseline.json）')
+    parser.add_argument('--no-baseline', action='store_true', help='不与基线比较')
+    parser.add_argument('--threshold', type=float, default=0.25, help='p50 变慢超过该比例视为回归')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    only = [w for w in args.only.split(',') if w]
+    results = run(sizes, only, args.time)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                },
+                'results': results,
+            }, f, indent=2, ensure_ascii=False)
+        print(f'\nbaseline saved: {args.save}')
+
+    if args.baseline and not args.no_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) over {args.threshold:.0%}: {", ".join(regressions)}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,325 @@
+# benchmarks/ssh_server.py - 本地 SSH 替身服务器（paramiko server 模式）
+# 功能: 在回环地址上提供真实的 SSH 协议（公钥认证、每个命令一个 exec channel），命令交给 /bin/sh 执行，
+#       PATH 中的 crontab / at / atq / atrm 替身脚本操作临时目录；可选人为 RTT（延迟代理，每个方向 rtt/2）
+# 用法: with SSHStandIn(rtt=0.02) as server: executor = get_executor(server.machine_config())
+#       python benchmarks/ssh_server.py --port 2222 --rtt 0.02   # 前台运行并打印机器配置
+# 说明: 仅用于基准与测试，任何持有生成私钥的客户端都能以任意用户名登录并执行任意命令
+
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import paramiko
+
+# 客户端断开时 paramiko 服务端会记录 Socket exception，基准中无需输出
+logging.getLogger('paramiko').addHandler(logging.NullHandler())
+
+# 替身脚本: 数据存放在 $STANDIN_ROOT，默认用户为 $STANDIN_USER（SSH 登录名）
+SHIMS = {
+    'crontab': r'''#!/bin/sh
+# crontab 替身: crontab [-u 用户] -l | -
+user=${STANDIN_USER:-root}
+if [ "$1" = "-u" ]; then user=$2; shift 2; fi
+file="$STANDIN_ROOT/crontabs/$user"
+case "$1" in
+  -l) [ -f "$file" ] || { echo "no crontab for $user" >&2; exit 1; }; exec cat "$file" ;;
+  -) cat > "$file.tmp.$$" && mv "$file.tmp.$$" "$file" ;;
+  *) echo "usage: crontab [-u user] -l | -" >&2; exit 1 ;;
+esac
+''',
+    'at': r'''#!/bin/sh
+# at 替身: at -c 任务号 | at 时间（命令从 stdin 读取，时间由 date -d 解析）
+dir="$STANDIN_ROOT/at"
+if [ "$1" = "-c" ]; then
+  [ -f "$dir/$2.job" ] || { echo "Cannot find jobid $2" >&2; exit 1; }
+  exec tail -n +2 "$dir/$2.job"
+fi
+when=$(date -d "$*" '+%a %b %e %H:%M:%S %Y' 2>/dev/null) || { echo "Garbled time" >&2; exit 1; }
+id=$(ls "$dir" | grep -c '\.id$'); id=$((id + 1))
+while ! mkdir "$dir/$id.id" 2>/dev/null; do id=$((id + 1)); done
+{ echo "$when"; printf '#!/bin/sh\n# atrun uid=0 gid=0\numask 22\ncd /tmp || {\n\t exit 1\n}\n'; cat; } > "$dir/$id.job"
+echo "warning: commands will be executed using /bin/sh" >&2
+echo "job $id at $when" >&2
+''',
+    'atq': r'''#!/bin/sh
+# atq 替身
+for f in "$STANDIN_ROOT"/at/*.job; do
+  [ -f "$f" ] || continue
+  printf '%s\t%s a %s\n' "$(basename "$f" .job)" "$(head -n 1 "$f")" "${STANDIN_USER:-root}"
+done
+''',
+    'atrm': r'''#!/bin/sh
+# atrm 替身
+for id; do
+  rm "$STANDIN_ROOT/at/$id.job" 2>/dev/null || { echo "Cannot find jobid $id" >&2; exit 1; }
+done
+''',
+}
+
+
+class _ServerInterface(paramiko.ServerInterface):
+    """只接受指定公钥；每个连接最多 max_sessions 个并发 session（同 OpenSSH MaxSessions）"""
+
+    def __init__(self, server):
+        self.server = server
+        self.username = None
+        self.sessions = 0
+        self.lock = threading.Lock()
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        if key.get_base64() == self.server.client_key.get_base64():
+            self.username = username
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind != 'session':
+            return paramiko.OPEN_FAILED_UNKNOWN_CHANNEL_TYPE
+        with self.lock:
+            if self.sessions >= self.server.max_sessions:
+                return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+            self.sessions += 1
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._exec, args=(channel, command.decode('utf-8')), daemon=True).start()
+        return True
+
+    def _exec(self, channel, command):
+        """在 /bin/sh 中执行命令，stdin/stdout/stderr 与 channel 双向转发，结束后返回退出码"""
+        try:
+            proc = subprocess.Popen(
+                ['/bin/sh', '-c', command], cwd=self.server.root, env=self.server.command_env(self.username),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+
+            def feed_stdin():
+                try:
+                    while True:
+                        data = channel.recv(65536)
+                        if not data:
+                            break
+                        proc.stdin.write(data)
+                except (OSError, EOFError):
+                    pass
+                finally:
+                    try:
+                        proc.stdin.close()
+                    except OSError:
+                        pass
+
+            def copy(stream, send):
+                for chunk in iter(lambda: stream.read1(65536), b''):
+                    send(chunk)
+
+            pumps = [
+                threading.Thread(target=feed_stdin, daemon=True),
+                threading.Thread(target=copy, args=(proc.stdout, channel.sendall), daemon=True),
+                threading.Thread(target=copy, args=(proc.stderr, channel.sendall_stderr), daemon=True),
+            ]
+            for t in pumps:
+                t.start()
+            pumps[1].join()
+            pumps[2].join()
+            channel.send_exit_status(proc.wait())
+        except Exception:
+            channel.send_exit_status(255)
+        finally:
+            channel.close()
+            with self.lock:
+                self.sessions -= 1
+
+
+def _delayed_pump(src, dst, delay):
+    """src → dst 转发，每个数据块延迟 delay 秒后发出（不串行累加延迟，吞吐不受影响）"""
+    pending = queue.Queue()
+
+    def reader():
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                pending.put((time.monotonic() + delay, data))
+        except OSError:
+            pass
+        pending.put((0, None))
+
+    threading.Thread(target=reader, daemon=True).start()
+    try:
+        while True:
+            due, data = pending.get()
+            if data is None:
+                dst.shutdown(socket.SHUT_WR)
+                break
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            dst.sendall(data)
+    except OSError:
+        pass
+
+
+class SSHStandIn:
+    """
+    本地 SSH 替身服务器
+
+    rtt: 人为往返延迟（秒），> 0 时客户端连接经过延迟代理
+    crontabs: 初始 crontab {用户: 内容}
+    max_sessions: 每个连接的最大并发 session 数
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rtt=0.0, crontabs=None, max_sessions=10):
+        self.host = host
+        self.port = port
+        self.rtt = max(0.0, float(rtt))
+        self.max_sessions = max_sessions
+        self._tmp = tempfile.TemporaryDirectory(prefix='ssh-standin-')
+        self.root = self._tmp.name
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.client_key = paramiko.RSAKey.generate(2048)
+        self.client_key_file = os.path.join(self.root, 'client_key')
+        self.client_key.write_private_key_file(self.client_key_file)
+        self.connections = 0
+        self._sockets = []
+        self._transports = []
+        self._stopped = threading.Event()
+
+        self._bin = os.path.join(self.root, 'bin')
+        for sub in ('bin', 'crontabs', 'at'):
+            os.makedirs(os.path.join(self.root, sub))
+        for name, script in SHIMS.items():
+            path = os.path.join(self._bin, name)
+            with open(path, 'w') as f:
+                f.write(script)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        for user, content in (crontabs or {}).items():
+            self.set_crontab(user, content)
+
+    def command_env(self, username):
+        return {
+            **os.environ,
+            'PATH': f'{self._bin}:{os.environ.get("PATH", "/usr/bin:/bin")}',
+            'STANDIN_ROOT': self.root,
+            'STANDIN_USER': username or 'root',
+        }
+
+    def set_crontab(self, user, content):
+        with open(os.path.join(self.root, 'crontabs', user), 'w') as f:
+            f.write(content)
+
+    def get_crontab(self, user):
+        path = os.path.join(self.root, 'crontabs', user)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def _listen(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, port))
+        sock.listen(128)
+        self._sockets.append(sock)
+        return sock
+
+    def _accept_loop(self, sock, handler):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = sock.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+
+    def _serve_ssh(self, conn):
+        self.connections += 1
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.host_key)
+        self._transports.append(transport)
+        try:
+            transport.start_server(server=_ServerInterface(self))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+
+    def _serve_proxy(self, conn):
+        try:
+            backend = socket.create_connection((self.host, self._ssh_port))
+        except OSError:
+            conn.close()
+            return
+        backend.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=_delayed_pump, args=(conn, backend, self.rtt / 2), daemon=True).start()
+        _delayed_pump(backend, conn, self.rtt / 2)
+
+    def start(self):
+        """开始监听，返回客户端应连接的端口"""
+        ssh_sock = self._listen(0 if self.rtt else self.port)
+        self._ssh_port = ssh_sock.getsockname()[1]
+        threading.Thread(target=self._accept_loop, args=(ssh_sock, self._serve_ssh), daemon=True).start()
+        if self.rtt:
+            proxy_sock = self._listen(self.port)
+            self.port = proxy_sock.getsockname()[1]
+            threading.Thread(target=self._accept_loop, args=(proxy_sock, self._serve_proxy), daemon=True).start()
+        else:
+            self.port = self._ssh_port
+        return self.port
+
+    def stop(self):
+        self._stopped.set()
+        for sock in self._sockets:
+            sock.close()
+        for transport in self._transports:
+            transport.close()
+        self._tmp.cleanup()
+
+    def machine_config(self, **overrides):
+        """对应的 type=ssh 机器配置"""
+        return {
+            'type': 'ssh', 'host': self.host, 'port': self.port,
+            'ssh_user': 'root', 'ssh_key': self.client_key_file, **overrides,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地 SSH 替身服务器')
+    parser.add_argument('--port', type=int, default=2222)
+    parser.add_argument('--rtt', type=float, default=0.0, help='人为往返延迟（秒）')
+    parser.add_argument('--max-sessions', type=int, default=10)
+    args = parser.parse_args(argv)
+    if not shutil.which('sh'):
+        print('/bin/sh is required', file=sys.stderr)
+        return 1
+    with SSHStandIn(port=args.port, rtt=args.rtt, max_sessions=args.max_sessions) as server:
+        print(json.dumps(server.machine_config(), indent=4))
+        print(f'data directory: {server.root}  (Ctrl-C to stop)', flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+# core/analysis.py - 全局调度分析
+# 功能: 并发收集所有机器的启用任务，按分钟展开执行次数，生成机器 × 时间段热力图；
+#       检测同一分钟执行任务过多的冲突，给出保持频率的分钟平移建议
+# 说明: 表达式按编译后的位图拆为 执行日集合 × 一天内执行分钟（按 (小时位图, 分钟位图) 缓存），
+#       执行日集合相同的表达式先累加为一天的分钟计数再按天展开；错峰候选只是分钟平移，
+#       各偏移的负载由执行小时内的计数切片一次求出，不逐个展开候选表达式
+
+import re
+from collections import Counter
+from operator import add
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import chain
+
+from core import config
+from core.crontab import get_machine_crontabs, parse_crontab_content, content_hash
+from core.schedule import compile_schedule, day_matches
+
+MINUTES_PER_DAY = 1440
+
+
+def _machine_linux_users(machine_id):
+    return [
+        u or config.DEFAULT_LINUX_USER
+        for u in config.MACHINES[machine_id].get('linux_users', [config.DEFAULT_LINUX_USER])
+    ]
+
+
+def _machine_tasks(machine_id):
+    tasks = []
+    for linux_user, content in get_machine_crontabs(machine_id, _machine_linux_users(machine_id)).items():
+        version = content_hash(content)
+        for group in parse_crontab_content(content):
+            for task in group['tasks']:
+                if task['enabled']:
+                    tasks.append({**task, 'linux_user': linux_user, 'group_id': group['id'], 'version': version})
+    return tasks
+
+
+def collect_fleet_tasks(machine_ids):
+    """
+    并发读取多台机器所有 Linux 用户的 crontab，返回 ({机器: [启用任务]}, {机器: 错误信息})
+    任务附带 linux_user、group_id 与所在 crontab 的 version；并发数沿用 watcher.max_workers
+    """
+    machine_ids = [m for m in machine_ids if m in config.MACHINES]
+    tasks, errors = {}, {}
+    if not machine_ids:
+        return tasks, errors
+    workers = min(len(machine_ids), max(1, int(config.WATCHER_CONFIG.get('max_workers', 16))))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {m: pool.submit(_machine_tasks, m) for m in machine_ids}
+        for machine_id, future in futures.items():
+            try:
+                tasks[machine_id] = future.result()
+            except Exception as e:
+                errors[machine_id] = str(e)
+    return tasks, errors
+
+
+@lru_cache(maxsize=4096)
+def _day_minutes(hours: int, minutes: int):
+    """小时位图 × 分钟位图 → 一天内的执行分钟（0-1439）"""
+    minute_list = [m for m in range(60) if minutes >> m & 1]
+    return tuple(h * 60 + m for h in range(24) if hours >> h & 1 for m in minute_list)
+
+
+def _window_dates(start, days):
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    return [start + timedelta(days=d) for d in range(days)]
+
+
+def fire_pattern(schedule, dates):
+    """表达式 → (dates 中执行日的序号元组, 一天内的执行分钟元组)，无效表达式与 @reboot 返回 None"""
+    try:
+        compiled = compile_schedule(schedule)
+    except ValueError:
+        return None
+    if compiled is None:
+        return None
+    fire_days = tuple(d for d, date in enumerate(dates)
+                      if compiled.months >> date.month & 1 and day_matches(compiled, date))
+    return fire_days, _day_minutes(compiled.hours, compiled.minutes)
+
+
+def fire_indices(schedule, dates):
+    """表达式在 dates 各天内的执行分钟序号（第 d 天第 m 分钟 = d × 1440 + m），无效表达式与 @reboot 为空"""
+    pattern = fire_pattern(schedule, dates)
+    if pattern is None:
+        return []
+    fire_days, offsets = pattern
+    return [d * MINUTES_PER_DAY + offset for d in fire_days for offset in offsets]
+
+
+def fire_counts(schedules, start: datetime, days: int = 1):
+    """
+    统计 start 当天 0 点起 days 天内每分钟的执行次数
+    schedules: {表达式: 任务数}（Counter），无效表达式与 @reboot 忽略
+    返回长度 days × 1440 的列表
+    """
+    dates = _window_dates(start, days)
+    # {执行日集合: 一天内各分钟的执行次数}
+    profiles = {}
+    for schedule, weight in schedules.items():
+        pattern = fire_pattern(schedule, dates)
+        if not pattern or not pattern[0]:
+            continue
+        profile = profiles.get(pattern[0])
+        if profile is None:
+            profile = profiles[pattern[0]] = [0] * MINUTES_PER_DAY
+        for offset in pattern[1]:
+            profile[offset] += weight
+    counts = []
+    for d in range(days):
+        day = [0] * MINUTES_PER_DAY
+        for fire_days, profile in profiles.items():
+            if d in fire_days:
+                day = list(map(add, day, profile))
+        counts.extend(day)
+    return counts
+
+
+def _slot_sums(counts, slot):
+    return [sum(counts[i:i + slot]) for i in range(0, len(counts), slot)]
+
+
+def _minute_label(start, index):
+    return (start + timedelta(minutes=index)).strftime('%Y-%m-%d %H:%M')
+
+
+def build_heatmap(tasks_by_machine, start: datetime, days: int = 1, slot: int = 60, top: int = 10):
+    """
+    机器 × 时间段执行次数热力图
+    返回 {slots: [时间段起点], machines: {机器: {...}}, fleet: {...}}，
+    每台机器与全局给出每个时间段的执行次数与最忙的一分钟
+    """
+    start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    fleet = [0] * (days * MINUTES_PER_DAY)
+    machines = {}
+    for machine_id, tasks in tasks_by_machine.items():
+        counts = fire_counts(Counter(t['schedule'] for t in tasks), start, days)
+        fleet = list(map(add, fleet, counts))
+        peak = max(range(len(counts)), key=counts.__getitem__)
+        machines[machine_id] = {
+            'tasks': len(tasks),
+            'fires': sum(counts),
+            'slots': _slot_sums(counts, slot),
+            'peak': {'time': _minute_label(start, peak), 'count': counts[peak]},
+        }
+
+    busiest = sorted((i for i, c in enumerate(fleet) if c), key=lambda i: (-fleet[i], i))[:top]
+    return {
+        'slots': [_minute_label(start, i) for i in range(0, len(fleet), slot)],
+        'machines': machines,
+        'fleet': {
+            'fires': sum(fleet),
+            'slots': _slot_sums(fleet, slot),
+            'peak_minutes': [{'time': _minute_label(start, i), 'count': fleet[i]} for i in busiest],
+        },
+    }
+
+
+# ===== 冲突检测与错峰建议 =====
+
+
+def shift_candidates(schedule):
+    """
+    保持执行频率的分钟平移候选，返回 (当前偏移, [(偏移, 表达式)])
+    支持单个分钟值（0-59 任选）与整除 60 的步长（*/15 → 0-14 起始偏移）；其他写法返回 (None, [])
+    """
+    parts = schedule.split()
+    if len(parts) != 5:
+        return None, []
+    minute, rest = parts[0], ' '.join(parts[1:])
+    if minute.isdigit() and int(minute) < 60:
+        return int(minute), [(m, f'{m} {rest}') for m in range(60)]
+    match = re.fullmatch(r'(\*|0-59|(\d+)-59)/(\d+)', minute)
+    if match and 0 < int(match.group(3)) <= 60 and 60 % int(match.group(3)) == 0:
+        step = int(match.group(3))
+        current = int(match.group(2) or 0)
+        if current >= step:
+            return None, []
+        return current, [(a, f'*/{step} {rest}' if a == 0 else f'{a}-59/{step} {rest}') for a in range(step)]
+    return None, []
+
+
+def _task_ref(machine_id, task):
+    return {
+        'machine_id': machine_id, 'linux_user': task['linux_user'], 'task_id': task['id'],
+        'name': task.get('name', ''), 'schedule': task['schedule'], 'command': task['command'],
+    }
+
+
+def find_collisions(tasks_by_machine, start: datetime, days: int = 1, threshold: int = 10,
+                    scope: str = 'host', limit: int = 100):
+    """
+    查找执行任务数超过 threshold 的分钟
+    scope='host' 按机器统计，'fleet' 按全局统计；按任务数降序返回至多 limit 条
+    每条为 {machine_id（全局为 None）, time, count, tasks: [任务引用]}
+    """
+    dates = _window_dates(start, days)
+    indices = {}
+    for tasks in tasks_by_machine.values():
+        for task in tasks:
+            if task['schedule'] not in indices:
+                indices[task['schedule']] = set(fire_indices(task['schedule'], dates))
+
+    if scope == 'fleet':
+        scopes = {None: [(m, t) for m, tasks in tasks_by_machine.items() for t in tasks]}
+    else:
+        scopes = {m: [(m, t) for t in tasks] for m, tasks in tasks_by_machine.items()}
+
+    hot = []
+    for machine_id, members in scopes.items():
+        counts = Counter()
+        for _, task in members:
+            counts.update(indices[task['schedule']])
+        hot.extend((count, index, machine_id) for index, count in counts.items() if count > threshold)
+    hot.sort(key=lambda h: (-h[0], h[1], h[2] or ''))
+
+    return [{
+        'machine_id': machine_id,
+        'time': _minute_label(dates[0], index),
+        'count': count,
+        'tasks': [_task_ref(m, t) for m, t in scopes[machine_id] if index in indices[t['schedule']]],
+    } for count, index, machine_id in hot[:limit]]
+
+
+def _hour_spans(indices):
+    """执行分钟序号 → 所在小时合并成的连续区间 [(起, 止)]（整小时边界）"""
+    spans = []
+    for base in sorted({i - i % 60 for i in indices}):
+        if spans and spans[-1][1] == base:
+            spans[-1][1] = base + 60
+        else:
+            spans.append([base, base + 60])
+    return spans
+
+
+def _shift_loads(counts, spans, step):
+    """
+    分钟平移候选的负载: 偏移 a（0 ≤ a < step）在 spans（_hour_spans）各小时第 a, a + step, ... 分钟上
+    counts 的 (最大值列表, 总和列表)；单个分钟值的候选 step 为 60
+    """
+    # 各执行小时首尾相接，偏移 a 的所有执行分钟即步长为 step 的切片
+    cells = list(chain.from_iterable(counts[lo:hi] for lo, hi in spans))
+    if not cells:
+        return [0] * step, [0] * step
+    columns = [cells[a::step] for a in range(step)]
+    return list(map(max, columns)), list(map(sum, columns))
+
+
+def suggest_spread(tasks_by_machine, start: datetime, days: int = 1, threshold: int = 10, scope: str = 'host'):
+    """
+    为冲突分钟内的任务贪心选择负载最低的平移分钟（保持执行频率），每次移动后更新负载
+    负载 = 任务各执行分钟上其他任务数的最大值（scope 内），其次参考另一范围与总和，距原分钟越近越优先
+    只在能降低峰值时给出建议；返回 (建议列表, 按 (机器, 用户) 分组的 /api/batch 请求体列表)
+    """
+    dates = _window_dates(start, days)
+    indices, spans = {}, {}
+
+    def indices_of(schedule):
+        if schedule not in indices:
+            indices[schedule] = fire_indices(schedule, dates)
+        return indices[schedule]
+
+    def spans_of(schedule):
+        if schedule not in spans:
+            spans[schedule] = _hour_spans(indices_of(schedule))
+        return spans[schedule]
+
+    host = {m: fire_counts(Counter(t['schedule'] for t in tasks), start, days) for m, tasks in tasks_by_machine.items()}
+    fleet = [0] * (days * MINUTES_PER_DAY)
+    for counts in host.values():
+        fleet = list(map(add, fleet, counts))
+
+    def move(machine_id, schedule, delta):
+        for index in indices_of(schedule):
+            host[machine_id][index] += delta
+            fleet[index] += delta
+
+    suggestions = []
+    for machine_id in sorted(tasks_by_machine):
+        primary, secondary = (fleet, host[machine_id]) if scope == 'fleet' else (host[machine_id], fleet)
+        for task in sorted(tasks_by_machine[machine_id], key=lambda t: (t['linux_user'], t['id'])):
+            schedule = task['schedule']
+            current, candidates = shift_candidates(schedule)
+            fires = indices_of(schedule)
+            if not candidates or not fires:
+                continue
+            # 候选只平移分钟: 各偏移的负载由执行小时内的计数一次求出
+            step = len(candidates)
+            peaks, totals = _shift_loads(primary, spans_of(schedule), step)
+            peak = peaks[current]
+            if peak <= threshold:
+                continue
+            other_peaks, _ = _shift_loads(secondary, spans_of(schedule), step)
+            # 不计任务自身: 当前偏移的每个执行分钟各减 1
+            peaks[current] -= 1
+            other_peaks[current] -= 1
+            totals[current] -= len(fires)
+            offset, best = min(candidates, key=lambda c: (peaks[c[0]], other_peaks[c[0]], totals[c[0]], abs(c[0] - current)))
+            best_peak = peaks[offset] + 1
+            if best_peak < peak:
+                move(machine_id, schedule, -1)
+                move(machine_id, best, 1)
+                suggestions.append({
+                    **_task_ref(machine_id, task), 'version': task['version'],
+                    'suggested': best, 'peak_before': peak, 'peak_after': best_peak,
+                })
+
+    batches = {}
+    for item in suggestions:
+        key = (item['machine_id'], item['linux_user'])
+        if key not in batches:
+            batches[key] = {'machine_id': key[0], 'linux_user': key[1], 'version': item['version'], 'operations': []}
+        batches[key]['operations'].append({
+            'op': 'update', 'task_id': item['task_id'], 'schedule': item['suggested'], 'command': item['command'],
+        })
+    return suggestions, list(batches.values())
@@ -0,0 +1,669 @@
+# core/audit.py - 审计日志写入、索引与查询
+# 功能: log_action 追加 JSON 行；从 audit.log 末尾按块向前读取，从新到旧产出记录，页满即停止；
+#       cursor 为 "<段序号>:<上一页最后一条记录的字节偏移>"（当前文件用轮转后的段序号，跨轮转翻页不重复不遗漏）
+# 写入: 记录在调用时生成（时间、用户），交给后台线程批量写入：每批一次 O_APPEND write，多进程之间按行原子；
+#       进程退出时（atexit）写完队列中的记录，查询前先写完本进程的记录
+# 导出: export_lines 按时间从旧到新流式产出匹配的原始 JSON 行（各段，然后当前文件），内存占用恒定
+# 索引: audit.log.idx/ 下每个 机器/用户/操作 一个 posting 文件（升序的 8 字节记录偏移），
+#       hours 文件记录每个小时首次出现的偏移；索引在追加后与查询前增量补齐（flock 串行化，多进程安全）
+# 轮转: audit.log 超过 audit.rotate_bytes 或首条记录早于 audit.rotate_days 天时压缩为 audit.log.<序号>.gz，
+#       段首行为头部 {segment, start, end, records, lines}；查询跳过时间范围之外的段，匹配的段流式解压
+# 用法: from core import audit; logs, cursor = audit.query_logs(machine='local', user='admin', limit=100)
+
+import os
+import re
+import gzip
+import json
+import queue
+import atexit
+import fcntl
+import shutil
+import struct
+import threading
+from array import array
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from flask import has_request_context
+from flask_login import current_user
+
+from core import config
+
+BLOCK_SIZE = 64 * 1024
+_HOUR = struct.Struct('<QQ')  # (YYYYmmddHH, 偏移)
+
+
+def _current_username():
+    """当前操作用户（后台线程无请求上下文时记为 system）"""
+    if not has_request_context():
+        return "system"
+    return current_user.id if current_user.is_authenticated else "anonymous"
+
+
+def log_action(action, details=None):
+    """记录操作日志（默认交给后台线程批量写入，请求路径中不做文件 I/O）"""
+    log_entry = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "user": _current_username(),
+        "action": action,
+        "details": details
+    }
+    data = (json.dumps(log_entry, ensure_ascii=False) + "\n").encode("utf-8")
+    if config.AUDIT_CONFIG['async_write']:
+        _ensure_writer().put(data)
+    else:
+        _write_records(data)
+
+
+# ===== 批量写入 =====
+
+_queue = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def _write_records(data):
+    """一次 O_APPEND 写入若干完整行（持共享锁，避免写入正在轮转的文件），随后补齐索引"""
+    with _locked(fcntl.LOCK_SH):
+        fd = os.open(config.AUDIT_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+    try:
+        update_index()
+    except OSError:
+        pass
+
+
+def _writer_loop(records):
+    while True:
+        batch = [records.get()]
+        while len(batch) < config.AUDIT_CONFIG['batch_size']:
+            try:
+                batch.append(records.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write_records(b''.join(batch))
+        except OSError as e:
+            print(f"[audit] Failed to write {len(batch)} records: {e}")
+        finally:
+            for _ in batch:
+                records.task_done()
+
+
+def _ensure_writer():
+    """当前进程的写入队列（首次使用或 fork 之后启动后台线程）"""
+    global _queue, _writer_pid
+    if _writer_pid == os.getpid():
+        return _queue
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            _queue = queue.Queue()
+            threading.Thread(target=_writer_loop, args=(_queue,), daemon=True, name='audit-writer').start()
+            if _writer_pid is None:
+                atexit.register(flush)
+            _writer_pid = os.getpid()
+    return _queue
+
+
+def flush():
+    """等待本进程队列中的记录全部写入"""
+    if _writer_pid == os.getpid():
+        _queue.join()
+
+
+# ===== 读取 =====
+
+
+def _reverse_lines(f, end, block_size=BLOCK_SIZE):
+    """从 end 字节处向前按块读取，逐行产出 (行起始偏移, 行内容)，从新到旧，跳过空行"""
+    pos = end
+    head = b''
+    while pos > 0:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        lines = (f.read(size) + head).split(b'\n')
+        # 块内第一段可能不完整，与前一块拼接后再处理
+        head = lines[0]
+        start = pos + len(head) + 1 + sum(len(line) + 1 for line in lines[1:])
+        for line in reversed(lines[1:]):
+            start -= len(line) + 1
+            if line:
+                yield start, line
+    if head:
+        yield 0, head
+
+
+def record_machine(log):
+    """记录所属机器（旧记录没有 machine 时为 local）"""
+    details = log.get('details')
+    return details.get('machine', 'local') if isinstance(details, dict) else 'local'
+
+
+def _record_keys(log):
+    """记录的索引键 {字段: 值}"""
+    return {'machine': record_machine(log), 'user': log.get('user'), 'action': log.get('action')}
+
+
+def iter_logs(before=None, path=None):
+    """从新到旧产出 (字节偏移, 记录)；before 为偏移时只读取该偏移之前的记录，无法解析的行跳过"""
+    path = path or config.AUDIT_LOG
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        end = os.fstat(f.fileno()).st_size if before is None else before
+        for offset, line in _reverse_lines(f, end):
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                continue
+
+
+def parse_cursor(cursor):
+    """
+    cursor 参数 → (段序号, 字节偏移)，None 表示从最新记录开始，非法值抛出 ValueError
+    cursor 为 "<段序号>:<偏移>"，当前文件使用轮转后将得到的段序号（轮转后同一 cursor 指向段内同一位置）；
+    旧格式 "<偏移>"（段序号为 None）视为当前文件
+    """
+    if cursor in (None, ''):
+        return None
+    segment, _, position = cursor.rpartition(':')
+    segment = int(segment) if segment else None
+    position = int(position)
+    if position < 0 or (segment is not None and segment < 1):
+        raise ValueError('Invalid cursor')
+    return segment, position
+
+
+def parse_time(value, end=False):
+    """时间参数（YYYY-MM-DD[ HH:MM[:SS]]）→ 与记录 timestamp 可直接比较的字符串，end=True 时补齐到该时间段末尾"""
+    if not value:
+        return None
+    value = value.strip().replace('T', ' ')
+    for fmt, length in (('%Y-%m-%d %H:%M:%S', 19), ('%Y-%m-%d %H:%M', 16), ('%Y-%m-%d', 10)):
+        try:
+            datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return value + ('9999-12-31 23:59:59'[length:] if end else '')
+    raise ValueError(f'Invalid time: {value}')
+
+
+# ===== 索引 =====
+
+
+def _index_dir():
+    return config.AUDIT_LOG + '.idx'
+
+
+def _posting_path(field, value):
+    name = quote(str(value), safe='')
+    return os.path.join(_index_dir(), f'{field}={name[:200]}')
+
+
+@contextmanager
+def _locked(mode):
+    """索引目录下的文件锁: 写入日志持共享锁，补齐索引与轮转持排他锁"""
+    os.makedirs(_index_dir(), exist_ok=True)
+    with open(os.path.join(_index_dir(), 'lock'), 'a') as lock:
+        fcntl.flock(lock, mode)
+        yield
+
+
+def _clear_index():
+    index_dir = _index_dir()
+    for name in os.listdir(index_dir):
+        if name != 'lock':
+            os.remove(os.path.join(index_dir, name))
+
+
+def _read_state():
+    try:
+        with open(os.path.join(_index_dir(), 'state.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(state):
+    path = os.path.join(_index_dir(), 'state.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def _trim(path, width, offset_at, limit):
+    """截掉文件末尾偏移 >= limit 的条目（上次补齐中途失败时已写入的部分）"""
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        size -= size % width
+        while size:
+            f.seek(size - width)
+            if offset_at(f.read(width)) < limit:
+                break
+            size -= width
+        f.truncate(size)
+
+
+def _append_entries(path, data, width, offset_at, indexed):
+    if os.path.exists(path):
+        _trim(path, width, offset_at, indexed)
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+def update_index():
+    """
+    把 audit.log 中尚未索引的完整行加入索引（需要时先轮转；日志被替换或截短时重建），返回新增记录数
+    """
+    with _locked(fcntl.LOCK_EX):
+        state = _read_state()
+        if os.path.exists(config.AUDIT_LOG + '.rotating') or _should_rotate():
+            _rotate()
+            state = None
+        try:
+            st = os.stat(config.AUDIT_LOG)
+        except FileNotFoundError:
+            return 0
+        if not state or state['ino'] != st.st_ino or state['size'] > st.st_size:
+            _clear_index()
+            state = {'ino': st.st_ino, 'size': 0, 'max_hour': 0}
+        if state['size'] >= st.st_size:
+            return 0
+
+        with open(config.AUDIT_LOG, 'rb') as f:
+            f.seek(state['size'])
+            data = f.read(st.st_size - state['size'])
+        data = data[:data.rfind(b'\n') + 1]
+        postings = defaultdict(lambda: array('Q'))
+        hours = []
+        offset, count = state['size'], 0
+        for line in data.splitlines(keepends=True):
+            try:
+                log = json.loads(line)
+                hour = _hour_key(log['timestamp'], '0')
+            except (ValueError, KeyError, TypeError):
+                offset += len(line)
+                continue
+            for field, value in _record_keys(log).items():
+                postings[(field, value)].append(offset)
+            if hour > state['max_hour']:
+                hours.append(_HOUR.pack(hour, offset))
+                state['max_hour'] = hour
+            offset += len(line)
+            count += 1
+
+        def posting_offset(b):
+            return struct.unpack('<Q', b)[0]
+
+        def hour_offset(b):
+            return _HOUR.unpack(b)[1]
+
+        for (field, value), offsets in postings.items():
+            _append_entries(_posting_path(field, value), offsets.tobytes(), 8, posting_offset, state['size'])
+        if hours:
+            _append_entries(os.path.join(_index_dir(), 'hours'), b''.join(hours), _HOUR.size, hour_offset,
+                            state['size'])
+        state['size'] += len(data)
+        _write_state(state)
+        return count
+
+
+# ===== 轮转 =====
+
+# {段路径: (mtime, 头部)}
+_segment_headers = {}
+
+
+def _should_rotate():
+    """当前文件是否达到轮转条件（大小或首条记录的时间）"""
+    rotate_bytes = config.AUDIT_CONFIG['rotate_bytes']
+    rotate_days = config.AUDIT_CONFIG['rotate_days']
+    try:
+        f = open(config.AUDIT_LOG, 'rb')
+    except FileNotFoundError:
+        return False
+    with f:
+        if rotate_bytes and os.fstat(f.fileno()).st_size >= rotate_bytes:
+            return True
+        if not rotate_days:
+            return False
+        try:
+            first = datetime.strptime(json.loads(f.readline())['timestamp'], '%Y-%m-%d %H:%M:%S')
+        except (ValueError, KeyError, TypeError):
+            return False
+    return datetime.now() - first >= timedelta(days=rotate_days)
+
+
+def list_segments():
+    """已轮转的段 [(序号, 路径)]，按序号从旧到新"""
+    directory, base = os.path.split(config.AUDIT_LOG)
+    pattern = re.compile(re.escape(base) + r'\.(\d{6})\.gz$')
+    segments = []
+    for name in os.listdir(directory or '.'):
+        match = pattern.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def segment_header(path):
+    """段头部 {segment, start, end, records, lines}（只解压首行，按 mtime 缓存）"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _segment_headers.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline())
+    _segment_headers[path] = (mtime, header)
+    return header
+
+
+def _rotate():
+    """
+    （持排他锁）把当前文件压缩为下一个段并清空索引
+    先改名为 .rotating 再压缩，中途失败时下次补齐索引前继续完成
+    """
+    rotating = config.AUDIT_LOG + '.rotating'
+    if not os.path.exists(rotating):
+        os.rename(config.AUDIT_LOG, rotating)
+    records, lines, start, end = 0, 0, None, None
+    with open(rotating, 'rb') as f:
+        for line in f:
+            lines += 1
+            try:
+                timestamp = json.loads(line)['timestamp']
+            except (ValueError, KeyError, TypeError):
+                continue
+            records += 1
+            start = timestamp if start is None else min(start, timestamp)
+            end = timestamp if end is None else max(end, timestamp)
+    segments = list_segments()
+    seq = segments[-1][0] + 1 if segments else 1
+    path = f'{config.AUDIT_LOG}.{seq:06d}.gz'
+    header = {'segment': seq, 'start': start, 'end': end, 'records': records, 'lines': lines}
+    with open(rotating, 'rb') as src, gzip.open(path + '.tmp', 'wb') as dst:
+        dst.write(json.dumps(header).encode('utf-8') + b'\n')
+        shutil.copyfileobj(src, dst)
+    os.replace(path + '.tmp', path)
+    os.remove(rotating)
+    _clear_index()
+
+
+def _segment_end_cursor(seq):
+    """指向段末尾（包含整个段）的 cursor，即下一个段（或当前文件）的开头"""
+    return f'{seq + 1}:0'
+
+
+def _query_segment(seq, path, matches, limit, before=None, prefilter=None):
+    """
+    流式解压一个段，返回偏移 < before 的最新 limit 条匹配记录（从新到旧）与下一页 cursor
+    偏移为轮转前文件中的字节偏移（段头部之后的内容即原文件）；只保留最近 limit 条，内存与段大小无关；
+    prefilter 为行内容的快速预判，不满足的行不解析；limit <= 0 时不读取，cursor 指向 before（未给出时为段末尾）
+    """
+    if limit <= 0:
+        return [], f'{seq}:{before}' if before is not None else _segment_end_cursor(seq)
+    recent = deque(maxlen=limit)
+    matched = 0
+    offset = 0
+    with gzip.open(path, 'rb') as f:
+        f.readline()
+        for line in f:
+            index, offset = offset, offset + len(line)
+            if before is not None and index >= before:
+                break
+            if prefilter and not prefilter(line):
+                continue
+            try:
+                log = json.loads(line)
+            except ValueError:
+                continue
+            if matches(log):
+                recent.append((index, log))
+                matched += 1
+    cursor = f'{seq}:{recent[0][0]}' if matched > limit else None
+    return [log for _, log in reversed(recent)], cursor
+
+
+def _read_postings(field, value, limit):
+    """posting 列表（升序偏移，只保留 < limit 的条目）"""
+    offsets = array('Q')
+    try:
+        with open(_posting_path(field, value), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return offsets
+    offsets.frombytes(data[:len(data) - len(data) % 8])
+    while offsets and offsets[-1] >= limit:
+        offsets.pop()
+    return offsets
+
+
+def _hour_key(timestamp, pad):
+    """'YYYY-mm-dd HH...' → YYYYmmddHH（只有日期时用 pad 补齐小时）"""
+    return int(timestamp[:13].replace('-', '').replace(' ', '').ljust(10, pad))
+
+
+def _time_bounds(since, until, indexed_size):
+    """
+    按 hours 索引把时间范围换算为偏移范围 [lo, hi)，hi 为 None 表示到末尾
+    hours 只记录单调递增的小时，lo 之前的记录一定早于 since 所在小时
+    """
+    lo, hi = 0, None
+    try:
+        with open(os.path.join(_index_dir(), 'hours'), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return lo, hi
+    if since:
+        lo = indexed_size
+    since_hour = _hour_key(since, '0') if since else None
+    until_hour = _hour_key(until, '9') if until else None
+    for hour, offset in _HOUR.iter_unpack(data[:len(data) - len(data) % _HOUR.size]):
+        if since_hour is not None and hour >= since_hour and lo == indexed_size:
+            lo = min(lo, offset)
+        if until_hour is not None and hour > until_hour:
+            hi = offset
+            break
+    return lo, hi
+
+
+def _read_at(f, offset):
+    f.seek(offset)
+    try:
+        return json.loads(f.readline())
+    except ValueError:
+        return None
+
+
+def _indexed_candidates(filters, lo, hi, indexed_size):
+    """按 posting 列表求交集，从新到旧产出 [lo, hi) 内且已索引的候选偏移"""
+    limit = indexed_size if hi is None else min(hi, indexed_size)
+    lists = sorted((_read_postings(field, value, limit) for field, value in filters.items()), key=len)
+    others = [set(offsets) for offsets in lists[1:]]
+    return (o for o in reversed(lists[0]) if o >= lo and all(o in s for s in others))
+
+
+def _query_active(seq, filters, matches, since, until, limit, before=None):
+    """
+    （持共享锁）查询当前文件: 有字段过滤时按索引直接定位匹配记录，否则按块反向扫描
+    seq 为当前文件轮转后的段序号；返回 (记录列表, 下一页 cursor 或 None)
+    """
+    state = _read_state()
+    indexed_size = state['size'] if state else 0
+    lo, hi = _time_bounds(since, until, indexed_size) if state and (since or until) else (0, None)
+    if before is not None:
+        hi = before if hi is None else min(hi, before)
+
+    logs = []
+
+    def scan(stop):
+        """顺序反向扫描 [stop, hi)，页满时返回 cursor"""
+        for offset, log in iter_logs(hi):
+            if offset < stop:
+                break
+            if matches(log):
+                logs.append(log)
+                if len(logs) >= limit:
+                    return f'{seq}:{offset}'
+        return None
+
+    if not filters or not state:
+        return logs, scan(lo)
+    # 索引之后追加、尚未补齐的记录（其他进程刚写入）先顺序扫描
+    if hi is None or hi > indexed_size:
+        cursor = scan(max(lo, indexed_size))
+        if cursor:
+            return logs, cursor
+    try:
+        f = open(config.AUDIT_LOG, 'rb')
+    except FileNotFoundError:
+        return logs, None
+    with f:
+        for offset in _indexed_candidates(filters, lo, hi, indexed_size):
+            log = _read_at(f, offset)
+            if log is not None and matches(log):
+                logs.append(log)
+                if len(logs) >= limit:
+                    return logs, f'{seq}:{offset}'
+    return logs, None
+
+
+def make_matcher(machine=None, user=None, action=None, since=None, until=None):
+    """过滤条件 → (字段过滤 dict, 判断单条记录是否匹配的函数)"""
+    filters = {k: v for k, v in (('machine', machine), ('user', user), ('action', action)) if v}
+
+    def matches(log):
+        if any(_record_keys(log)[k] != v for k, v in filters.items()):
+            return False
+        timestamp = log.get('timestamp', '')
+        return (not since or timestamp >= since) and (not until or timestamp <= until)
+
+    return filters, matches
+
+
+def make_prefilter(filters, since, until):
+    """
+    按原始行内容快速排除不可能匹配的记录（log_action 写入的行以 {"timestamp": "..." 开头，
+    字段值以 JSON 字符串出现），结果仍需 matches 确认
+    """
+    needles = [json.dumps(v, ensure_ascii=False).encode('utf-8')
+               for k, v in filters.items() if not (k == 'machine' and v == 'local')]
+    prefix = b'{"timestamp": "'
+
+    def prefilter(line):
+        if since or until:
+            if line.startswith(prefix):
+                timestamp = line[15:34].decode('ascii', 'replace')
+                if (since and timestamp < since) or (until and timestamp > until):
+                    return False
+        return all(n in line for n in needles)
+
+    return prefilter if needles or since or until else None
+
+
+def _segment_in_range(header, since, until):
+    if header.get('start') is None:
+        return False
+    return (not since or header['end'] >= since) and (not until or header['start'] <= until)
+
+
+def query_logs(machine=None, limit=500, before=None, user=None, action=None, since=None, until=None):
+    """
+    从新到旧查询审计记录（当前文件，然后依次是更早的段），凑满 limit 条即停止读取
+    machine / user / action 精确匹配，since / until 为 parse_time 的结果（闭区间）；before 为 parse_cursor 的结果
+    返回 (记录列表, 下一页 cursor 或 None)
+    """
+    filters, matches = make_matcher(machine, user, action, since, until)
+    flush()
+    try:
+        update_index()
+    except OSError:
+        pass
+    segment, position = before or (None, None)
+    logs = []
+    # 持共享锁查询当前文件（索引状态、posting 与文件内容一致）并列出段，期间不会发生轮转
+    with _locked(fcntl.LOCK_SH):
+        segments = list_segments()
+        active_seq = segments[-1][0] + 1 if segments else 1
+        if segment is None or segment >= active_seq:
+            logs, cursor = _query_active(active_seq, filters, matches, since, until, limit, position)
+            if cursor:
+                return logs, cursor
+    for seq, path in reversed(segments):
+        if segment is not None and seq > segment:
+            continue
+        if not _segment_in_range(segment_header(path), since, until):
+            continue
+        # 较新的部分恰好凑满一页: 下一页从这个段的末尾开始
+        if len(logs) >= limit:
+            return logs, _segment_end_cursor(seq)
+        page, cursor = _query_segment(seq, path, matches, limit - len(logs), position if seq == segment else None,
+                                      make_prefilter(filters, since, until))
+        logs.extend(page)
+        if cursor:
+            return logs, cursor
+    return logs, None
+
+
+def export_lines(machine=None, user=None, action=None, since=None, until=None):
+    """
+    从旧到新产出匹配的原始记录行（bytes，含换行，即 log_action 写入的 JSON 行）
+    索引状态、当前文件与段列表在同一共享锁内取得，之后发生的轮转不影响本次导出（已打开的文件仍可读取），不重复也不遗漏
+    """
+    filters, matches = make_matcher(machine, user, action, since, until)
+    prefilter = make_prefilter(filters, since, until)
+    flush()
+    try:
+        update_index()
+    except OSError:
+        pass
+    # 持共享锁读取索引状态、打开当前文件并列出段，期间不会发生轮转（轮转持排他锁）
+    with _locked(fcntl.LOCK_SH):
+        state = _read_state()
+        lo, hi = _time_bounds(since, until, state['size']) if state and (since or until) else (0, None)
+        try:
+            active = open(config.AUDIT_LOG, 'rb')
+        except FileNotFoundError:
+            active = None
+        segments = [path for _, path in list_segments() if _segment_in_range(segment_header(path), since, until)]
+
+    def active_lines():
+        offset = lo
+        active.seek(lo)
+        for line in iter(active.readline, b''):
+            if hi is not None and offset >= hi:
+                break
+            offset += len(line)
+            yield line
+
+    def matching(lines):
+        for line in lines:
+            if prefilter and not prefilter(line):
+                continue
+            try:
+                log = json.loads(line)
+            except ValueError:
+                continue
+            if matches(log):
+                yield line if line.endswith(b'\n') else line + b'\n'
+
+    try:
+        for path in segments:
+            with gzip.open(path, 'rb') as f:
+                f.readline()
+                yield from matching(f)
+        if active:
+            yield from matching(active_lines())
+    finally:
+        if active:
+            active.close()
@@ -79,8 +79,10 @@ def require_machine_access(f):
     @login_required
     def decorated(*args, **kwargs):
         machine_id = kwargs.get('machine_id')
-        if not machine_id and request.json:
-            machine_id = request.json.get('machine_id', 'local')
+        # GET 请求没有 JSON 请求体，request.json 会返回 415
+        data = request.get_json(silent=True)
+        if not machine_id and isinstance(data, dict):
+            machine_id = data.get('machine_id', 'local')
         if not machine_id:
             machine_id = request.args.get('machine_id', 'local')
         if not machine_id:
@@ -0,0 +1,511 @@
+# core/backups.py - 内容寻址的 crontab 备份存储
+# 功能: 备份内容按 SHA-256 存为共享对象（BACKUP_DIR/.objects/ab/cdef...），每个 (机器, 用户) 一个
+#       manifest.jsonl 记录 {filename, timestamp, username, hash, size, lines, tasks, added, removed}；
+#       与上一版本相同的内容只需比较哈希即跳过；manifest 在内存中缓存，追加写入后只读取新增的尾部
+# 多进程: 每次访问都检查 manifest 文件（inode、大小），其他 worker 追加的备份立即可见；追加持文件锁
+#         写入对象与追加 manifest 持对象目录的共享锁，清理未引用对象持排他锁；清理间隔按 .pruned 的修改时间在各 worker 间共享
+#         本工具最近一次保存的内容哈希记录在同一目录的 saved.sha256，所有 worker 的变化检测据此识别自己的写入
+# 存储: 对象为 zlib 压缩的关键帧或相对上一版本的行差异，差异链深度有上限，重建结果 LRU 缓存
+# 迁移: 旧版目录中的 crontab_*.bak 在启动时（migrate_legacy_backups）导入对象与 manifest 后删除，读取路径不做迁移
+# 用法: from core import backups; backups.add_backup(machine_id, linux_user, content, username)
+
+import os
+import re
+import json
+import zlib
+import fcntl
+import time
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from core import config
+
+MANIFEST_NAME = 'manifest.jsonl'
+LOCK_NAME = 'manifest.lock'
+SAVED_NAME = 'saved.sha256'
+OBJECTS_DIR_NAME = '.objects'
+OBJECTS_LOCK_NAME = '.objects.lock'
+PRUNE_STAMP_NAME = '.pruned'
+
+_lock = threading.RLock()
+# {哈希: (内容, 差异链深度)}，最近重建的对象
+_reconstructed = OrderedDict()
+_cache_lock = threading.Lock()
+# {manifest 路径: (inode, 已解析到的偏移, 条目列表, 偏移之前的末尾字节)}
+_manifests = {}
+
+
+def object_hash(content: str) -> str:
+    """对象键: 内容的 SHA-256（与 core.crontab.content_hash 相同）"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _objects_dir():
+    return os.path.join(config.BACKUP_DIR, OBJECTS_DIR_NAME)
+
+
+def _object_path(digest):
+    return os.path.join(_objects_dir(), digest[:2], digest[2:])
+
+
+def _backup_subdir(machine_id, linux_user):
+    """(机器, 用户) 的 manifest 目录；名称含路径分隔符或为 . / .. 时抛出 ValueError"""
+    linux_user = linux_user or config.DEFAULT_LINUX_USER
+    for name in (machine_id, linux_user):
+        if not name or name in ('.', '..') or any(c in name for c in '/\\\0'):
+            raise ValueError(f'Invalid backup path component: {name!r}')
+    return os.path.join(config.BACKUP_DIR, machine_id, linux_user)
+
+
+def _atomic_write(path, data):
+    tmp = f'{path}.tmp.{os.getpid()}.{threading.get_ident()}'
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# ===== 对象 =====
+# 对象文件为 zlib 压缩的 "头部行\n正文":
+#   K                    关键帧，正文为完整内容
+#   D <基准哈希> <深度>   差异，正文为 JSON 行操作: [起, 止] 复制基准的行区间，["行", ...] 插入新行
+# 差异链深度达到 backup.keyframe_interval - 1 时写关键帧，重建最多解压 keyframe_interval 个对象；
+# 最近重建的内容按哈希缓存（LRU）。未压缩的对象（旧版）按原文读取。
+
+
+def _encode_delta(base: str, content: str):
+    """按行计算 base → content 的操作列表"""
+    base_lines = base.splitlines(keepends=True)
+    lines = content.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, lines).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(lines[j1:j2])
+    return ops
+
+
+def _apply_delta(base: str, ops):
+    base_lines = base.splitlines(keepends=True)
+    out = []
+    for op in ops:
+        if op and isinstance(op[0], int):
+            out.extend(base_lines[op[0]:op[1]])
+        else:
+            out.extend(op)
+    return ''.join(out)
+
+
+def _cache_get(digest):
+    with _cache_lock:
+        item = _reconstructed.get(digest)
+        if item is not None:
+            _reconstructed.move_to_end(digest)
+        return item
+
+
+def _cache_put(digest, content, depth):
+    with _cache_lock:
+        _reconstructed[digest] = (content, depth)
+        _reconstructed.move_to_end(digest)
+        while len(_reconstructed) > config.BACKUP_CONFIG['cache_entries']:
+            _reconstructed.popitem(last=False)
+
+
+def _load_object(digest):
+    """读取对象文件，返回 (基准哈希或 None, 深度, 正文内容或差异操作)，不存在返回 None"""
+    try:
+        with open(_object_path(digest), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        return None, 0, data.decode('utf-8')
+    header, _, body = data.partition(b'\n')
+    if header == b'K':
+        return None, 0, body.decode('utf-8')
+    _, base, depth = header.decode('ascii').split()
+    return base, int(depth), json.loads(body)
+
+
+def _read(digest):
+    """重建对象内容，返回 (内容, 深度)，不存在或链断裂返回 None"""
+    cached = _cache_get(digest)
+    if cached is not None:
+        return cached
+    loaded = _load_object(digest)
+    if loaded is None:
+        return None
+    base, depth, body = loaded
+    if base is None:
+        content = body
+    else:
+        base_item = _read(base)
+        if base_item is None:
+            return None
+        content = _apply_delta(base_item[0], body)
+    _cache_put(digest, content, depth)
+    return content, depth
+
+
+def store_object(content: str, base: str = None) -> str:
+    """
+    写入内容对象（已存在则跳过），返回哈希
+    给出 base（通常为同一 (机器, 用户) 的上一版本）且链深度未达上限时尝试存为差异，
+    差异压缩后不小于关键帧则仍存关键帧
+    """
+    digest = object_hash(content)
+    path = _object_path(digest)
+    if os.path.exists(path):
+        return digest
+    raw = content.encode('utf-8')
+    data = zlib.compress(b'K\n' + raw)
+    depth = 0
+    base_item = _read(base) if base and base != digest else None
+    if base_item is not None and base_item[1] + 1 < config.BACKUP_CONFIG['keyframe_interval']:
+        header = f'D {base} {base_item[1] + 1}\n'.encode('ascii')
+        delta = zlib.compress(header + json.dumps(_encode_delta(base_item[0], content),
+                                                  ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        if len(delta) < len(data):
+            data, depth = delta, base_item[1] + 1
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write(path, data)
+    _cache_put(digest, content, depth)
+    return digest
+
+
+def read_object(digest: str):
+    """读取（重建）内容对象，不存在返回 None"""
+    if not re.fullmatch(r'[0-9a-f]{64}', digest or ''):
+        return None
+    item = _read(digest)
+    return item[0] if item else None
+
+
+def _object_base(digest):
+    """对象的差异基准哈希（关键帧或不存在返回 None）"""
+    loaded = _load_object(digest)
+    return loaded[0] if loaded else None
+
+
+# ===== manifest =====
+
+
+def _read_manifest(subdir):
+    """
+    读取 manifest 条目（按时间从旧到新，调用方不得修改返回的列表）
+    文件未被替换（inode 不变，已解析部分的末尾字节相同）且只增长时只解析新增的完整行
+    """
+    path = os.path.join(subdir, MANIFEST_NAME)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _manifests.pop(path, None)
+        return []
+    cached = _manifests.get(path)
+    if cached and cached[0] == st.st_ino and cached[1] == st.st_size:
+        return cached[2]
+    offset, entries, tail = 0, [], b''
+    if cached and cached[0] == st.st_ino and cached[1] < st.st_size:
+        offset, entries, tail = cached[1], list(cached[2]), cached[3]
+    with open(path, 'rb') as f:
+        f.seek(offset - len(tail))
+        data = f.read()
+        # inode 可能被替换后的新文件复用: 已解析部分的末尾不同则从头读取
+        if data.startswith(tail):
+            data = data[len(tail):]
+        else:
+            offset, entries, tail = 0, [], b''
+            f.seek(0)
+            data = f.read()
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    _manifests[path] = (st.st_ino, offset + end, entries, (tail + data[:end])[-64:])
+    return entries
+
+
+@contextmanager
+def _manifest_lock(subdir):
+    """manifest 的进程间排他锁（多个 worker 追加或改写同一 manifest 时串行化）"""
+    with open(os.path.join(subdir, LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+@contextmanager
+def _objects_lock(mode):
+    """对象目录的进程间锁: 写入备份（对象 + manifest 条目）持共享锁，清理未引用对象持排他锁"""
+    os.makedirs(config.BACKUP_DIR, exist_ok=True)
+    with open(os.path.join(config.BACKUP_DIR, OBJECTS_LOCK_NAME), 'a') as lock:
+        fcntl.flock(lock, mode)
+        yield
+
+
+def _write_manifest(subdir, entries):
+    _manifests.pop(os.path.join(subdir, MANIFEST_NAME), None)
+    _atomic_write(os.path.join(subdir, MANIFEST_NAME),
+                  ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in entries))
+
+
+def _migrate_legacy(subdir):
+    """（持 manifest 锁）导入旧版 crontab_<时间>_<用户>.bak 文件（按文件名排序，连续重复的合并），导入后删除"""
+    legacy = sorted(f for f in os.listdir(subdir) if f.endswith('.bak'))
+    if not legacy:
+        return
+    entries = list(_read_manifest(subdir))
+    known = {e['filename'] for e in entries}
+    previous = read_object(entries[-1]['hash']) if entries else None
+    for name in legacy:
+        path = os.path.join(subdir, name)
+        if name not in known:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            digest = store_object(content, base=entries[-1]['hash'] if entries else None)
+            if not entries or entries[-1]['hash'] != digest:
+                parts = name[len('crontab_'):-len('.bak')].split('_')
+                timestamp = '_'.join(parts[:2])
+                username = '_'.join(parts[2:])
+                entries.append({'filename': name, 'timestamp': timestamp, 'username': username, 'hash': digest,
+                                **content_stats(content, previous)})
+                previous = content
+    entries.sort(key=lambda e: e['timestamp'])
+    _write_manifest(subdir, entries[-config.BACKUP_CONFIG['keep']:])
+    for name in legacy:
+        os.remove(os.path.join(subdir, name))
+
+
+def migrate_legacy_backups():
+    """
+    导入 BACKUP_DIR 下所有目录中的旧版 .bak 文件（启动时调用一次），返回迁移的目录数
+    多个 worker 同时启动时由 manifest 锁串行化，后到的 worker 看不到 .bak 文件即跳过
+    """
+    migrated = 0
+    with _lock:
+        for subdir in list(_manifest_dirs()):
+            if not any(name.endswith('.bak') for name in os.listdir(subdir)):
+                continue
+            with _objects_lock(fcntl.LOCK_SH), _manifest_lock(subdir):
+                _migrate_legacy(subdir)
+            migrated += 1
+    return migrated
+
+
+def _task_lines(content):
+    """任务行（生效与禁用）计数，用于统计版本间新增/删除的任务"""
+    from core.crontab import tokenize_crontab
+    return Counter((t.kind, t.schedule, t.command) for t in tokenize_crontab(content)
+                   if t.kind in ('task', 'disabled'))
+
+
+def content_stats(content: str, previous: str = None):
+    """
+    manifest 中记录的版本统计: size（字节）、lines、tasks，
+    以及相对上一版本新增/删除的任务数 added、removed（启用/禁用切换计为一删一增；没有上一版本时全部计为新增）
+    """
+    tasks = _task_lines(content)
+    before = _task_lines(previous) if previous else Counter()
+    return {
+        'size': len(content.encode('utf-8')),
+        'lines': content.count('\n') + (0 if content.endswith('\n') or not content else 1),
+        'tasks': sum(tasks.values()),
+        'added': sum((tasks - before).values()),
+        'removed': sum((before - tasks).values()),
+    }
+
+
+def list_backups(machine_id: str, linux_user: str):
+    """备份列表（从新到旧），每项 {filename, timestamp, username, hash, size, lines, tasks, added, removed}"""
+    with _lock:
+        return list(reversed(_read_manifest(_backup_subdir(machine_id, linux_user))))
+
+
+def query_backups(machine_id: str, linux_user: str, cursor: str = None, limit: int = None,
+                  since: str = None, until: str = None):
+    """
+    分页查询备份（从新到旧）
+    cursor: 上一页最后一项的文件名，从其后开始；since/until: 时间戳（YYYYmmdd_HHMMSS）闭区间过滤
+    返回 (条目列表, 下一页 cursor 或 None)；cursor 不存在时抛出 KeyError
+    """
+    with _lock:
+        entries = _read_manifest(_backup_subdir(machine_id, linux_user))
+        end = len(entries)
+        if cursor is not None:
+            end = next((i for i in range(end - 1, -1, -1) if entries[i]['filename'] == cursor), None)
+            if end is None:
+                raise KeyError(cursor)
+        page = []
+        for i in range(end - 1, -1, -1):
+            timestamp = entries[i]['timestamp']
+            if until is not None and timestamp > until:
+                continue
+            # manifest 按时间排序，早于 since 后不会再有匹配项
+            if since is not None and timestamp < since:
+                return page, None
+            if limit is not None and len(page) >= limit:
+                return page, page[-1]['filename']
+            page.append(entries[i])
+        return page, None
+
+
+def last_backup_hash(machine_id: str, linux_user: str):
+    """最新备份内容的哈希，没有备份返回 None（每次读取 manifest，包含其他进程追加的备份）"""
+    with _lock:
+        entries = _read_manifest(_backup_subdir(machine_id, linux_user))
+        return entries[-1]['hash'] if entries else None
+
+
+def _append_backup(subdir, content, digest, username):
+    """（持 manifest 锁）重新读取 manifest 确认最新版本后写入对象并追加条目"""
+    entries = _read_manifest(subdir)
+    previous = entries[-1]['hash'] if entries else None
+    if previous == digest:
+        return None
+    store_object(content, base=previous)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    safe_user = re.sub(r'[^a-zA-Z0-9_]', '', username or 'unknown')
+    names = {e['filename'] for e in entries}
+    filename, n = f'crontab_{timestamp}_{safe_user}.bak', 1
+    while filename in names:
+        n += 1
+        filename = f'crontab_{timestamp}_{safe_user}_{n}.bak'
+    entry = {'filename': filename, 'timestamp': timestamp, 'username': safe_user, 'hash': digest,
+             **content_stats(content, read_object(previous) if previous else None)}
+
+    keep = config.BACKUP_CONFIG['keep']
+    if len(entries) + 1 > keep:
+        _write_manifest(subdir, (entries + [entry])[-keep:])
+    else:
+        with open(os.path.join(subdir, MANIFEST_NAME), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return entry
+
+
+def add_backup(machine_id: str, linux_user: str, content: str, username: str = None):
+    """
+    追加一个备份: 内容与最新备份相同时不记录，返回 None；否则返回新的 manifest 条目
+    每个 (机器, 用户) 保留最近 backup.keep 个版本，不再被引用的对象由 prune_objects 清理
+    """
+    linux_user = linux_user or config.DEFAULT_LINUX_USER
+    digest = object_hash(content)
+    subdir = _backup_subdir(machine_id, linux_user)
+    with _lock:
+        if last_backup_hash(machine_id, linux_user) == digest:
+            return None
+        os.makedirs(subdir, exist_ok=True)
+        with _objects_lock(fcntl.LOCK_SH), _manifest_lock(subdir):
+            return _append_backup(subdir, content, digest, username)
+
+
+def record_saved_hash(machine_id: str, linux_user: str, digest: str):
+    """记录本工具刚写入的 crontab 内容哈希（保存成功后调用）"""
+    subdir = _backup_subdir(machine_id, linux_user)
+    os.makedirs(subdir, exist_ok=True)
+    _atomic_write(os.path.join(subdir, SAVED_NAME), digest)
+
+
+def saved_hash(machine_id: str, linux_user: str):
+    """本工具（任一 worker）最近一次写入的内容哈希，没有记录返回 None"""
+    try:
+        with open(os.path.join(_backup_subdir(machine_id, linux_user), SAVED_NAME), 'r', encoding='ascii') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def find_backup(machine_id: str, linux_user: str, filename: str):
+    """按文件名查找 manifest 条目，不存在返回 None"""
+    return next((e for e in list_backups(machine_id, linux_user) if e['filename'] == filename), None)
+
+
+def get_backup(machine_id: str, linux_user: str, filename: str):
+    """按文件名读取备份内容，不存在返回 None"""
+    entry = find_backup(machine_id, linux_user, filename)
+    return read_object(entry['hash']) if entry else None
+
+
+def _manifest_dirs():
+    """BACKUP_DIR 下所有 <机器>/<用户> 目录"""
+    root = config.BACKUP_DIR
+    if not os.path.isdir(root):
+        return
+    for machine_id in os.listdir(root):
+        machine_dir = os.path.join(root, machine_id)
+        if machine_id == OBJECTS_DIR_NAME or not os.path.isdir(machine_dir):
+            continue
+        for linux_user in os.listdir(machine_dir):
+            subdir = os.path.join(machine_dir, linux_user)
+            if os.path.isdir(subdir):
+                yield subdir
+
+
+def _prune_unreferenced():
+    """（持对象排他锁）标记所有 manifest 引用的对象及其差异基准，删除其余对象"""
+    referenced = set()
+    pending = [e['hash'] for subdir in _manifest_dirs() for e in _read_manifest(subdir)]
+    while pending:
+        digest = pending.pop()
+        if digest in referenced:
+            continue
+        referenced.add(digest)
+        base = _object_base(digest)
+        if base:
+            pending.append(base)
+    removed = 0
+    objects_dir = _objects_dir()
+    if not os.path.isdir(objects_dir):
+        return 0
+    for prefix in os.listdir(objects_dir):
+        prefix_dir = os.path.join(objects_dir, prefix)
+        for name in os.listdir(prefix_dir):
+            if '.tmp.' not in name and prefix + name not in referenced:
+                os.remove(os.path.join(prefix_dir, name))
+                with _cache_lock:
+                    _reconstructed.pop(prefix + name, None)
+                removed += 1
+    return removed
+
+
+def prune_objects():
+    """
+    删除不再被任何 manifest 引用、也不是被引用对象差异基准的对象，返回删除数量
+    持对象目录排他锁，其他 worker 已写入对象但尚未追加 manifest 条目的备份不会被误删
+    """
+    with _lock, _objects_lock(fcntl.LOCK_EX):
+        return _prune_unreferenced()
+
+
+def _prune_due(stamp, interval):
+    try:
+        return time.time() - os.path.getmtime(stamp) >= interval
+    except FileNotFoundError:
+        return True
+
+
+def prune_objects_if_due(interval: float):
+    """
+    距上次清理（任一 worker）超过 interval 秒时清理对象，返回删除数量；未到期返回 None
+    多个 worker 同时到期时由排他锁串行化，后到的 worker 重新检查时间后跳过
+    """
+    stamp = os.path.join(config.BACKUP_DIR, PRUNE_STAMP_NAME)
+    if not _prune_due(stamp, interval):
+        return None
+    with _lock, _objects_lock(fcntl.LOCK_EX):
+        if not _prune_due(stamp, interval):
+            return None
+        removed = _prune_unreferenced()
+        with open(stamp, 'a'):
+            os.utime(stamp)
+        return removed
@@ -93,6 +93,63 @@ MACHINES = config.get('machines', {
 })
 DEFAULT_MACHINE = config.get('default_machine', 'local')
 
+
+def simulated_fleet(count, prefix='sim-', **options):
+    """
+    生成 count 台 type=simulated 的机器配置 {prefix0001: {...}}（压测用）
+    options 为 SimulatedExecutor 参数（latency、jitter、failure_rate、payload_lines、change_rate、linux_users），
+    每台机器的 seed 取其序号，内容互不相同
+    """
+    width = max(4, len(str(count)))
+    return {
+        f'{prefix}{i:0{width}d}': {
+            'name': f'模拟机器 {i}', 'type': 'simulated', 'seed': i,
+            'linux_users': ['root'], **options,
+        }
+        for i in range(1, count + 1)
+    }
+
+
+# "simulated_fleet": {"count": 1000, "latency": 0.05, ...} 追加 count 台模拟机器
+if config.get('simulated_fleet'):
+    MACHINES = {**MACHINES, **simulated_fleet(**config['simulated_fleet'])}
+
+# ===== 后台检测配置 =====
+WATCHER_CONFIG = {
+    'interval': 60,       # 每台机器的检测间隔（秒）
+    'max_workers': 16,    # 并发检测线程数
+    'deadline': 30,       # 单台机器检测超时（秒），超时按失败处理
+    'jitter': 0.1,        # 检测间隔随机抖动比例，避免所有机器同时检测
+    'max_backoff': 900,   # 连续失败时的最大退避间隔（秒）
+}
+WATCHER_CONFIG.update(config.get('watcher') or {})
+
+# ===== 缓存配置 =====
+CACHE_CONFIG = {
+    'crontab_ttl': 0,     # 跨请求的 crontab 读取缓存时间（秒），0 为关闭；失效只作用于本进程，仅单 worker 部署时开启
+    'parse_entries': 512, # 解析结果缓存条目数（按内容哈希，所有机器共享），0 为关闭
+    'diff_entries': 64,   # 版本差异缓存条目数（按两个版本的内容哈希），0 为关闭
+}
+CACHE_CONFIG.update(config.get('cache') or {})
+
+# ===== 备份配置 =====
+BACKUP_CONFIG = {
+    'keep': 100,          # 每个 (机器, 用户) 保留的备份版本数
+    'keyframe_interval': 16,  # 每隔多少个版本存一次完整内容（其余存为相对上一版本的行差异），1 为不用差异
+    'cache_entries': 256,     # 重建后的备份内容缓存条目数
+    'prune_interval': 3600,   # 清理未引用对象的间隔（秒），多个 worker 共享
+}
+BACKUP_CONFIG.update(config.get('backup') or {})
+
+# ===== 审计日志配置 =====
+AUDIT_CONFIG = {
+    'rotate_bytes': 64 * 1024 * 1024,  # audit.log 超过该大小时压缩为一个段，0 为不按大小轮转
+    'rotate_days': 30,                 # 首条记录超过该天数时轮转，0 为不按时间轮转
+    'async_write': True,               # 后台线程批量写入（false 时在调用处同步写入）
+    'batch_size': 256,                 # 每次写入的最大记录数
+}
+AUDIT_CONFIG.update(config.get('audit') or {})
+
 # ===== 确保目录存在 =====
 os.makedirs(BACKUP_DIR, exist_ok=True)
 os.makedirs(LOG_DIR, exist_ok=True)
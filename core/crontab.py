@@ -4,38 +4,37 @@
 # 用法: from core.crontab import parse_crontab, validate_cron_schedule
 
 import re
-import os
-import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict
 
+from flask import g, has_request_context
+
 from executor import CrontabExecutor, get_executor
-from flask_login import current_user
-from core import config
+from core import config, backups
+from core.audit import log_action  # 路由与后台检测沿用 from core.crontab import log_action
+from core.schedule import next_runs, MACROS, MONTH_NAMES, WEEKDAY_NAMES
 
-# 执行器缓存
+# 执行器缓存（每台机器一个执行器，SSH 连接在其内部复用）
 _executors: Dict[str, CrontabExecutor] = {}
+_executors_lock = threading.Lock()
 
 
 def get_machine_executor(machine_id: str) -> CrontabExecutor:
-    """获取或创建机器执行器"""
-    if machine_id not in _executors:
-        if machine_id not in config.MACHINES:
-            raise ValueError(f'Machine not found: {machine_id}')
-        _executors[machine_id] = get_executor(config.MACHINES[machine_id])
-    return _executors[machine_id]
-
-
-def log_action(action, details=None):
-    """记录操作日志"""
-    log_entry = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "user": current_user.id if current_user.is_authenticated else "anonymous",
-        "action": action,
-        "details": details
-    }
-    with open(config.AUDIT_LOG, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+    """获取或创建机器执行器（线程安全，并发首次请求只创建一次）"""
+    executor = _executors.get(machine_id)
+    if executor is not None:
+        return executor
+    with _executors_lock:
+        if machine_id not in _executors:
+            if machine_id not in config.MACHINES:
+                raise ValueError(f'Machine not found: {machine_id}')
+            _executors[machine_id] = get_executor(config.MACHINES[machine_id])
+        return _executors[machine_id]
 
 
 # ===== 验证函数 =====
@@ -74,25 +73,37 @@ def validate_cron_field(value: str, min_val: int, max_val: int) -> bool:
     return True
 
 
+CRON_MACROS = set(MACROS) | {'@reboot'}
+
+
+def _replace_names(value: str, names: dict) -> str:
+    """月份/星期名称 → 数字（jan → 1，mon → 1），未知名称保持原样"""
+    return re.sub(r'[A-Za-z]+', lambda m: str(names.get(m.group().lower(), m.group())), value)
+
+
+@lru_cache(maxsize=4096)
 def validate_cron_schedule(schedule: str) -> tuple:
     """
-    验证 cron 表达式格式和值范围
+    验证 cron 表达式格式和值范围（支持 @daily 等宏与月份/星期名称）
     返回 (是否有效, 错误信息)
     """
+    if schedule.strip().lower() in CRON_MACROS:
+        return True, ""
     parts = schedule.split()
     if len(parts) != 5:
         return False, "Cron expression must have 5 fields"
 
     fields = [
-        ('minute', 0, 59),
-        ('hour', 0, 23),
-        ('day', 1, 31),
-        ('month', 1, 12),
-        ('weekday', 0, 7),
+        ('minute', 0, 59, None),
+        ('hour', 0, 23, None),
+        ('day', 1, 31, None),
+        ('month', 1, 12, MONTH_NAMES),
+        ('weekday', 0, 7, WEEKDAY_NAMES),
     ]
 
-    for i, (name, min_val, max_val) in enumerate(fields):
-        if not validate_cron_field(parts[i], min_val, max_val):
+    for i, (name, min_val, max_val, names) in enumerate(fields):
+        value = _replace_names(parts[i], names) if names else parts[i]
+        if not validate_cron_field(value, min_val, max_val):
             return False, f"Invalid {name}: {parts[i]} (valid: {min_val}-{max_val})"
     return True, ""
 
@@ -102,13 +113,13 @@ def validate_crontab_line(line: str) -> tuple:
     line = line.strip()
     if not line or line.startswith('#'):
         return True, ""
-    if re.match(r'^[A-Za-z_][A-Za-z0-9_]*=', line):
+    if _ENV_RE.match(line):
         return True, ""
-    parts = line.split(None, 5)
-    if len(parts) < 6:
+    parts = line.split(None, 1 if line.startswith('@') else 5)
+    if len(parts) < (2 if line.startswith('@') else 6):
         return False, "Cron line must have schedule (5 fields) + command"
-    schedule = ' '.join(parts[:5])
-    command = parts[5]
+    schedule = ' '.join(parts[:-1])
+    command = parts[-1]
     valid, error = validate_cron_schedule(schedule)
     if not valid:
         return False, error
@@ -118,37 +129,175 @@ def validate_crontab_line(line: str) -> tuple:
 
 
 def validate_crontab_content(content: str) -> tuple:
-    """验证整个 crontab 内容，返回 (是否有效, 错误列表)"""
-    errors = []
-    for i, line in enumerate(content.split('\n'), 1):
-        if line.strip().startswith('#') and re.match(r'^#[\d*,/-]+\s+', line.strip()):
-            uncommented = line.strip()[1:]
-            valid, error = validate_crontab_line(uncommented)
-            if not valid:
-                errors.append(f"Line {i}: {error}")
-        else:
-            valid, error = validate_crontab_line(line)
-            if not valid:
-                errors.append(f"Line {i}: {error}")
+    """验证整个 crontab 内容（含被注释的任务行），返回 (是否有效, 错误列表)"""
+    errors = [
+        f"Line {i}: {token.error}"
+        for i, token in enumerate(tokenize_crontab(content, validate=True), 1)
+        if token.error
+    ]
     return len(errors) == 0, errors
 
 
+# ===== 词法分析 =====
+
+
+# 任务行: 5 个字段（月份/星期字段允许英文名称，名称合法性另行检查）或宏，后接命令
+_FIELD = r'[\d*,/-]+'
+_NAMED_FIELD = r'[\w*,/-]+'
+_MACRO = r'@(?:' + '|'.join(sorted(m[1:] for m in CRON_MACROS)) + r')'
+_TASK_RE = re.compile(
+    rf'({_FIELD}\s+{_FIELD}\s+{_FIELD}\s+({_NAMED_FIELD})\s+({_NAMED_FIELD})|{_MACRO})\s+(\S.*)',
+    re.IGNORECASE
+)
+_MONTH_FIELD_RE = re.compile(r'(?:[\d*,/-]|' + '|'.join(MONTH_NAMES) + r')+$', re.IGNORECASE)
+_WEEKDAY_FIELD_RE = re.compile(r'(?:[\d*,/-]|' + '|'.join(WEEKDAY_NAMES) + r')+$', re.IGNORECASE)
+_ENV_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*\s*=')
+# 注释后紧跟类似 cron 字段的内容视为（可能写错的）禁用任务，需要验证
+_DISABLED_HINT_RE = re.compile(rf'(?:{_FIELD}|@\w+)\s')
+_FIELD_CHARS = '0123456789*,/-'
+# 可能开始一个任务行的首字符（数字、*、宏）
+_TASK_START = frozenset('0123456789*@')
+
+# kind: blank / comment / env / task（启用）/ disabled（# 注释的任务）/ invalid（无法识别的非注释行）
+# error: 仅 validate=True 时填充，行内容有误时为错误信息
+CrontabLine = namedtuple('CrontabLine', 'kind schedule command error')
+_BLANK = CrontabLine('blank', None, None, None)
+_COMMENT = CrontabLine('comment', None, None, None)
+_ENV = CrontabLine('env', None, None, None)
+_INVALID = CrontabLine('invalid', None, None, None)
+
+
+def _task_fields(match):
+    """任务行匹配结果 → (schedule, command)，月份/星期字段含非法名称时返回 None"""
+    schedule, month, weekday, command = match.groups()
+    # 只有含字母的字段才需要检查名称（去掉数字和符号后仍有剩余）
+    if month is not None and month.strip(_FIELD_CHARS) and not _MONTH_FIELD_RE.match(month):
+        return None
+    if weekday is not None and weekday.strip(_FIELD_CHARS) and not _WEEKDAY_FIELD_RE.match(weekday):
+        return None
+    return schedule, command
+
+
+def tokenize_crontab(raw: str, validate: bool = False):
+    """
+    单遍词法分析: 每行只分类一次，供解析与验证共用，返回与行一一对应的 CrontabLine 列表
+    行首尾空白不影响分类；validate=True 时同时检查取值范围并填充 error
+    """
+    tokens = []
+    append = tokens.append
+    match_task = _TASK_RE.match
+    new = tuple.__new__
+    for line in raw.split('\n'):
+        text = line.strip()
+        if not text:
+            append(_BLANK)
+            continue
+        if text[0] == '#':
+            match = match_task(text, 1) if text[1:2] in _TASK_START else None
+            task = match and _task_fields(match)
+            if task:
+                error = validate_cron_schedule(task[0])[1] or None if validate else None
+                append(new(CrontabLine, ('disabled', task[0], task[1], error)))
+            elif validate and _DISABLED_HINT_RE.match(text, 1):
+                append(CrontabLine('comment', None, None, validate_crontab_line(text[1:])[1] or None))
+            else:
+                append(_COMMENT)
+            continue
+        match = match_task(text) if text[0] in _TASK_START else None
+        task = match and _task_fields(match)
+        if task:
+            error = validate_cron_schedule(task[0])[1] or None if validate else None
+            append(new(CrontabLine, ('task', task[0], task[1], error)))
+        elif _ENV_RE.match(text):
+            append(_ENV)
+        elif validate:
+            append(CrontabLine('invalid', None, None, validate_crontab_line(text)[1] or 'Invalid crontab line'))
+        else:
+            append(_INVALID)
+    return tokens
+
+
+def is_cron_task_line(line):
+    """判断是否为任务行（生效或禁用的 cron 任务）"""
+    return tokenize_crontab(line)[0].kind in ('task', 'disabled')
+
+
 # ===== Crontab 读写 =====
 
 
+# 同一请求内的读取结果保存在 flask.g.crontab_reads {(机器, 用户): 内容}，请求结束即丢弃
+# 跨请求的 TTL 缓存（cache.crontab_ttl，默认关闭）: (机器, 用户) -> (过期时间, 内容)，代数用于丢弃失效前发起的读取结果；
+# 失效只作用于本进程，多 worker 部署时其他 worker 可能在 TTL 内返回旧内容
+_crontab_cache: Dict[tuple, tuple] = {}
+_crontab_cache_gen: Dict[tuple, int] = {}
+_crontab_cache_lock = threading.Lock()
+
+
+def _request_reads():
+    """当前请求的读取结果，无请求上下文（后台线程）时返回 None"""
+    if not has_request_context():
+        return None
+    if 'crontab_reads' not in g:
+        g.crontab_reads = {}
+    return g.crontab_reads
+
+
+def _cache_crontab(key, content, generation=None):
+    """写入读取缓存（generation 与当前不一致说明期间已失效，丢弃）"""
+    reads = _request_reads()
+    if reads is not None:
+        reads[key] = content
+    ttl = config.CACHE_CONFIG.get('crontab_ttl', 0)
+    if ttl <= 0:
+        return
+    with _crontab_cache_lock:
+        if generation is None or _crontab_cache_gen.get(key, 0) == generation:
+            _crontab_cache[key] = (time.monotonic() + ttl, content)
+
+
+def invalidate_crontab_cache(machine_id: str, linux_user: str = ''):
+    """使指定 crontab 的读取缓存失效"""
+    key = (machine_id, linux_user)
+    reads = _request_reads()
+    if reads is not None:
+        reads.pop(key, None)
+    with _crontab_cache_lock:
+        _crontab_cache.pop(key, None)
+        _crontab_cache_gen[key] = _crontab_cache_gen.get(key, 0) + 1
+
+
 def get_crontab_raw(machine_id: str = 'local', linux_user: str = ''):
-    """获取原始 crontab 内容"""
+    """获取原始 crontab 内容（同一请求内多次读取只访问一次远程）"""
+    key = (machine_id, linux_user)
+    reads = _request_reads()
+    if reads is not None and key in reads:
+        return reads[key]
+    cached = _crontab_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    generation = _crontab_cache_gen.get(key, 0)
     executor = get_machine_executor(machine_id)
-    return executor.get_crontab(linux_user)
+    content = executor.get_crontab(linux_user)
+    _cache_crontab(key, content, generation)
+    return content
 
 
-def is_cron_task_line(line):
-    """判断是否为任务行（生效或禁用的 cron 任务）"""
-    if re.match(r'^[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+.+$', line):
-        return True
-    if re.match(r'^#[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+.+$', line):
-        return True
-    return False
+def content_hash(content: str) -> str:
+    """crontab 内容的 SHA-256（与远程 `crontab -l | sha256sum` 结果一致）"""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+
+def get_machine_crontabs(machine_id: str, linux_users=None):
+    """
+    一次远程调用获取机器上多个 Linux 用户的 crontab，返回 {用户: 内容}
+    linux_users 为 None 时返回 spool 中实际存在 crontab 的所有用户
+    """
+    executor = get_machine_executor(machine_id)
+    generations = {u: _crontab_cache_gen.get((machine_id, u), 0) for u in linux_users or []}
+    contents = executor.get_crontabs(linux_users)
+    for linux_user, content in contents.items():
+        _cache_crontab((machine_id, linux_user), content, generations.get(linux_user))
+    return contents
 
 
 def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
@@ -160,13 +309,80 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
     2. 连续多行注释（≥2行）→ 开始新组
     组名: 1行注释=组名，多行注释=倒数第二行为组名
     任务名: 任务行上方的注释行（未被选为组名则作为任务名）
+    不计算执行时间，需要 next_runs 的接口另行调用 add_next_runs
     """
-    raw = get_crontab_raw(machine_id, linux_user)
+    return parse_crontab_content(get_crontab_raw(machine_id, linux_user))
+
+
+@lru_cache(maxsize=4096)
+def _next_run_times(schedule: str, count: int, minute: datetime):
+    """(表达式, 次数, 起始分钟) → 执行时间字符串，同一分钟内相同表达式只计算一次"""
+    return [dt.strftime('%Y-%m-%d %H:%M') for dt in next_runs(schedule, count, minute)]
+
+
+def add_next_runs(groups, count: int = 3, now: datetime = None):
+    """为启用的任务填充 next_runs（'%Y-%m-%d %H:%M' 列表），禁用或无法解析的任务为空列表"""
+    minute = (now or datetime.now()).replace(second=0, microsecond=0)
+    for task in flatten_tasks(groups):
+        runs = []
+        if task['enabled']:
+            try:
+                runs = list(_next_run_times(task['schedule'], count, minute))
+            except ValueError:
+                pass
+        task['next_runs'] = runs
+    return groups
+
+
+# 解析结果 LRU 缓存: 内容哈希 -> groups（相同内容的 crontab 只解析一次）
+_parse_cache: 'OrderedDict[str, list]' = OrderedDict()
+_parse_cache_lock = threading.Lock()
+_parse_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _copy_groups(groups):
+    """复制分组结构，调用方修改结果不影响缓存"""
+    return [{**g, 'tasks': [dict(t) for t in g['tasks']]} for g in groups]
+
+
+def get_parse_cache_stats():
+    """解析缓存命中统计"""
+    with _parse_cache_lock:
+        return {**_parse_cache_stats, 'size': len(_parse_cache),
+                'max_size': config.CACHE_CONFIG.get('parse_entries', 0)}
+
+
+def parse_crontab_content(raw: str, cache: bool = True):
+    """按 parse_crontab 的分组规则解析 crontab 文本（按内容哈希缓存，cache=False 用于一次性中间内容）"""
     if not raw:
         return []
-
+    max_size = config.CACHE_CONFIG.get('parse_entries', 0)
+    if not cache or max_size <= 0:
+        return _parse_crontab_lines(raw)
+
+    key = content_hash(raw)
+    with _parse_cache_lock:
+        groups = _parse_cache.get(key)
+        if groups is not None:
+            _parse_cache.move_to_end(key)
+            _parse_cache_stats['hits'] += 1
+            return _copy_groups(groups)
+        _parse_cache_stats['misses'] += 1
+
+    groups = _parse_crontab_lines(raw)
+    with _parse_cache_lock:
+        _parse_cache[key] = groups
+        _parse_cache.move_to_end(key)
+        while len(_parse_cache) > max_size:
+            _parse_cache.popitem(last=False)
+    return _copy_groups(groups)
+
+
+def _parse_crontab_lines(raw: str):
+    """分组解析状态机"""
     groups = []
     lines = raw.split('\n')
+    tokens = tokenize_crontab(raw)
 
     comment_buffer = []
     new_group_context = True
@@ -176,17 +392,16 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
     comment_interrupted = False
     comment_after_task = False
 
-    for i, line in enumerate(lines):
-        line = line.rstrip()
-
-        if not line:
+    for i, token in enumerate(tokens):
+        kind = token.kind
+        if kind == 'blank':
             if last_non_empty_is_task:
                 new_group_context = True
             elif len(comment_buffer) > 0 and comment_after_task:
                 comment_interrupted = True
             continue
 
-        if is_cron_task_line(line):
+        if kind == 'task' or kind == 'disabled':
             start_new_group = new_group_context and len(comment_buffer) > 0
 
             if start_new_group:
@@ -212,22 +427,10 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
                     task_name = None
                     task_name_line = -1
 
-            disabled_match = re.match(
-                r'^#([\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+)\s+(.+)$', line
-            )
-            if disabled_match:
-                task = {
-                    'id': task_id, 'line': i, 'raw': line, 'enabled': False,
-                    'schedule': disabled_match.group(1), 'command': disabled_match.group(2)
-                }
-            else:
-                cron_match = re.match(
-                    r'^([\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+\s+[\d*,/-]+)\s+(.+)$', line
-                )
-                task = {
-                    'id': task_id, 'line': i, 'raw': line, 'enabled': True,
-                    'schedule': cron_match.group(1), 'command': cron_match.group(2)
-                }
+            task = {
+                'id': task_id, 'line': i, 'raw': lines[i].rstrip(), 'enabled': kind == 'task',
+                'schedule': token.schedule, 'command': token.command
+            }
 
             if task_name:
                 task['name'] = task_name
@@ -241,9 +444,9 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
             comment_interrupted = False
             comment_after_task = False
 
-        elif line.startswith('#'):
-            next_line = lines[i + 1].rstrip() if i + 1 < len(lines) else ''
-            if last_non_empty_is_task and not next_line:
+        elif kind == 'comment':
+            next_is_blank = i + 1 >= len(tokens) or tokens[i + 1].kind == 'blank'
+            if last_non_empty_is_task and next_is_blank:
                 new_group_context = True
                 last_non_empty_is_task = False
                 continue
@@ -255,7 +458,7 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
             if len(comment_buffer) == 0:
                 comment_after_task = last_non_empty_is_task
 
-            comment_buffer.append((i, line))
+            comment_buffer.append((i, lines[i].rstrip()))
 
             if len(comment_buffer) >= 2 and comment_after_task:
                 new_group_context = True
@@ -270,7 +473,11 @@ def parse_crontab(machine_id: str = 'local', linux_user: str = ''):
 
 def get_all_tasks(machine_id: str = 'local', linux_user: str = ''):
     """获取所有任务的扁平列表"""
-    groups = parse_crontab(machine_id, linux_user)
+    return flatten_tasks(parse_crontab(machine_id, linux_user))
+
+
+def flatten_tasks(groups):
+    """分组结构 → 任务扁平列表"""
     tasks = []
     for group in groups:
         tasks.extend(group['tasks'])
@@ -287,52 +494,49 @@ def find_task_by_id(task_id, tasks=None):
 # ===== 备份与保存 =====
 
 
-def cleanup_duplicate_backups(backup_subdir: str = None):
-    """清理连续且完全相同的备份"""
-    target_dir = backup_subdir or config.BACKUP_DIR
-    if not os.path.exists(target_dir):
-        return
-    backups = sorted([f for f in os.listdir(target_dir) if f.endswith('.bak')])
-    if len(backups) < 2:
-        return
-    prev_content = None
-    for bak in backups:
-        filepath = os.path.join(target_dir, bak)
-        with open(filepath, 'r') as f:
-            content = f.read()
-        if prev_content is not None and content == prev_content:
-            os.remove(filepath)
-        else:
-            prev_content = content
-
-
-def backup_crontab(username=None, machine_id: str = 'local', linux_user: str = ''):
-    """备份当前 crontab"""
+def backup_crontab(username=None, machine_id: str = 'local', linux_user: str = '', content: str = None):
+    """
+    备份当前 crontab（已持有当前内容时传入 content，避免重复远程读取）
+    内容与最新备份相同时不记录；返回新备份的文件名或 None
+    """
     if not linux_user:
         linux_user = config.DEFAULT_LINUX_USER
-    current = get_crontab_raw(machine_id, linux_user)
+    current = get_crontab_raw(machine_id, linux_user) if content is None else content
     if current:
-        backup_subdir = os.path.join(config.BACKUP_DIR, machine_id, linux_user)
-        os.makedirs(backup_subdir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        safe_user = re.sub(r'[^a-zA-Z0-9_]', '', username or 'unknown')
-        backup_file = os.path.join(backup_subdir, f'crontab_{timestamp}_{safe_user}.bak')
-        with open(backup_file, 'w') as f:
-            f.write(current)
-        cleanup_duplicate_backups(backup_subdir)
-        backups = sorted(os.listdir(backup_subdir), reverse=True)
-        for old in backups[100:]:
-            os.remove(os.path.join(backup_subdir, old))
-        return backup_file
+        entry = backups.add_backup(machine_id, linux_user, current, username)
+        return entry['filename'] if entry else None
     return None
 
 
-def save_crontab(content, username=None, machine_id: str = 'local', linux_user: str = ''):
-    """保存 crontab 内容（自动备份）"""
-    backup_crontab(username, machine_id, linux_user)
-    content = re.sub(r'\n{3,}', '\n\n', content)
+def normalize_crontab(content: str) -> str:
+    """保存前规范化内容：连续空行压缩为一行"""
+    return re.sub(r'\n{3,}', '\n\n', content)
+
+
+def save_crontab(content, username=None, machine_id: str = 'local', linux_user: str = '',
+                 base_content: str = None):
+    """
+    保存 crontab 内容（自动备份）
+
+    base_content: 本次修改所基于的 crontab 内容（调用方刚读取的）。传入时:
+    - 直接用它写备份，不再远程读取
+    - 仅当远程内容哈希仍与之一致时写入，比较与写入在同一次远程调用内完成；
+      期间被他人修改则返回 (False, SAVE_CONFLICT)
+    """
+    backup_crontab(username, machine_id, linux_user, content=base_content)
+    content = normalize_crontab(content)
     executor = get_machine_executor(machine_id)
-    return executor.save_crontab(content, linux_user)
+    try:
+        if base_content is None:
+            success, error = executor.save_crontab(content, linux_user)
+        else:
+            success, error = executor.save_crontab_if(content, linux_user, content_hash(base_content))
+    finally:
+        invalidate_crontab_cache(machine_id, linux_user)
+    if success:
+        # 各 worker 的变化检测通过备份目录中的记录识别这次写入: 仍写入备份历史，但不记为外部修改
+        backups.record_saved_hash(machine_id, linux_user or config.DEFAULT_LINUX_USER, content_hash(content))
+    return success, error
 
 
 def get_machine_params():
@@ -351,33 +555,72 @@ def get_machine_params():
 
 # ===== Crontab 变化检测 =====
 
+# 各 (机器, 用户) 上次检测后的 crontab 内容哈希（本进程）；本工具写入的版本见 backups.saved_hash
+_known_hashes: Dict[tuple, str] = {}
+
+
 
 def check_single_crontab(machine_id: str, linux_user: str):
     """检测单个 crontab 是否变化"""
     if not linux_user:
         linux_user = config.DEFAULT_LINUX_USER
-    current = get_crontab_raw(machine_id, linux_user)
-    if not current:
-        return False
+    return check_crontab_content(machine_id, linux_user, get_crontab_raw(machine_id, linux_user))
 
-    backup_subdir = os.path.join(config.BACKUP_DIR, machine_id, linux_user)
-    if not os.path.exists(backup_subdir):
-        backup_crontab('system', machine_id, linux_user)
-        return True
 
-    backups = sorted([f for f in os.listdir(backup_subdir) if f.endswith('.bak')], reverse=True)
-    if not backups:
-        backup_crontab('system', machine_id, linux_user)
-        return True
+def check_machine_crontabs(machine_id: str, linux_users):
+    """
+    检测机器上多个用户的 crontab 变化，返回发生变化的用户列表
 
-    with open(os.path.join(backup_subdir, backups[0]), 'r') as f:
-        last_backup = f.read()
+    先一次远程调用取各用户内容的哈希，与上次已知哈希相同的用户直接跳过；
+    只对哈希变化（或首次检测）的用户再一次性拉取完整内容与备份比较。
+    """
+    linux_users = [u or config.DEFAULT_LINUX_USER for u in linux_users]
+    executor = get_machine_executor(machine_id)
+    hashes = executor.get_crontab_hashes(linux_users)
+    stale = [
+        u for u in linux_users
+        if u not in hashes or hashes[u] != _known_hashes.get((machine_id, u))
+    ]
+    if not stale:
+        return []
 
-    if current != last_backup:
-        backup_crontab('system', machine_id, linux_user)
+    for linux_user in stale:
+        invalidate_crontab_cache(machine_id, linux_user)
+    # 与最新备份哈希一致（如进程重启后首次检测）的用户无需拉取内容
+    for linux_user in list(stale):
+        if linux_user in hashes and hashes[linux_user] == backups.last_backup_hash(machine_id, linux_user):
+            _known_hashes[(machine_id, linux_user)] = hashes[linux_user]
+            stale.remove(linux_user)
+    if not stale:
+        return []
+    contents = get_machine_crontabs(machine_id, stale)
+    changed = []
+    for linux_user in stale:
+        if check_crontab_content(machine_id, linux_user, contents.get(linux_user, '')):
+            changed.append(linux_user)
+        if linux_user in hashes:
+            _known_hashes[(machine_id, linux_user)] = hashes[linux_user]
+    return changed
+
+
+def check_crontab_content(machine_id: str, linux_user: str, current: str):
+    """
+    将已获取的 crontab 内容与最新备份比较（只比较哈希），有变化则备份
+    返回是否为外部修改: 本工具（任一 worker）写入的版本同样写入备份历史，但不记录 external_change_detected
+    """
+    if not current:
+        return False
+
+    last_hash = backups.last_backup_hash(machine_id, linux_user)
+    digest = content_hash(current)
+    if digest == last_hash:
+        return False
+    backup_crontab('system', machine_id, linux_user, content=current)
+    if digest == backups.saved_hash(machine_id, linux_user):
+        return False
+    if last_hash is not None:
         log_action('external_change_detected', {
             'machine': machine_id,
             'linux_user': linux_user
         })
-        return True
-    return False
+    return True
@@ -0,0 +1,92 @@
+# core/diff.py - crontab 版本差异
+# 功能: 服务端按行比较两个版本，返回紧凑的行级操作或 unified diff，结果按 (旧哈希, 新哈希, 格式, 上下文) 缓存
+# 行级操作: ['=', [行...]] 相同、['-', [行...]] 删除、['+', [行...]] 新增、['~', n] 省略 n 个相同行（指定 context 时）
+# 用法: from core.diff import diff_contents; diff_contents(old, new, fmt='lines')
+
+import difflib
+import threading
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from core import config
+from core.crontab import content_hash
+
+DIFF_FORMATS = ('lines', 'unified')
+
+# {(旧哈希, 新哈希, 格式, 上下文): 结果}
+_diff_cache = OrderedDict()
+_diff_cache_lock = threading.Lock()
+_diff_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _line_ops(old_lines, new_lines, context=None):
+    """行级操作列表与 (新增, 删除) 行数；context 为 None 时保留全部相同行"""
+    ops, added, removed = [], 0, 0
+    opcodes = SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes()
+    for n, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            same = old_lines[i1:i2]
+            head = 0 if n == 0 else context
+            tail = 0 if n == len(opcodes) - 1 else context
+            if context is not None and head + tail < len(same):
+                if head:
+                    ops.append(['=', same[:head]])
+                ops.append(['~', len(same) - head - tail])
+                if tail:
+                    ops.append(['=', same[-tail:]])
+            else:
+                ops.append(['=', same])
+            continue
+        if i2 > i1:
+            ops.append(['-', old_lines[i1:i2]])
+            removed += i2 - i1
+        if j2 > j1:
+            ops.append(['+', new_lines[j1:j2]])
+            added += j2 - j1
+    return ops, added, removed
+
+
+def _compute(old, new, fmt, context):
+    old_lines, new_lines = old.split('\n'), new.split('\n')
+    ops, added, removed = _line_ops(old_lines, new_lines, context)
+    result = {'added': added, 'removed': removed}
+    if fmt == 'unified':
+        result['diff'] = ''.join(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile='a', tofile='b', n=3 if context is None else context,
+        ))
+    else:
+        result['ops'] = ops
+    return result
+
+
+def diff_contents(old: str, new: str, fmt: str = 'lines', context: int = None):
+    """
+    比较两个版本的内容
+    fmt: lines（行级操作，供并排显示）/ unified（unified diff 文本，context 默认 3）
+    返回 {'added', 'removed', 'ops' 或 'diff'}，相同参数的结果共享，调用方不得修改
+    cache.diff_entries 为 0 时不缓存
+    """
+    if fmt not in DIFF_FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(DIFF_FORMATS)}')
+    key = (content_hash(old), content_hash(new), fmt, context)
+    with _diff_cache_lock:
+        result = _diff_cache.get(key)
+        if result is not None:
+            _diff_cache.move_to_end(key)
+            _diff_cache_stats['hits'] += 1
+            return result
+        _diff_cache_stats['misses'] += 1
+    result = _compute(old, new, fmt, context)
+    with _diff_cache_lock:
+        _diff_cache[key] = result
+        while len(_diff_cache) > config.CACHE_CONFIG.get('diff_entries', 0):
+            _diff_cache.popitem(last=False)
+    return result
+
+
+def get_diff_cache_stats():
+    """差异缓存统计"""
+    with _diff_cache_lock:
+        return {**_diff_cache_stats, 'size': len(_diff_cache),
+                'max_size': config.CACHE_CONFIG.get('diff_entries', 0)}
@@ -0,0 +1,403 @@
+# core/mutations.py - Crontab 内容变换
+# 功能: 任务/组操作的纯函数实现，单个操作路由与 /api/batch 共用
+# 约定: fn(raw, groups, **params) -> (new_raw, details)
+#       raw 为当前 crontab 文本，groups 为其 parse_crontab_content 结果，details 用于审计日志
+# 错误: 参数非法或目标不存在时抛出 ValueError，消息直接返回给前端
+
+from core.crontab import parse_crontab_content, flatten_tasks, find_task_by_id, validate_cron_schedule
+
+
+def _find_group(groups, group_id):
+    return next((g for g in groups if g['id'] == group_id), None)
+
+
+def _group_of_task(groups, task_id):
+    return next((g for g in groups if any(t['id'] == task_id for t in g['tasks'])), None)
+
+
+def _require_task(groups, task_id):
+    task = find_task_by_id(task_id, flatten_tasks(groups))
+    if not task:
+        raise ValueError('Task not found')
+    return task
+
+
+def _require_group(groups, group_id):
+    group = _find_group(groups, group_id)
+    if not group:
+        raise ValueError('Task group not found')
+    return group
+
+
+def _validate_task_fields(schedule, command):
+    """校验时间表达式与命令，返回规范化（单空格分隔）的表达式"""
+    schedule = ' '.join((schedule or '').split())
+    if not schedule or not command:
+        raise ValueError('Schedule and command cannot be empty')
+    valid, error = validate_cron_schedule(schedule)
+    if not valid:
+        raise ValueError(error)
+    return schedule
+
+
+def _join(lines):
+    return '\n'.join(l for l in lines if l is not None)
+
+
+# ===== 任务操作 =====
+
+
+def toggle_task(raw, groups, task_id, enabled=None):
+    """启用/禁用任务（enabled 为 None 时切换，否则设为指定状态）"""
+    task = _require_task(groups, task_id)
+    lines = raw.split('\n')
+    enable = not task['enabled'] if enabled is None else bool(enabled)
+    line_num = task['line']
+    if enable and not task['enabled']:
+        lines[line_num] = lines[line_num].lstrip().lstrip('#')
+    elif not enable and task['enabled']:
+        lines[line_num] = '#' + lines[line_num].lstrip()
+    return _join(lines), {
+        'task_id': task_id, 'action': 'enable' if enable else 'disable', 'command': task['command'][:50]
+    }
+
+
+def add_task(raw, groups, schedule, command):
+    """在末尾添加新任务（默认禁用）"""
+    schedule = _validate_task_fields(schedule, command)
+    new_content = raw
+    if new_content and not new_content.endswith('\n'):
+        new_content += '\n'
+    new_content += f"#{schedule} {command}\n"
+    return new_content, {'schedule': schedule, 'command': command[:50], 'enabled': False}
+
+
+def update_task(raw, groups, task_id, schedule, command):
+    """更新任务的时间表达式和命令（保持启用状态）"""
+    schedule = _validate_task_fields(schedule, command)
+    task = _require_task(groups, task_id)
+    lines = raw.split('\n')
+    new_line = f"{schedule} {command}"
+    if not task['enabled']:
+        new_line = '#' + new_line
+    lines[task['line']] = new_line
+    return _join(lines), {
+        'task_id': task_id, 'old_schedule': task['schedule'],
+        'new_schedule': schedule, 'command': command[:50]
+    }
+
+
+def update_task_name(raw, groups, task_id, name=''):
+    """更新任务名称（空名称则删除名称注释行）"""
+    new_name = (name or '').strip()
+    task = _require_task(groups, task_id)
+    lines = raw.split('\n')
+    if 'name_line' in task:
+        lines[task['name_line']] = f'# {new_name}' if new_name else None
+    elif new_name:
+        lines.insert(task['line'], f'# {new_name}')
+    return _join(lines), {'task_id': task_id, 'old_name': task.get('name', ''), 'new_name': new_name}
+
+
+def delete_task(raw, groups, task_id):
+    """删除任务（组内最后一个任务时连同组名一起删除）"""
+    task = _require_task(groups, task_id)
+    group = _group_of_task(groups, task_id)
+    lines = raw.split('\n')
+    lines[task['line']] = None
+    if 'name_line' in task:
+        lines[task['name_line']] = None
+    details = {'task_id': task_id, 'command': task['command'][:50]}
+    if len(group['tasks']) == 1:
+        details['group_deleted'] = group['title'] or f'Group {group["id"]}'
+        if group['title_line'] >= 0:
+            lines[group['title_line']] = None
+    return _join(lines), details
+
+
+# ===== 组操作 =====
+
+
+def toggle_group(raw, groups, group_id, enable=True):
+    """启用/禁用整个任务组"""
+    group = _require_group(groups, group_id)
+    lines = raw.split('\n')
+    for task in group['tasks']:
+        line_num = task['line']
+        if enable and not task['enabled']:
+            lines[line_num] = lines[line_num].lstrip().lstrip('#')
+        elif not enable and task['enabled']:
+            lines[line_num] = '#' + lines[line_num].lstrip()
+    return _join(lines), {'group_id': group_id, 'title': group['title'], 'enable': enable}
+
+
+def update_group_title(raw, groups, group_id, title):
+    """更新任务组名称"""
+    new_title = (title or '').strip()
+    if not new_title:
+        raise ValueError('Group name cannot be empty')
+    group = _require_group(groups, group_id)
+    lines = raw.split('\n')
+    if group['title_line'] >= 0:
+        lines[group['title_line']] = f"# {new_title}"
+    elif group['tasks']:
+        lines.insert(group['tasks'][0]['line'], f"# {new_title}")
+    return _join(lines), {'group_id': group_id, 'old_title': group['title'], 'new_title': new_title}
+
+
+def add_task_to_group(raw, groups, group_id, schedule, command, name='', enabled=False):
+    """在指定组末尾添加新任务"""
+    schedule = _validate_task_fields(schedule, command)
+    name = (name or '').strip()
+    group = _require_group(groups, group_id)
+    lines = raw.split('\n')
+    if group['tasks']:
+        new_lines = [f"# {name}"] if name else []
+        task_line = f"{schedule} {command}"
+        new_lines.append(task_line if enabled else '#' + task_line)
+        insert_pos = group['tasks'][-1]['line'] + 1
+        lines[insert_pos:insert_pos] = new_lines
+    details = {'group_id': group_id, 'group_title': group['title'], 'schedule': schedule, 'command': command[:50]}
+    if name:
+        details['name'] = name
+    return _join(lines), details
+
+
+def create_group(raw, groups, title):
+    """在末尾创建新任务组（带一个禁用的占位任务）"""
+    title = (title or '').strip()
+    if not title:
+        raise ValueError('Group name cannot be empty')
+    new_content = raw
+    if new_content and not new_content.endswith('\n'):
+        new_content += '\n'
+    if new_content.strip():
+        new_content += '\n'
+    new_content += f"# {title}\n"
+    new_content += "#* * * * * echo 'placeholder - please edit'\n"
+    return new_content, {'title': title}
+
+
+def delete_group(raw, groups, group_id):
+    """删除整个任务组"""
+    group = _require_group(groups, group_id)
+    lines = raw.split('\n')
+    if group['title_line'] >= 0:
+        lines[group['title_line']] = None
+    for task in group['tasks']:
+        lines[task['line']] = None
+    return _join(lines), {'group_id': group_id, 'title': group['title']}
+
+
+# ===== 排序 =====
+
+
+def reorder_groups(raw, groups, from_id, to_id, insert_before=True):
+    """将组 from_id 移动到组 to_id 之前/之后"""
+    from_group = _find_group(groups, from_id)
+    to_group = _find_group(groups, to_id)
+    if not from_group or not to_group:
+        raise ValueError('Group not found')
+    lines = raw.split('\n')
+
+    from_lines = []
+    if from_group['title_line'] >= 0:
+        from_lines.append((from_group['title_line'], lines[from_group['title_line']]))
+    for task in from_group['tasks']:
+        from_lines.append((task['line'], lines[task['line']]))
+    from_lines.sort(key=lambda x: x[0])
+
+    for line_num, _ in from_lines:
+        lines[line_num] = None
+
+    if insert_before:
+        if to_group['title_line'] >= 0:
+            insert_pos = to_group['title_line']
+        elif to_group['tasks']:
+            insert_pos = to_group['tasks'][0]['line']
+        else:
+            insert_pos = 0
+    else:
+        if to_group['tasks']:
+            insert_pos = to_group['tasks'][-1]['line'] + 1
+        elif to_group['title_line'] >= 0:
+            insert_pos = to_group['title_line'] + 1
+        else:
+            insert_pos = len(lines)
+
+    removed_before = sum(1 for ln, _ in from_lines if ln < insert_pos)
+    insert_pos -= removed_before
+    new_lines = [l for l in lines if l is not None]
+    insert_pos = min(insert_pos, len(new_lines))
+
+    for i, (_, content) in enumerate(from_lines):
+        new_lines.insert(insert_pos + i, content)
+
+    insert_end = insert_pos + len(from_lines)
+    if insert_end < len(new_lines) and new_lines[insert_end].strip():
+        new_lines.insert(insert_end, '')
+    if insert_pos > 0 and new_lines[insert_pos - 1].strip():
+        new_lines.insert(insert_pos, '')
+
+    return '\n'.join(new_lines), {
+        'group_id': from_id, 'title': from_group.get('title', ''), 'to_group_id': to_id
+    }
+
+
+def move_task_to_end(raw, groups, task_id, to_group_id):
+    """将任务移动到指定组的末尾（源组只剩该任务时删除源组名）"""
+    from_task = _require_task(groups, task_id)
+    to_group = _find_group(groups, to_group_id)
+    if not to_group:
+        raise ValueError('Target group not found')
+    from_group = _group_of_task(groups, task_id)
+    lines = raw.split('\n')
+
+    from_line = from_task['line']
+    content = lines[from_line]
+
+    if from_group['id'] != to_group_id and len(from_group['tasks']) == 1 and from_group['title_line'] >= 0:
+        lines[from_group['title_line']] = None
+
+    lines[from_line] = None
+    new_lines = [l for l in lines if l is not None]
+
+    if to_group['tasks']:
+        last_task_line = to_group['tasks'][-1]['line']
+        if from_line < last_task_line:
+            insert_pos = last_task_line
+        else:
+            insert_pos = last_task_line + 1
+        insert_pos = min(insert_pos, len(new_lines))
+    else:
+        if to_group['title_line'] >= 0:
+            insert_pos = to_group['title_line']
+            if from_line < to_group['title_line']:
+                insert_pos -= 1
+            insert_pos += 1
+        else:
+            insert_pos = len(new_lines)
+
+    new_lines.insert(insert_pos, content)
+    return '\n'.join(new_lines), {
+        'task_id': task_id, 'from_group': from_group['id'],
+        'to_group': to_group_id, 'command': from_task['command'][:50]
+    }
+
+
+def reorder_tasks(raw, groups, from_task_id, to_task_id, insert_before=True):
+    """将任务（连同任务名）移动到另一任务之前/之后，可跨组"""
+    from_task = find_task_by_id(from_task_id, flatten_tasks(groups))
+    to_task = find_task_by_id(to_task_id, flatten_tasks(groups))
+    if not from_task or not to_task:
+        raise ValueError('Task not found')
+    from_group = _group_of_task(groups, from_task_id)
+    to_group = _group_of_task(groups, to_task_id)
+    lines = raw.split('\n')
+
+    from_line = from_task['line']
+    to_line = to_task['line']
+
+    lines_to_move = []
+    lines_to_remove = [from_line]
+    if 'name_line' in from_task:
+        name_line = from_task['name_line']
+        lines_to_move.append(lines[name_line])
+        lines_to_remove.append(name_line)
+    lines_to_move.append(lines[from_line])
+
+    if from_group['id'] != to_group['id'] and len(from_group['tasks']) == 1 and from_group['title_line'] >= 0:
+        lines_to_remove.append(from_group['title_line'])
+
+    for ln in lines_to_remove:
+        lines[ln] = None
+
+    if insert_before and 'name_line' in to_task:
+        target_line = to_task['name_line']
+    else:
+        target_line = to_line
+
+    removed_before_target = sum(1 for ln in lines_to_remove if ln < target_line)
+
+    if insert_before:
+        insert_pos = target_line - removed_before_target
+    else:
+        insert_pos = target_line - removed_before_target + 1
+
+    new_lines = [l for l in lines if l is not None]
+    insert_pos = max(0, min(insert_pos, len(new_lines)))
+
+    for i, content in enumerate(lines_to_move):
+        new_lines.insert(insert_pos + i, content)
+
+    return '\n'.join(new_lines), {
+        'task_id': from_task_id, 'from_group': from_group['id'],
+        'to_group': to_group['id'], 'command': from_task['command'][:50]
+    }
+
+
+# ===== 批量操作 =====
+
+def _move(raw, groups, task_id, to_task_id=None, to_group_id=None, insert_before=True):
+    """批量 move: 指定 to_task_id 时移到该任务前/后，否则移到 to_group_id 组末尾"""
+    if to_task_id is not None:
+        return reorder_tasks(raw, groups, task_id, to_task_id, insert_before)
+    if to_group_id is None:
+        raise ValueError('to_task_id or to_group_id is required')
+    return move_task_to_end(raw, groups, task_id, to_group_id)
+
+
+def _rename(raw, groups, group_id=None, title=None, task_id=None, name=None):
+    """批量 rename: group_id + title 重命名组，task_id + name 重命名任务"""
+    if group_id is not None:
+        return update_group_title(raw, groups, group_id, title)
+    if task_id is None:
+        raise ValueError('group_id or task_id is required')
+    return update_task_name(raw, groups, task_id, name)
+
+
+MAX_BATCH_OPERATIONS = 500
+
+# 批量操作名 -> (变换函数, 必填参数, 可选参数)
+BATCH_OPERATIONS = {
+    'toggle': (toggle_task, ('task_id',), ('enabled',)),
+    'update': (update_task, ('task_id', 'schedule', 'command'), ()),
+    'delete': (delete_task, ('task_id',), ()),
+    'move': (_move, ('task_id',), ('to_task_id', 'to_group_id', 'insert_before')),
+    'rename': (_rename, (), ('group_id', 'title', 'task_id', 'name')),
+    'add_to_group': (add_task_to_group, ('group_id', 'schedule', 'command'), ('name', 'enabled')),
+    'toggle_group': (toggle_group, ('group_id',), ('enable',)),
+}
+
+
+def apply_operations(raw, operations, groups=None):
+    """
+    在内存中按顺序对同一份 crontab 应用多个操作，返回 (new_raw, [details])
+
+    每个操作为 {"op": 名称, ...参数}；任务/组 ID 按执行到该操作时的文档解析
+    （删除或移动会改变之后的编号）。任一操作失败抛出 ValueError，整批不生效。
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('Operations must be a non-empty list')
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f'Too many operations (max {MAX_BATCH_OPERATIONS})')
+    if groups is None:
+        groups = parse_crontab_content(raw)
+    all_details = []
+    for index, operation in enumerate(operations, 1):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op not in BATCH_OPERATIONS:
+            raise ValueError(f'Operation {index}: unknown op {op!r}')
+        fn, required, optional = BATCH_OPERATIONS[op]
+        missing = [name for name in required if operation.get(name) is None]
+        if missing:
+            raise ValueError(f'Operation {index} ({op}): missing {", ".join(missing)}')
+        params = {name: operation[name] for name in required + optional if operation.get(name) is not None}
+        try:
+            raw, details = fn(raw, groups, **params)
+        except ValueError as e:
+            raise ValueError(f'Operation {index} ({op}): {e}')
+        all_details.append({'op': op, **details})
+        # 中间状态只用一次，不进入解析缓存
+        groups = parse_crontab_content(raw, cache=False)
+    return raw, all_details
@@ -2,8 +2,9 @@
 # 功能: 提供 api_success / api_error 辅助函数，确保所有 API 返回一致的 JSON 结构
 # 成功: {"success": true, ...extra_fields}
 # 失败: {"success": false, "error": "message"}
+# 版本: api_versioned 附带 ETag（内容哈希），支持 If-None-Match 条件请求
 
-from flask import jsonify
+from flask import jsonify, make_response, request
 
 
 def api_success(**kwargs):
@@ -30,3 +31,23 @@ def api_error(error, status_code=400):
         return api_error('无权限', 403)
     """
     return jsonify({'success': False, 'error': error}), status_code
+
+
+def api_versioned(version, **kwargs):
+    """
+    带版本（强 ETag）的成功响应
+
+    请求头 If-None-Match 与 version 匹配时返回 304 空响应；
+    否则返回 {"success": true, "version": version, ...}，客户端可将 version
+    作为保存时的 If-Match 前置条件。
+
+    用法:
+        return api_versioned(content_hash(raw), content=raw)
+    """
+    if request.if_none_match.contains(version):
+        resp = make_response('', 304)
+    else:
+        resp = api_success(version=version, **kwargs)
+    resp.set_etag(version)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
@@ -0,0 +1,155 @@
+# core/schedule.py - Cron 表达式编译与下次执行时间计算
+# 功能: 表达式 → 各字段位图（按表达式缓存），按 Vixie cron 规则计算接下来 N 次执行时间
+# 说明: 时间均为本机本地时间（naive datetime）
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], 1)}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+
+MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# (名称, 最小值, 最大值, 名称表)
+FIELDS = [
+    ('minute', 0, 59, None),
+    ('hour', 0, 23, None),
+    ('day', 1, 31, None),
+    ('month', 1, 12, MONTH_NAMES),
+    ('weekday', 0, 7, WEEKDAY_NAMES),
+]
+
+# 找不到执行时间时最多向后搜索的年数（如 2 月 30 日）
+MAX_SEARCH_YEARS = 8
+
+# 各字段位图: 第 n 位为 1 表示取值 n 匹配
+# dom_star/dow_star: 日/星期字段以 * 开头，Vixie cron 据此决定两字段取交集还是并集
+CompiledSchedule = namedtuple('CompiledSchedule', 'minutes hours days months weekdays dom_star dow_star')
+
+
+def _parse_value(value, names):
+    value = value.lower()
+    if names and value in names:
+        return names[value]
+    return int(value)
+
+
+def _compile_field(field, min_val, max_val, names):
+    """单个字段 → 位图"""
+    mask = 0
+    for part in field.split(','):
+        range_part, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError(f'invalid step: {part}')
+        if range_part == '*':
+            start, end = min_val, max_val
+        elif '-' in range_part:
+            start, end = (_parse_value(v, names) for v in range_part.split('-', 1))
+        else:
+            start = _parse_value(range_part, names)
+            # Vixie: "N/step" 表示从 N 到最大值
+            end = max_val if '/' in part else start
+        if not (min_val <= start <= max_val and min_val <= end <= max_val) or start > end:
+            raise ValueError(f'out of range: {part}')
+        for n in range(start, end + 1, step):
+            mask |= 1 << n
+    return mask
+
+
+@lru_cache(maxsize=1024)
+def compile_schedule(schedule: str):
+    """
+    编译 cron 表达式（5 字段或 @daily 等宏），结果按表达式缓存
+    @reboot 返回 None（没有周期执行时间），格式错误抛出 ValueError
+    """
+    schedule = schedule.strip()
+    if schedule.startswith('@'):
+        if schedule.lower() == '@reboot':
+            return None
+        if schedule.lower() not in MACROS:
+            raise ValueError(f'Unknown macro: {schedule}')
+        schedule = MACROS[schedule.lower()]
+    parts = schedule.split()
+    if len(parts) != 5:
+        raise ValueError('Cron expression must have 5 fields')
+
+    masks = []
+    for part, (name, min_val, max_val, names) in zip(parts, FIELDS):
+        try:
+            masks.append(_compile_field(part, min_val, max_val, names))
+        except ValueError:
+            raise ValueError(f'Invalid {name}: {part} (valid: {min_val}-{max_val})')
+    minutes, hours, days, months, weekdays = masks
+    # 星期 7 等同于 0（周日）
+    if weekdays & (1 << 7):
+        weekdays = (weekdays | 1) & ~(1 << 7)
+    return CompiledSchedule(minutes, hours, days, months, weekdays,
+                            parts[2].startswith('*'), parts[4].startswith('*'))
+
+
+def _next_bit(mask, n):
+    """mask 中 >= n 的最小置位，没有则返回 None"""
+    rest = mask >> n
+    if not rest:
+        return None
+    return n + (rest & -rest).bit_length() - 1
+
+
+def day_matches(compiled, dt):
+    """日期是否满足日/星期字段（月份另行判断）"""
+    in_dom = bool(compiled.days >> dt.day & 1)
+    # datetime.weekday(): 周一=0 → cron: 周日=0
+    in_dow = bool(compiled.weekdays >> ((dt.weekday() + 1) % 7) & 1)
+    if compiled.dom_star or compiled.dow_star:
+        return in_dom and in_dow
+    return in_dom or in_dow
+
+
+def next_runs(schedule: str, count: int = 1, start: datetime = None):
+    """
+    计算 start（默认当前时间）之后的 count 次执行时间（不含 start 所在分钟）
+    @reboot 或在搜索范围内不会执行的表达式返回 []
+    """
+    compiled = compile_schedule(schedule)
+    if compiled is None or count <= 0:
+        return []
+    dt = (start or datetime.now()).replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit_year = dt.year + MAX_SEARCH_YEARS
+    runs = []
+
+    while len(runs) < count and dt.year <= limit_year:
+        if not compiled.months >> dt.month & 1:
+            month = _next_bit(compiled.months, dt.month + 1)
+            if month is None:
+                dt = dt.replace(year=dt.year + 1, month=1, day=1, hour=0, minute=0)
+            else:
+                dt = dt.replace(month=month, day=1, hour=0, minute=0)
+            continue
+        if not day_matches(compiled, dt):
+            dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        hour = _next_bit(compiled.hours, dt.hour)
+        if hour is None:
+            dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        if hour != dt.hour:
+            dt = dt.replace(hour=hour, minute=0)
+        minute = _next_bit(compiled.minutes, dt.minute)
+        if minute is None:
+            dt = dt.replace(minute=0) + timedelta(hours=1)
+            continue
+        dt = dt.replace(minute=minute)
+        runs.append(dt)
+        dt += timedelta(minutes=1)
+    return runs
@@ -1,29 +1,197 @@
 # core/watcher.py - 后台监控线程
-# 功能: crontab 变化检测线程 + at 历史检测线程
+# 功能: crontab 变化检测线程 + at 历史检测线程（兼做过期 at 历史与未引用备份对象的定期清理）
+# 调度: 每台机器独立调度（间隔带抖动），有界线程池并发检测，失败指数退避
 
 import time
+import queue
+import random
 import threading
+from collections import deque
 from core import config
-from core.crontab import check_single_crontab
+from core.crontab import check_machine_crontabs
 from core.at_jobs import check_at_done_files, cleanup_at_history
+from core.backups import prune_objects_if_due
 
 
-def start_crontab_watcher():
-    """启动后台线程定时检测 crontab 变化"""
-    def watch_loop():
+def _percentile(sorted_values, pct):
+    """已排序列表的百分位数"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+
+class CrontabWatcher:
+    """
+    并发 crontab 变化检测器
+
+    - 调度线程每秒检查到期机器，放入队列由 max_workers 个工作线程执行
+    - 每台机器下次检测时间 = 间隔 × (1 ± jitter)，首次检测在一个间隔内随机分散
+    - 检测失败或超过 deadline 视为失败，间隔按 2^失败次数 退避，上限 max_backoff
+    - 同一机器同一时间最多一个检测在执行，超时的检测结束前不会重复提交
+    """
+
+    def __init__(self, interval=60, max_workers=16, deadline=30, jitter=0.1, max_backoff=900):
+        self.interval = interval
+        self.max_workers = max(1, int(max_workers))
+        self.deadline = deadline
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._machines = {}
+        self._durations = deque(maxlen=1000)
+        self._cycle_durations = deque(maxlen=100)
+        self._cycle_started = None
+        self._cycle_pending = set()
+        self._counters = {'checks': 0, 'failures': 0, 'timeouts': 0, 'changes': 0}
+
+    def _machine_state(self, machine_id, now):
+        state = self._machines.get(machine_id)
+        if state is None:
+            state = {
+                'next_due': now + random.uniform(0, self.interval),
+                'running_since': None, 'timed_out': False,
+                'failures': 0, 'last_success': None, 'last_error': None, 'last_duration': None,
+            }
+            self._machines[machine_id] = state
+        return state
+
+    def _next_delay(self, failures):
+        delay = self.interval if failures == 0 else min(self.max_backoff, self.interval * 2 ** failures)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def tick(self, now=None):
+        """提交到期的机器检测，并标记超过 deadline 的检测"""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._cycle_started is None:
+                self._cycle_started = now
+                self._cycle_pending = set(config.MACHINES)
+            for machine_id, machine_config in config.MACHINES.items():
+                state = self._machine_state(machine_id, now)
+                if state['running_since'] is not None:
+                    if not state['timed_out'] and now - state['running_since'] > self.deadline:
+                        state['timed_out'] = True
+                        state['failures'] += 1
+                        state['last_error'] = f'deadline exceeded ({self.deadline}s)'
+                        self._counters['timeouts'] += 1
+                        self._counters['failures'] += 1
+                        self._finish_cycle_member(machine_id, now)
+                    continue
+                if now >= state['next_due']:
+                    state['running_since'] = now
+                    state['timed_out'] = False
+                    users = machine_config.get('linux_users', [config.DEFAULT_LINUX_USER])
+                    self._queue.put((machine_id, users))
+
+    def _finish_cycle_member(self, machine_id, now):
+        """一轮检测: 从开始到所有机器都完成（或超时）至少一次检测"""
+        self._cycle_pending.discard(machine_id)
+        if not self._cycle_pending and self._cycle_started is not None:
+            self._cycle_durations.append(now - self._cycle_started)
+            self._cycle_started = None
+
+    def _check(self, machine_id, users):
+        started = time.time()
+        error = None
+        changed = []
+        try:
+            changed = check_machine_crontabs(machine_id, users)
+        except Exception as e:
+            error = str(e)
+            print(f"[crontab-watch] {machine_id}: {e}")
+        now = time.time()
+        with self._lock:
+            state = self._machine_state(machine_id, now)
+            duration = now - started
+            self._durations.append(duration)
+            self._counters['checks'] += 1
+            self._counters['changes'] += len(changed)
+            state['last_duration'] = round(duration, 3)
+            if error is None and not state['timed_out']:
+                state['failures'] = 0
+                state['last_success'] = now
+                state['last_error'] = None
+            elif not state['timed_out']:
+                state['failures'] += 1
+                state['last_error'] = error
+                self._counters['failures'] += 1
+            state['running_since'] = None
+            state['timed_out'] = False
+            state['next_due'] = now + self._next_delay(state['failures'])
+            self._finish_cycle_member(machine_id, now)
+
+    def _worker_loop(self):
         while True:
+            machine_id, users = self._queue.get()
             try:
-                for machine_id, machine_config in config.MACHINES.items():
-                    users = machine_config.get('linux_users', [config.DEFAULT_LINUX_USER])
-                    for linux_user in users:
-                        check_single_crontab(machine_id, linux_user)
+                self._check(machine_id, users)
             except Exception as e:
                 print(f"[crontab-watch] Error: {e}")
-            time.sleep(60)
 
-    thread = threading.Thread(target=watch_loop, daemon=True, name='crontab-watcher')
-    thread.start()
-    print("[crontab-watch] Watcher thread started")
+    def _schedule_loop(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[crontab-watch] Error: {e}")
+            time.sleep(1)
+
+    def start(self):
+        for i in range(self.max_workers):
+            threading.Thread(target=self._worker_loop, daemon=True, name=f'crontab-check-{i}').start()
+        threading.Thread(target=self._schedule_loop, daemon=True, name='crontab-watcher').start()
+
+    def stats(self):
+        """检测耗时与失败统计"""
+        now = time.time()
+        with self._lock:
+            durations = sorted(self._durations)
+            cycles = list(self._cycle_durations)
+            staleness = [now - s['last_success'] for s in self._machines.values() if s['last_success']]
+            failing = [
+                {
+                    'machine_id': mid, 'failures': s['failures'], 'error': s['last_error'],
+                    'next_check_in': round(max(0, s['next_due'] - now), 1)
+                }
+                for mid, s in self._machines.items() if s['failures']
+            ]
+            return {
+                'machines': len(self._machines),
+                'workers': self.max_workers,
+                'in_flight': sum(1 for s in self._machines.values() if s['running_since'] is not None),
+                'queued': self._queue.qsize(),
+                **self._counters,
+                'check_seconds': {
+                    'p50': _percentile(durations, 50),
+                    'p95': _percentile(durations, 95),
+                    'max': round(durations[-1], 3) if durations else None,
+                },
+                'cycle_seconds': {
+                    'last': round(cycles[-1], 3) if cycles else None,
+                    'avg': round(sum(cycles) / len(cycles), 3) if cycles else None,
+                    'max': round(max(cycles), 3) if cycles else None,
+                },
+                'max_staleness': round(max(staleness), 1) if staleness else None,
+                'failing': sorted(failing, key=lambda x: -x['failures']),
+            }
+
+
+_crontab_watcher = None
+
+
+def get_watcher_stats():
+    """获取 crontab 检测线程统计（未启动时返回 None）"""
+    return _crontab_watcher.stats() if _crontab_watcher else None
+
+
+def start_crontab_watcher():
+    """启动后台线程定时检测 crontab 变化"""
+    global _crontab_watcher
+    _crontab_watcher = CrontabWatcher(**config.WATCHER_CONFIG)
+    _crontab_watcher.start()
+    print(f"[crontab-watch] Watcher started ({_crontab_watcher.max_workers} workers)")
 
 
 def start_at_history_watcher():
@@ -34,6 +202,8 @@ def start_at_history_watcher():
             time.sleep(30)
             try:
                 check_at_done_files()
+                # 上次清理时间记录在备份目录中，所有 worker 合计每个间隔只清理一次
+                prune_objects_if_due(config.BACKUP_CONFIG['prune_interval'])
                 cleanup_counter += 1
                 if cleanup_counter >= 120:
                     cleanup_at_history()
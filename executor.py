@@ -1,11 +1,22 @@
 # executor.py - Crontab 执行器抽象层
 # 功能: 统一本地和远程 crontab 操作接口
 # 认证: SSH 密钥认证
+# 并发: SSH 连接按机器复用，命令在同一连接的多个 channel 上并发执行
+# 模拟: type=simulated 的机器使用进程内 crontab/atq 存储（压测用，见 SimulatedExecutor）
 # 用法: executor = get_executor(machine_config); executor.get_crontab(linux_user)
 
 from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+import hashlib
+import random
+import re
+import secrets
+import shlex
+import socket
 import subprocess
-from typing import Tuple, Optional
+import threading
+import time
+from typing import Dict, List, Tuple, Optional
 
 try:
     import paramiko
@@ -13,6 +24,92 @@ try:
 except ImportError:
     HAS_PARAMIKO = False
 
+# 列出 cron spool 中实际存在 crontab 的用户（Debian: crontabs 子目录，RHEL: 直接位于 /var/spool/cron）
+SPOOL_USERS_COMMAND = (
+    'd=/var/spool/cron/crontabs; [ -d "$d" ] || d=/var/spool/cron; '
+    'ls -1p "$d" 2>/dev/null | grep -v /'
+)
+
+
+# 读取循环变量 $u 对应用户的 crontab（$u 为空时读取当前用户）
+_READ_USER_CRONTAB = 'if [ -n "$u" ]; then crontab -u "$u" -l; else crontab -l; fi 2>/dev/null'
+
+
+def _for_each_user(users: Optional[List[str]], body: str) -> str:
+    """构造遍历用户的 shell 循环，users 为 None 时遍历 spool 中存在 crontab 的用户"""
+    if users is None:
+        user_list = f'$({SPOOL_USERS_COMMAND})'
+    else:
+        user_list = ' '.join(shlex.quote(u) for u in users)
+    return f'for u in {user_list}; do {body} done'
+
+
+def build_crontabs_script(users: Optional[List[str]], marker: str) -> str:
+    """
+    构造一次性读取多个用户 crontab 的 shell 脚本
+
+    每个用户的输出格式:
+        <marker> BEGIN <user>
+        <crontab 内容>
+        <marker> END <返回码>
+    users 为 None 时读取 spool 中所有存在 crontab 的用户
+    """
+    return f"m={shlex.quote(marker)}; " + _for_each_user(
+        users,
+        "printf '%s BEGIN %s\\n' \"$m\" \"$u\"; "
+        f"{_READ_USER_CRONTAB}; "
+        "printf '\\n%s END %s\\n' \"$m\" \"$?\";"
+    )
+
+
+def parse_crontabs_output(output: str, marker: str) -> Dict[str, str]:
+    """解析 build_crontabs_script 的输出，返回 {用户: crontab 内容}，无 crontab 的用户为空字符串"""
+    m = re.escape(marker)
+    pattern = re.compile(rf'^{m} BEGIN ([^\n]*)\n(.*?)\n{m} END (\d+)$', re.M | re.S)
+    return {
+        match.group(1): match.group(2) if match.group(3) == '0' else ''
+        for match in pattern.finditer(output)
+    }
+
+
+def build_hashes_script(users: List[str], marker: str) -> str:
+    """
+    构造一次性计算多个用户 crontab SHA-256 的 shell 脚本
+    每个用户输出一行: <marker>\t<user>\t<sha256>  -（无 crontab 时为空内容的哈希）
+    """
+    return f"m={shlex.quote(marker)}; " + _for_each_user(
+        users,
+        "printf '%s\\t%s\\t' \"$m\" \"$u\"; "
+        f"{_READ_USER_CRONTAB} | {{ sha256sum 2>/dev/null || shasum -a 256; }};"
+    )
+
+
+def parse_hashes_output(output: str, marker: str) -> Dict[str, str]:
+    """解析 build_hashes_script 的输出，返回 {用户: 十六进制哈希}"""
+    result = {}
+    for line in output.split('\n'):
+        parts = line.split('\t')
+        if len(parts) == 3 and parts[0] == marker:
+            digest = parts[2].split(' ')[0].lower()
+            if re.fullmatch(r'[0-9a-f]{64}', digest):
+                result[parts[1]] = digest
+    return result
+
+
+CONFLICT_MARKER = '@@CRONTAB-CONFLICT@@'
+SAVE_CONFLICT = 'Crontab has been modified since it was loaded, please reload'
+
+
+def build_save_if_script(linux_user: str, expected_hash: str) -> str:
+    """构造比较并写入的 shell 脚本: 当前内容哈希与 expected_hash 一致时才从 stdin 写入 crontab"""
+    user = shlex.quote(linux_user) if linux_user else "''"
+    return (
+        f"u={user}; "
+        f"cur=$({_READ_USER_CRONTAB} | {{ sha256sum 2>/dev/null || shasum -a 256; }} | cut -d' ' -f1); "
+        f"if [ \"$cur\" != {shlex.quote(expected_hash)} ]; then echo {shlex.quote(CONFLICT_MARKER)} >&2; exit 75; fi; "
+        'if [ -n "$u" ]; then crontab -u "$u" -; else crontab -; fi'
+    )
+
 
 class CrontabExecutor(ABC):
     """Crontab 执行器抽象基类"""
@@ -33,10 +130,53 @@ class CrontabExecutor(ABC):
         pass
 
     @abstractmethod
-    def run_command(self, command: str) -> Tuple[int, str, str]:
-        """运行命令，返回 (返回码, stdout, stderr)"""
+    def run_command(self, command: str, input_data: Optional[str] = None) -> Tuple[int, str, str]:
+        """运行命令（input_data 写入 stdin），返回 (返回码, stdout, stderr)"""
         pass
 
+    def get_crontabs(self, users: Optional[List[str]] = None) -> Dict[str, str]:
+        """
+        一次远程调用获取多个用户的 crontab，返回 {用户: 内容}
+        users 为 None 时返回 spool 中所有存在 crontab 的用户
+        """
+        if users is not None and not users:
+            return {}
+        marker = f'@@CRONTAB-{secrets.token_hex(8)}'
+        _, stdout, _ = self.run_command(build_crontabs_script(users, marker))
+        result = parse_crontabs_output(stdout, marker)
+        for user in users or []:
+            if user not in result:
+                result[user] = self.get_crontab(user)
+        return result
+
+    def save_crontab_if(self, content: str, linux_user: str, expected_hash: str) -> Tuple[bool, str]:
+        """
+        仅当远程 crontab 内容的 SHA-256 仍为 expected_hash 时保存（比较与写入在同一次远程调用内）
+        返回 (成功, 错误信息)，内容已被他人修改时错误信息为 SAVE_CONFLICT
+        """
+        returncode, _, stderr = self.run_command(build_save_if_script(linux_user, expected_hash), input_data=content)
+        if returncode != 0 and CONFLICT_MARKER in stderr:
+            return False, SAVE_CONFLICT
+        return returncode == 0, stderr
+
+    def get_crontab_hashes(self, users: List[str]) -> Dict[str, str]:
+        """
+        一次远程调用获取多个用户 crontab 内容的 SHA-256，返回 {用户: 哈希}
+        远程无法计算哈希的用户不出现在结果中
+        """
+        if not users:
+            return {}
+        marker = f'@@CRONTAB-{secrets.token_hex(8)}'
+        _, stdout, _ = self.run_command(build_hashes_script(users, marker))
+        return parse_hashes_output(stdout, marker)
+
+    def list_crontab_users(self) -> List[str]:
+        """列出 spool 中实际存在 crontab 文件的用户"""
+        returncode, stdout, _ = self.run_command(SPOOL_USERS_COMMAND)
+        if returncode != 0:
+            return []
+        return [line.strip() for line in stdout.split('\n') if line.strip()]
+
     def close(self):
         """关闭连接（如有）"""
         pass
@@ -71,11 +211,12 @@ class LocalExecutor(CrontabExecutor):
         """本地连接始终成功"""
         return True, 'localhost'
 
-    def run_command(self, command: str) -> Tuple[int, str, str]:
+    def run_command(self, command: str, input_data: Optional[str] = None) -> Tuple[int, str, str]:
         """运行本地命令"""
         result = subprocess.run(
             command,
             shell=True,
+            input=input_data,
             capture_output=True,
             text=True,
             timeout=120
@@ -84,83 +225,323 @@ class LocalExecutor(CrontabExecutor):
 
 
 class SSHExecutor(CrontabExecutor):
-    """SSH 远程 crontab 执行器"""
+    """
+    SSH 远程 crontab 执行器
+
+    每台机器维护一条已认证的 SSH 连接（Transport），每个命令在其上开独立的
+    exec channel，多个线程可并发执行命令，互不阻塞。
+    max_channels 限制同一连接上的并发 channel 数（OpenSSH 默认 MaxSessions=10）。
+    """
 
-    def __init__(self, host: str, port: int, ssh_user: str, ssh_key: str):
+    def __init__(self, host: str, port: int, ssh_user: str, ssh_key: str,
+                 max_channels: int = 4, keepalive: int = 30, connect_timeout: int = 10):
         if not HAS_PARAMIKO:
             raise ImportError('paramiko is required for SSH connections. Install with: pip install paramiko')
         self.host = host
         self.port = port
         self.ssh_user = ssh_user
         self.ssh_key = ssh_key
+        self.max_channels = max(1, int(max_channels))
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
         self._client: Optional[paramiko.SSHClient] = None
+        self._lock = threading.Lock()
+        self._channel_slots = threading.BoundedSemaphore(self.max_channels)
+
+    def _get_transport(self) -> 'paramiko.Transport':
+        """获取或创建已认证的 SSH 连接（线程安全，断线自动重连）"""
+        with self._lock:
+            transport = self._client.get_transport() if self._client else None
+            if transport is None or not transport.is_active():
+                if self._client:
+                    self._client.close()
+                    self._client = None
+                client = paramiko.SSHClient()
+                client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                client.connect(
+                    hostname=self.host,
+                    port=self.port,
+                    username=self.ssh_user,
+                    key_filename=self.ssh_key,
+                    timeout=self.connect_timeout,
+                    banner_timeout=self.connect_timeout,
+                    auth_timeout=self.connect_timeout
+                )
+                transport = client.get_transport()
+                # 每个命令都是若干小包往返，关闭 Nagle 避免与对端延迟 ACK 叠加出 ~40ms 的停顿
+                try:
+                    transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except (OSError, AttributeError):
+                    pass
+                if self.keepalive:
+                    transport.set_keepalive(self.keepalive)
+                self._client = client
+            return transport
 
-    def _get_client(self) -> 'paramiko.SSHClient':
-        """获取或创建 SSH 客户端"""
-        if self._client is None or not self._client.get_transport() or not self._client.get_transport().is_active():
-            self._client = paramiko.SSHClient()
-            self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self._client.connect(
-                hostname=self.host,
-                port=self.port,
-                username=self.ssh_user,
-                key_filename=self.ssh_key,
-                timeout=10
-            )
-        return self._client
+    def _exec(self, command: str, input_data: Optional[str] = None, timeout: int = 120) -> Tuple[int, str, str]:
+        """在新 channel 上执行命令，返回 (返回码, stdout, stderr)"""
+        with self._channel_slots:
+            transport = self._get_transport()
+            channel = transport.open_session(timeout=self.connect_timeout)
+            try:
+                channel.settimeout(timeout)
+                channel.exec_command(command)
+                if input_data is not None:
+                    channel.sendall(input_data.encode('utf-8'))
+                channel.shutdown_write()
+                # 先读完输出再取退出码，避免输出填满窗口时互相等待
+                stdout = channel.makefile('rb').read()
+                stderr = channel.makefile_stderr('rb').read()
+                exit_status = channel.recv_exit_status()
+            finally:
+                channel.close()
+        return exit_status, stdout.decode('utf-8', errors='replace'), stderr.decode('utf-8', errors='replace')
 
     def get_crontab(self, linux_user: str = '') -> str:
         """获取远程 crontab"""
-        client = self._get_client()
         cmd = f'crontab -u {linux_user} -l' if linux_user else 'crontab -l'
-        stdin, stdout, stderr = client.exec_command(cmd)
-        exit_status = stdout.channel.recv_exit_status()
+        exit_status, stdout, _ = self._exec(cmd)
         if exit_status == 0:
-            return stdout.read().decode('utf-8')
+            return stdout
         return ''
 
     def save_crontab(self, content: str, linux_user: str = '') -> Tuple[bool, str]:
         """保存远程 crontab"""
-        client = self._get_client()
         cmd = f'crontab -u {linux_user} -' if linux_user else 'crontab -'
-        stdin, stdout, stderr = client.exec_command(cmd)
-        stdin.write(content)
-        stdin.channel.shutdown_write()
-        exit_status = stdout.channel.recv_exit_status()
-        return exit_status == 0, stderr.read().decode('utf-8')
+        exit_status, _, stderr = self._exec(cmd, input_data=content)
+        return exit_status == 0, stderr
 
     def test_connection(self) -> Tuple[bool, str]:
         """测试 SSH 连接"""
         try:
-            client = self._get_client()
-            stdin, stdout, stderr = client.exec_command('echo ok')
-            result = stdout.read().decode().strip()
-            return result == 'ok', f'{self.host}:{self.port}'
+            _, stdout, _ = self._exec('echo ok', timeout=self.connect_timeout)
+            return stdout.strip() == 'ok', f'{self.host}:{self.port}'
         except Exception as e:
             return False, str(e)
 
-    def run_command(self, command: str) -> Tuple[int, str, str]:
+    def run_command(self, command: str, input_data: Optional[str] = None) -> Tuple[int, str, str]:
         """运行远程命令"""
-        client = self._get_client()
-        stdin, stdout, stderr = client.exec_command(command, timeout=120)
-        exit_status = stdout.channel.recv_exit_status()
-        return exit_status, stdout.read().decode('utf-8'), stderr.read().decode('utf-8')
+        return self._exec(command, input_data=input_data)
 
     def close(self):
         """关闭 SSH 连接"""
-        if self._client:
-            self._client.close()
-            self._client = None
+        with self._lock:
+            if self._client:
+                self._client.close()
+                self._client = None
+
+
+class SimulatedFailure(ConnectionError):
+    """模拟执行器按 failure_rate 注入的连接失败"""
+
+
+_SIMULATED_SCHEDULES = ['0 3 * * *', '*/5 * * * *', '30 2 * * 1-5', '0 */4 * * *', '15 1 1 * *', '@daily']
+
+
+def simulated_crontab(lines: int, seed: int = 0) -> str:
+    """生成约 lines 行的确定性 crontab（组标题、任务名、启用/禁用任务）"""
+    rnd = random.Random(seed)
+    out = ['SHELL=/bin/bash', '']
+    group = 0
+    while len(out) < lines:
+        group += 1
+        out.append(f'# 任务组 {group}')
+        for task in range(rnd.randint(1, 6)):
+            out.append(f'# 任务 {group}-{task}')
+            line = f'{rnd.choice(_SIMULATED_SCHEDULES)} /opt/jobs/job_{group}_{task}.sh >/dev/null 2>&1'
+            out.append(line if rnd.random() < 0.8 else '#' + line)
+        out.append('')
+    return '\n'.join(out[:lines]) + '\n'
+
+
+class SimulatedExecutor(CrontabExecutor):
+    """
+    进程内模拟执行器（压测用），不访问任何真实主机
+
+    crontab 与 at 队列保存在内存中；每次调用（与 SSH 一样批量读取/哈希各算一次）
+    休眠 latency ± jitter 秒，并按 failure_rate 概率抛出 SimulatedFailure。
+    每个用户初始 crontab 为 payload_lines 行的合成内容；change_rate 为每次读取哈希时
+    某个用户 crontab 被"外部修改"的概率，用于驱动变化检测。
+    run_command 只模拟本工具用到的命令: atq、at、at -c、atrm、完成标记读取、echo、test -f、tail，
+    其他命令视为成功且无输出。at 任务到期后即视为已执行（退出码 0）。
+    """
+
+    def __init__(self, linux_users: Optional[List[str]] = None, latency: float = 0.0, jitter: float = 0.0,
+                 failure_rate: float = 0.0, payload_lines: int = 50, change_rate: float = 0.0, seed: int = 0):
+        self.latency = max(0.0, float(latency))
+        self.jitter = max(0.0, float(jitter))
+        self.failure_rate = float(failure_rate)
+        self.change_rate = float(change_rate)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._crontabs = {
+            u: simulated_crontab(payload_lines, seed * 1009 + i)
+            for i, u in enumerate(linux_users or ['root'])
+        }
+        self._at_jobs = {}  # {job_id: (执行时间, 命令, 完成标记文件)}
+        self._files = {}    # 模拟文件系统（完成标记）
+        self._next_job_id = 1
+        self.calls = 0
+
+    def _round_trip(self):
+        """模拟一次远程调用的延迟与失败"""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            failed = self._random.random() < self.failure_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise SimulatedFailure('simulated connection failure')
+
+    def _external_change(self):
+        """按 change_rate 随机追加一行到某个用户的 crontab（调用方持有锁）"""
+        if self._crontabs and self._random.random() < self.change_rate:
+            user = self._random.choice(sorted(self._crontabs))
+            self._crontabs[user] += f'# external change {self._random.getrandbits(32):08x}\n'
+
+    def get_crontab(self, linux_user: str = '') -> str:
+        """获取模拟 crontab"""
+        self._round_trip()
+        with self._lock:
+            return self._crontabs.get(linux_user, '')
+
+    def get_crontabs(self, users: Optional[List[str]] = None) -> Dict[str, str]:
+        """一次调用获取多个用户的模拟 crontab"""
+        if users is not None and not users:
+            return {}
+        self._round_trip()
+        with self._lock:
+            users = sorted(self._crontabs) if users is None else users
+            return {u: self._crontabs.get(u, '') for u in users}
+
+    def save_crontab(self, content: str, linux_user: str = '') -> Tuple[bool, str]:
+        """保存模拟 crontab"""
+        self._round_trip()
+        with self._lock:
+            self._crontabs[linux_user] = content
+        return True, ''
+
+    def save_crontab_if(self, content: str, linux_user: str, expected_hash: str) -> Tuple[bool, str]:
+        """比较哈希并保存（在同一把锁内完成）"""
+        self._round_trip()
+        with self._lock:
+            current = self._crontabs.get(linux_user, '')
+            if hashlib.sha256(current.encode('utf-8')).hexdigest() != expected_hash:
+                return False, SAVE_CONFLICT
+            self._crontabs[linux_user] = content
+        return True, ''
+
+    def get_crontab_hashes(self, users: List[str]) -> Dict[str, str]:
+        """一次调用获取多个用户 crontab 的 SHA-256（可能先触发模拟外部修改）"""
+        if not users:
+            return {}
+        self._round_trip()
+        with self._lock:
+            self._external_change()
+            return {u: hashlib.sha256(self._crontabs.get(u, '').encode('utf-8')).hexdigest() for u in users}
+
+    def list_crontab_users(self) -> List[str]:
+        """列出 crontab 非空的用户"""
+        self._round_trip()
+        with self._lock:
+            return sorted(u for u, content in self._crontabs.items() if content)
+
+    def test_connection(self) -> Tuple[bool, str]:
+        """模拟连接测试（同样受延迟与失败率影响）"""
+        try:
+            self._round_trip()
+            return True, 'simulated'
+        except SimulatedFailure as e:
+            return False, str(e)
+
+    def _run_due_at_jobs(self, now):
+        """到期的 at 任务视为已执行: 移出队列并写入完成标记（调用方持有锁）"""
+        for job_id, (run_at, _, done_file) in list(self._at_jobs.items()):
+            if run_at <= now:
+                del self._at_jobs[job_id]
+                if done_file:
+                    self._files[done_file] = '0\n'
+
+    def _submit_at(self, command: str, time_spec: str) -> Tuple[int, str, str]:
+        """提交 at 任务，time_spec 支持 now 与 now + N minutes/hours/days/weeks（调用方持有锁）"""
+        tokens = time_spec.split()
+        if not tokens:
+            return 1, 'Garbled time\n', ''
+        match = re.fullmatch(r'now(?:\s*\+\s*(\d+)\s*(minute|hour|day|week)s?)?', time_spec.strip(), re.I)
+        if not match:
+            return 1, f'syntax error. Last token seen: {tokens[-1]}\nGarbled time\n', ''
+        units = {'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800}
+        offset = int(match.group(1) or 0) * units[(match.group(2) or 'minute').lower()]
+        run_at = datetime.now().replace(second=0, microsecond=0) + timedelta(seconds=offset)
+        done = re.search(r'echo \$\? > (\S+)\)', command)
+        job_id = self._next_job_id
+        self._next_job_id += 1
+        self._at_jobs[job_id] = (run_at, command, done.group(1) if done else None)
+        output = ('warning: commands will be executed using /bin/sh\n'
+                  f'job {job_id} at {run_at.strftime("%a %b %d %H:%M:%S %Y")}\n')
+        return 0, output, ''
+
+    def run_command(self, command: str, input_data: Optional[str] = None) -> Tuple[int, str, str]:
+        """模拟运行命令"""
+        self._round_trip()
+        with self._lock:
+            self._run_due_at_jobs(datetime.now())
+            return self._simulate(command.strip())
+
+    def _simulate(self, command: str) -> Tuple[int, str, str]:
+        """解释本工具发出的 shell 命令（调用方持有锁）"""
+        if command == 'atq':
+            lines = [f'{job_id}\t{run_at.strftime("%a %b %d %H:%M:%S %Y")} a root'
+                     for job_id, (run_at, _, _) in sorted(self._at_jobs.items())]
+            return 0, '\n'.join(lines) + ('\n' if lines else ''), ''
+        match = re.fullmatch(r"cd /tmp && printf '%s\\n' '(.*)' \| at ?(.*?) 2>&1", command, re.S)
+        if match:
+            return self._submit_at(match.group(1).replace("'\\''", "'"), match.group(2))
+        match = re.fullmatch(r'(at -c|atrm) (\d+)', command)
+        if match:
+            job = self._at_jobs.get(int(match.group(2)))
+            if job is None:
+                return 1, '', f'Cannot find jobid {match.group(2)}\n'
+            if match.group(1) == 'atrm':
+                del self._at_jobs[int(match.group(2))]
+                return 0, '', ''
+            return 0, f'#!/bin/sh\n# atrun uid=0 gid=0\numask 22\ncd /tmp || {{\n\t exit 1\n}}\n{job[1]}\n', ''
+        match = re.fullmatch(r'cat (\S+) 2>/dev/null && rm -f \1', command)
+        if match:
+            content = self._files.pop(match.group(1), None)
+            return (0, content, '') if content is not None else (1, '', '')
+        match = re.fullmatch(r'test -f (\S+) && echo exists', command)
+        if match:
+            return (0, 'exists\n', '') if match.group(1) in self._files else (1, '', '')
+        if command.startswith('tail -n '):
+            return 0, '', ''
+        if command.startswith('echo '):
+            return 0, command[5:].strip("'\"") + '\n', ''
+        return 0, '', ''
 
 
 def get_executor(machine_config: dict) -> CrontabExecutor:
     """工厂函数：根据配置创建对应的执行器"""
     machine_type = machine_config.get('type', 'local')
+    if machine_type == 'simulated':
+        return SimulatedExecutor(
+            linux_users=machine_config.get('linux_users', ['root']),
+            latency=machine_config.get('latency', 0.0),
+            jitter=machine_config.get('jitter', 0.0),
+            failure_rate=machine_config.get('failure_rate', 0.0),
+            payload_lines=machine_config.get('payload_lines', 50),
+            change_rate=machine_config.get('change_rate', 0.0),
+            seed=machine_config.get('seed', 0)
+        )
     if machine_type == 'ssh':
         return SSHExecutor(
             host=machine_config['host'],
             port=machine_config.get('port', 22),
             ssh_user=machine_config['ssh_user'],
-            ssh_key=machine_config['ssh_key']
+            ssh_key=machine_config['ssh_key'],
+            max_channels=machine_config.get('max_channels', 4),
+            keepalive=machine_config.get('keepalive', 30),
+            connect_timeout=machine_config.get('connect_timeout', 10)
         )
     return LocalExecutor()
@@ -8,8 +8,10 @@ def register_blueprints(app):
     from routes.crontab import bp as crontab_bp
     from routes.at_jobs import bp as at_jobs_bp
     from routes.query import bp as query_bp
+    from routes.analysis import bp as analysis_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(crontab_bp)
     app.register_blueprint(at_jobs_bp)
     app.register_blueprint(query_bp)
+    app.register_blueprint(analysis_bp)
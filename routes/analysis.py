@@ -0,0 +1,91 @@
+# routes/analysis.py - 调度分析路由
+# 功能: 全局执行时间热力图、执行冲突检测与错峰建议
+
+from datetime import datetime
+
+from flask import Blueprint, request
+from flask_login import login_required, current_user
+
+from core import config
+from core.analysis import collect_fleet_tasks, build_heatmap, find_collisions, suggest_spread
+from core.response import api_success, api_error
+
+bp = Blueprint('analysis', __name__)
+
+WINDOW_DAYS = {'day': 1, 'week': 7}
+
+
+def _requested_machines():
+    """请求参数 machines（逗号分隔，默认全部）中当前用户可访问的机器"""
+    requested = request.args.get('machines')
+    machine_ids = requested.split(',') if requested else list(config.MACHINES)
+    return [m for m in machine_ids if m in config.MACHINES and current_user.can_access_machine(m)]
+
+
+def _window_days():
+    window = request.args.get('window', 'day')
+    if window not in WINDOW_DAYS:
+        raise ValueError('window must be day or week')
+    return window, WINDOW_DAYS[window]
+
+
+def _window_start():
+    start = request.args.get('start')
+    if not start:
+        return datetime.now()
+    try:
+        return datetime.strptime(start, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('start must be YYYY-MM-DD')
+
+
+@bp.route('/api/analysis/heatmap')
+@login_required
+def get_heatmap():
+    """
+    机器 × 时间段的任务执行次数热力图
+    参数: window（day/week，默认 day）、slot（时间段分钟数，默认 60）、
+          start（YYYY-MM-DD，默认今天）、machines（逗号分隔，默认全部可访问机器）
+    """
+    slot = request.args.get('slot', 60, type=int)
+    if not slot or slot < 1 or 1440 % slot:
+        return api_error('slot must divide 1440')
+    try:
+        window, days = _window_days()
+        start = _window_start()
+    except ValueError as e:
+        return api_error(str(e))
+
+    tasks, errors = collect_fleet_tasks(_requested_machines())
+    heatmap = build_heatmap(tasks, start, days, slot)
+    return api_success(window=window, slot=slot, errors=errors, **heatmap)
+
+
+@bp.route('/api/analysis/collisions')
+@login_required
+def get_collisions():
+    """
+    执行冲突检测: 同一分钟执行任务数超过 threshold 的时间点，以及保持频率的分钟平移建议
+    参数: threshold（默认 10）、scope（host 按机器 / fleet 按全局，默认 host）、
+          window、start、machines（同热力图）
+    batches 可逐个直接 POST 到 /api/batch 应用（携带 version，期间 crontab 被修改则返回 412）
+    """
+    threshold = request.args.get('threshold', 10, type=int)
+    if threshold is None or threshold < 1:
+        return api_error('threshold must be a positive integer')
+    scope = request.args.get('scope', 'host')
+    if scope not in ('host', 'fleet'):
+        return api_error('scope must be host or fleet')
+    try:
+        window, days = _window_days()
+        start = _window_start()
+    except ValueError as e:
+        return api_error(str(e))
+
+    tasks, errors = collect_fleet_tasks(_requested_machines())
+    suggestions, batches = suggest_spread(tasks, start, days, threshold, scope)
+    return api_success(
+        window=window, threshold=threshold, scope=scope, errors=errors,
+        collisions=find_collisions(tasks, start, days, threshold, scope),
+        suggestions=suggestions, batches=batches,
+    )
@@ -2,13 +2,19 @@
 # 功能: 机器列表、Cron 日志、审计日志、备份管理
 
 import os
+import re
+import csv
+import io
 import json
-from flask import Blueprint, render_template, request
+from datetime import datetime
+
+from flask import Blueprint, Response, render_template, request, stream_with_context
 from flask_login import login_required, current_user
 
-from core import config
+from core import config, audit, backups
 from core.auth import require_role, require_machine_access
-from core.crontab import get_machine_executor, get_crontab_raw, save_crontab, log_action
+from core.crontab import get_machine_executor, get_crontab_raw, save_crontab, log_action, content_hash
+from core.diff import diff_contents
 from core.response import api_success, api_error
 
 bp = Blueprint('query', __name__)
@@ -59,6 +65,23 @@ def get_machine_status(machine_id):
         return api_error(str(e))
 
 
+@bp.route('/api/watcher/stats')
+@require_role('admin')
+def get_watcher_status():
+    """获取 crontab 变化检测线程统计"""
+    from core.watcher import get_watcher_stats
+    return api_success(stats=get_watcher_stats())
+
+
+@bp.route('/api/cache/stats')
+@require_role('admin')
+def get_cache_status():
+    """获取解析与差异缓存统计"""
+    from core.crontab import get_parse_cache_stats
+    from core.diff import get_diff_cache_stats
+    return api_success(parse=get_parse_cache_stats(), diff=get_diff_cache_stats())
+
+
 # ===== 日志 =====
 
 
@@ -105,57 +128,133 @@ def get_cron_logs(machine_id='local'):
 @bp.route('/api/audit_logs/<machine_id>')
 @login_required
 def get_audit_logs(machine_id=None):
-    """获取审计日志"""
-    logs = []
-    if os.path.exists(config.AUDIT_LOG):
-        with open(config.AUDIT_LOG, "r", encoding="utf-8") as f:
-            lines = f.readlines()[-500:]
-            for line in reversed(lines):
-                try:
-                    log = json.loads(line.strip())
-                    if machine_id:
-                        log_machine = log.get('details', {}).get('machine', 'local') if log.get('details') else 'local'
-                        if log_machine != machine_id:
-                            continue
-                    logs.append(log)
-                    if len(logs) >= 500:
-                        break
-                except json.JSONDecodeError:
-                    continue
-    return api_success(path=os.path.abspath(config.AUDIT_LOG), logs=logs)
+    """
+    获取审计日志（从新到旧）
+    参数: limit（每页数量，默认 500，最多 5000）、before（上一页返回的 next_cursor）、
+          user / action（精确匹配）、since / until（YYYY-MM-DD[ HH:MM[:SS]]，闭区间）
+    """
+    limit = request.args.get('limit', 500, type=int)
+    if not 1 <= limit <= 5000:
+        return api_error('limit must be between 1 and 5000')
+    try:
+        before = audit.parse_cursor(request.args.get('before'))
+    except ValueError:
+        return api_error('Invalid cursor')
+    try:
+        since = audit.parse_time(request.args.get('since'))
+        until = audit.parse_time(request.args.get('until'), end=True)
+    except ValueError as e:
+        return api_error(str(e))
+    logs, next_cursor = audit.query_logs(
+        machine=machine_id, limit=limit, before=before,
+        user=request.args.get('user'), action=request.args.get('action'), since=since, until=until,
+    )
+    return api_success(path=os.path.abspath(config.AUDIT_LOG), logs=logs, next_cursor=next_cursor)
+
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+EXPORT_CSV_FIELDS = ['timestamp', 'user', 'action', 'machine', 'details']
+
+
+def _csv_rows(lines):
+    """JSON 行 → CSV 文本（表头 + 每条记录一行，details 保留为 JSON）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(EXPORT_CSV_FIELDS)
+    yield take()
+    for line in lines:
+        log = json.loads(line)
+        writer.writerow([log.get('timestamp'), log.get('user'), log.get('action'), audit.record_machine(log),
+                         json.dumps(log.get('details'), ensure_ascii=False)])
+        yield take()
+
+
+@bp.route('/api/audit_export')
+@require_role('admin')
+def export_audit_logs():
+    """
+    流式导出审计日志（从旧到新，内存占用恒定）
+    参数: format（ndjson 原始 JSON 行 / csv，默认 ndjson）、machine / user / action、since / until
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return api_error('format must be ndjson or csv')
+    try:
+        since = audit.parse_time(request.args.get('since'))
+        until = audit.parse_time(request.args.get('until'), end=True)
+    except ValueError as e:
+        return api_error(str(e))
+    filters = {k: request.args.get(k) for k in ('machine', 'user', 'action') if request.args.get(k)}
+    log_action('export_audit_logs', {'filters': filters, 'since': since, 'until': until, 'format': fmt})
+
+    lines = audit.export_lines(since=since, until=until, **filters)
+    body = _csv_rows(lines) if fmt == 'csv' else lines
+    filename = f'audit_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{fmt}'
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
 
 
 # ===== 备份管理 =====
 
 
-@bp.route('/api/backups')
-@bp.route('/api/backups/<machine_id>/<linux_user>')
-@login_required
-def get_backups(machine_id='local', linux_user=''):
-    """获取所有备份列表"""
+BACKUP_FIELDS = ('filename', 'timestamp', 'username', 'size', 'lines', 'tasks', 'added', 'removed')
+
+
+def _backup_time_arg(name, pad):
+    """时间参数（YYYY-MM-DD[ HH:MM[:SS]] 或 YYYYmmdd_HHMMSS）→ 备份时间戳，缺省部分用 pad 补齐"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    digits = re.sub(r'\D', '', value)
+    if len(digits) < 8 or len(digits) > 14:
+        raise ValueError(f'{name} must be YYYY-MM-DD[ HH:MM[:SS]]')
+    digits = digits.ljust(14, pad)
+    return f'{digits[:8]}_{digits[8:]}'
+
+
+def _backup_user(machine_id, linux_user):
+    """规范化 Linux 用户；机器未配置或用户不在该机器的 linux_users 中时返回 None（二者用于拼接备份目录）"""
     if not linux_user or linux_user == '_default_':
         linux_user = config.DEFAULT_LINUX_USER
-    backup_subdir = os.path.join(config.BACKUP_DIR, machine_id, linux_user)
+    if machine_id not in config.MACHINES:
+        return None
+    users = config.MACHINES[machine_id].get('linux_users', [config.DEFAULT_LINUX_USER])
+    return linux_user if linux_user in [u or config.DEFAULT_LINUX_USER for u in users] else None
 
-    if not os.path.exists(backup_subdir):
-        return api_success(backups=[])
 
-    backups = sorted(
-        [f for f in os.listdir(backup_subdir) if f.endswith('.bak')],
-        reverse=True
-    )
-    result = []
-    for bak in backups:
-        name = bak.replace('crontab_', '').replace('.bak', '')
-        parts = name.split('_')
-        if len(parts) >= 3:
-            timestamp = f'{parts[0]}_{parts[1]}'
-            username = '_'.join(parts[2:])
-        else:
-            timestamp = name
-            username = ''
-        result.append({'filename': bak, 'timestamp': timestamp, 'username': username})
-    return api_success(backups=result)
+@bp.route('/api/backups')
+@bp.route('/api/backups/<machine_id>/<linux_user>')
+@login_required
+def get_backups(machine_id='local', linux_user=''):
+    """
+    获取备份列表（从新到旧）
+    参数: limit（每页数量，默认全部）、cursor（上一页返回的 next_cursor）、
+          since/until（时间范围，YYYY-MM-DD[ HH:MM[:SS]]，闭区间）
+    """
+    linux_user = _backup_user(machine_id, linux_user)
+    if linux_user is None:
+        return api_error('Machine or user not found', 404)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return api_error('limit must be positive')
+    try:
+        since = _backup_time_arg('since', '0')
+        until = _backup_time_arg('until', '9')
+        entries, next_cursor = backups.query_backups(machine_id, linux_user, cursor=request.args.get('cursor'),
+                                                     limit=limit, since=since, until=until)
+    except ValueError as e:
+        return api_error(str(e))
+    except KeyError:
+        return api_error('Invalid cursor')
+    result = [{k: e[k] for k in BACKUP_FIELDS if k in e} for e in entries]
+    return api_success(backups=result, next_cursor=next_cursor)
 
 
 @bp.route('/api/backup/<filename>')
@@ -163,36 +262,85 @@ def get_backups(machine_id='local', linux_user=''):
 @login_required
 def get_backup_content(filename, machine_id='local', linux_user=''):
     """获取指定备份的内容"""
-    if not linux_user or linux_user == '_default_':
-        linux_user = config.DEFAULT_LINUX_USER
+    linux_user = _backup_user(machine_id, linux_user)
+    if linux_user is None:
+        return api_error('Machine or user not found', 404)
     if not filename.endswith('.bak') or '/' in filename or '\\' in filename:
         return api_error('Invalid filename')
 
-    filepath = os.path.join(config.BACKUP_DIR, machine_id, linux_user, filename)
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            return api_success(content=f.read())
+    content = backups.get_backup(machine_id, linux_user, filename)
+    if content is not None:
+        return api_success(content=content)
     return api_error('Not found', 404)
 
 
+def _resolve_version(ref, machine_id, linux_user):
+    """
+    版本引用 → 内容: current（当前 crontab）、备份文件名（*.bak）或内容哈希（须为当前内容或该 (机器, 用户) 的备份）
+    找不到时返回 None
+    """
+    if ref == 'current':
+        return get_crontab_raw(machine_id, linux_user)
+    if ref.endswith('.bak'):
+        return backups.get_backup(machine_id, linux_user, ref)
+    if any(e['hash'] == ref for e in backups.list_backups(machine_id, linux_user)):
+        return backups.read_object(ref)
+    current = get_crontab_raw(machine_id, linux_user)
+    return current if content_hash(current) == ref else None
+
+
+@bp.route('/api/diff')
+@bp.route('/api/diff/<machine_id>/<linux_user>')
+@login_required
+@require_machine_access
+def get_diff(machine_id='local', linux_user=''):
+    """
+    比较两个版本（服务端计算并缓存）
+    参数: from / to（current、备份文件名或内容哈希，to 默认 current）、
+          format（lines 行级操作 / unified，默认 lines）、context（相同行上下文行数，lines 默认全部，unified 默认 3）
+    """
+    linux_user = _backup_user(machine_id, linux_user)
+    if linux_user is None:
+        return api_error('Machine or user not found', 404)
+    refs = request.args.get('from'), request.args.get('to', 'current')
+    if not refs[0]:
+        return api_error('from is required')
+    context = request.args.get('context', type=int)
+    if context is not None and context < 0:
+        return api_error('context must be >= 0')
+
+    contents = []
+    for ref in refs:
+        try:
+            content = _resolve_version(ref, machine_id, linux_user)
+        except Exception as e:
+            return api_error(str(e))
+        if content is None:
+            return api_error(f'Version not found: {ref}', 404)
+        contents.append(content)
+    try:
+        result = diff_contents(*contents, fmt=request.args.get('format', 'lines'), context=context)
+    except ValueError as e:
+        return api_error(str(e))
+    return api_success(from_version=content_hash(contents[0]), to_version=content_hash(contents[1]), **result)
+
+
 @bp.route('/api/restore/<filename>', methods=['POST'])
 @bp.route('/api/restore/<machine_id>/<linux_user>/<filename>', methods=['POST'])
 @require_role('editor', 'admin')
 @require_machine_access
 def restore_backup(filename, machine_id='local', linux_user=''):
     """回滚到指定备份版本"""
-    if not linux_user or linux_user == '_default_':
-        linux_user = config.DEFAULT_LINUX_USER
+    linux_user = _backup_user(machine_id, linux_user)
+    if linux_user is None:
+        return api_error('Machine or user not found', 404)
     if not filename.endswith('.bak') or '/' in filename or '\\' in filename:
         return api_error('Invalid filename')
 
-    filepath = os.path.join(config.BACKUP_DIR, machine_id, linux_user, filename)
-    if not os.path.exists(filepath):
+    content = backups.get_backup(machine_id, linux_user, filename)
+    if content is None:
         return api_error('Backup not found', 404)
 
-    with open(filepath, 'r') as f:
-        content = f.read()
-
     success, error = save_crontab(content, current_user.id, machine_id, linux_user)
     if success:
         log_action('restore_backup', {'machine': machine_id, 'linux_user': linux_user, 'filename': filename})
@@ -72,6 +72,19 @@
             }
         }
 
+        // Cron 宏 → 等价的 5 字段表达式（@reboot 无等价形式）
+        const CRON_MACROS = {
+            '@yearly': '0 0 1 1 *', '@annually': '0 0 1 1 *', '@monthly': '0 0 1 * *',
+            '@weekly': '0 0 * * 0', '@daily': '0 0 * * *', '@midnight': '0 0 * * *', '@hourly': '0 * * * *'
+        };
+
+        // 任务时间表达式 → [minute, hour, day, month, weekday]，@reboot 整体放在第一个字段
+        function scheduleFields(schedule) {
+            const parts = (CRON_MACROS[schedule.toLowerCase()] || schedule).split(/\s+/);
+            if (parts.length >= 5) return parts;
+            return schedule.startsWith('@') ? [schedule, '', '', '', ''] : ['*', '*', '*', '*', '*'];
+        }
+
         // Cron 时间解析为人类可读描述
         function parseCronToHuman(minute, hour, day, month, weekday) {
             const weekdayNames = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'];
@@ -553,9 +566,13 @@
                 // 格式化时间：20251231_151544 -> 2025-12-31 15:15:44
                 const ts = b.timestamp.replace(/_/, ' ').replace(/(\d{4})(\d{2})(\d{2}) (\d{2})(\d{2})(\d{2})/, '$1-$2-$3 $4:$5:$6');
                 const userLabel = b.username ? `<span class="history-user">${ICON.USER}${escapeHtml(b.username)}</span>` : '';
+                // 相对上一版本新增/删除的任务数（旧版备份没有统计）
+                const statsLabel = b.added !== undefined
+                    ? `<span class="history-stats" title="${b.tasks} tasks, ${b.lines} lines"><span class="added">+${b.added}</span><span class="removed">-${b.removed}</span></span>`
+                    : '';
                 return `<div class="history-item">
                     <div class="history-item-header" onclick="toggleHistoryItem(this.parentElement, '${b.filename}')">
-                        <span class="history-time">${ts}${userLabel}</span>
+                        <span class="history-time">${ts}${userLabel}${statsLabel}</span>
                         <div class="history-actions">
                             <button class="history-btn diff-btn" onclick="event.stopPropagation(); showDiff('${b.filename}', '${ts}')">Diff</button>
                             <button class="history-btn restore-btn${USER_CAN_EDIT ? '' : ' no-permission'}" ${USER_CAN_EDIT ? `onclick="event.stopPropagation(); restoreBackup('${b.filename}', '${ts}')"` : ''}>Restore</button>
@@ -601,68 +618,29 @@
             }
         }
 
-        // LCS diff 算法
-        function computeDiff(oldLines, newLines) {
-            const m = oldLines.length, n = newLines.length;
-            // 构建 LCS 表
-            const dp = Array(m + 1).fill(null).map(() => Array(n + 1).fill(0));
-            for (let i = 1; i <= m; i++) {
-                for (let j = 1; j <= n; j++) {
-                    if (oldLines[i - 1] === newLines[j - 1]) {
-                        dp[i][j] = dp[i - 1][j - 1] + 1;
-                    } else {
-                        dp[i][j] = Math.max(dp[i - 1][j], dp[i][j - 1]);
-                    }
-                }
-            }
-            // 回溯生成 diff
-            const result = [];
-            let i = m, j = n;
-            while (i > 0 || j > 0) {
-                if (i > 0 && j > 0 && oldLines[i - 1] === newLines[j - 1]) {
-                    result.unshift({ type: 'same', oldLine: oldLines[i - 1], newLine: newLines[j - 1] });
-                    i--; j--;
-                } else if (j > 0 && (i === 0 || dp[i][j - 1] >= dp[i - 1][j])) {
-                    result.unshift({ type: 'add', oldLine: null, newLine: newLines[j - 1] });
-                    j--;
-                } else {
-                    result.unshift({ type: 'remove', oldLine: oldLines[i - 1], newLine: null });
-                    i--;
-                }
-            }
-            return result;
-        }
-
         async function showDiff(filename, timestamp) {
             try {
                 // 查找当前备份索引
                 currentDiffBackupIndex = historyBackups.findIndex(b => b.filename === filename);
 
-                // 获取当前版本和备份版本
-                const [currentResp, backupResp] = await Promise.all([
-                    fetch(getApiPath('/api/raw')),
-                    fetch(getApiPath('/api/backup') + `/${encodeURIComponent(filename)}`)
-                ]);
-                const currentData = await currentResp.json();
-                const backupData = await backupResp.json();
-
-                const currentLines = (currentData.content || '').split('\n');
-                const backupLines = (backupData.content || '').split('\n');
+                // 服务端计算备份版本 → 当前版本的行级差异
+                const resp = await fetchWithTimeout(getApiPath('/api/diff') + `?from=${encodeURIComponent(filename)}&to=current`);
+                const data = await resp.json();
+                if (!data.success) throw new Error(data.error);
 
-                // 使用 LCS diff 算法
-                const diff = computeDiff(backupLines, currentLines);
                 let currentHtml = '', backupHtml = '';
-
-                for (const d of diff) {
-                    if (d.type === 'same') {
-                        currentHtml += `<div class="diff-line">${highlightLine(d.newLine)}</div>`;
-                        backupHtml += `<div class="diff-line">${highlightLine(d.oldLine)}</div>`;
-                    } else if (d.type === 'add') {
-                        currentHtml += `<div class="diff-line diff-add">${highlightLine(d.newLine)}</div>`;
-                        backupHtml += `<div class="diff-line diff-empty"></div>`;
-                    } else if (d.type === 'remove') {
-                        currentHtml += `<div class="diff-line diff-empty"></div>`;
-                        backupHtml += `<div class="diff-line diff-remove">${highlightLine(d.oldLine)}</div>`;
+                for (const [op, lines] of data.ops) {
+                    for (const line of lines) {
+                        if (op === '=') {
+                            currentHtml += `<div class="diff-line">${highlightLine(line)}</div>`;
+                            backupHtml += `<div class="diff-line">${highlightLine(line)}</div>`;
+                        } else if (op === '+') {
+                            currentHtml += `<div class="diff-line diff-add">${highlightLine(line)}</div>`;
+                            backupHtml += `<div class="diff-line diff-empty"></div>`;
+                        } else if (op === '-') {
+                            currentHtml += `<div class="diff-line diff-empty"></div>`;
+                            backupHtml += `<div class="diff-line diff-remove">${highlightLine(line)}</div>`;
+                        }
                     }
                 }
 
@@ -760,6 +738,11 @@
 
         // ========== 日志相关 ==========
 
+        function exportAuditLogs() {
+            // 服务端流式生成文件，浏览器直接下载
+            window.location.href = `/api/audit_export?format=csv&machine=${encodeURIComponent(currentMachine)}`;
+        }
+
         async function loadAuditLogs() {
             const logList = document.getElementById('logList');
             const pagination = document.getElementById('auditPagination');
@@ -1260,9 +1243,8 @@
 
         // 渲染单个任务（内联编辑模式）
         function renderTask(task, groupId, group) {
-            const parts = task.schedule.split(/\s+/);
-            const [minute, hour, day, month, weekday] = parts.length >= 5 ? parts : ['*', '*', '*', '*', '*'];
-            const cronDescription = parseCronToHuman(minute, hour, day, month, weekday);
+            const [minute, hour, day, month, weekday] = scheduleFields(task.schedule);
+            const cronDescription = minute.startsWith('@') ? escapeHtml(minute) : parseCronToHuman(minute, hour, day, month, weekday);
             const displayName = task.name;
             const noPerm = USER_CAN_EDIT ? '' : ' no-permission';
             const editableClass = USER_CAN_EDIT ? 'editable' : '';
@@ -2135,10 +2117,14 @@
 
         // ========== 原始编辑器 ==========
 
+        // 当前编辑内容对应的服务器版本（保存时作为前置条件，防止覆盖他人修改）
+        let rawVersion = null;
+
         async function loadRaw() {
             const resp = await fetchWithTimeout(getApiPath('/api/raw'));
             const data = await resp.json();
             document.getElementById('rawContent').value = data.content;
+            rawVersion = data.version || null;
             updateHighlight();
         }
 
@@ -2150,7 +2136,7 @@
             // 注释行
             if (line.trim().startsWith('#')) {
                 // 被禁用的任务（# 开头但后面是 cron 格式）
-                if (/^#\s*[\d\*]/.test(line.trim())) {
+                if (/^#\s*[\d\*@]/.test(line.trim())) {
                     return `<span class="hl-disabled">${escaped}</span>`;
                 }
                 return `<span class="hl-comment">${escaped}</span>`;
@@ -2162,8 +2148,8 @@
                 const val = escapeHtml(envMatch[2]);
                 return `<span class="hl-env-key">${key}</span>=<span class="hl-env-value">${val}</span>`;
             }
-            // Cron 任务行：分 时 日 月 周 命令
-            const cronMatch = line.match(/^([\d\*\/\-,]+\s+[\d\*\/\-,]+\s+[\d\*\/\-,]+\s+[\d\*\/\-,]+\s+[\d\*\/\-,]+)\s+(.+)$/);
+            // Cron 任务行：分 时 日 月 周 命令（月/周可为英文名称），或 @daily 等宏
+            const cronMatch = line.trim().match(/^([\d\*\/\-,]+\s+[\d\*\/\-,]+\s+[\d\*\/\-,]+\s+[\w\*\/\-,]+\s+[\w\*\/\-,]+|@(?:reboot|yearly|annually|monthly|weekly|daily|midnight|hourly))\s+(.+)$/i);
             if (cronMatch) {
                 const schedule = escapeHtml(cronMatch[1]);
                 const cmd = escapeHtml(cronMatch[2]);
@@ -2193,7 +2179,8 @@
         // 保存原始内容
         async function saveRaw() {
             const content = document.getElementById('rawContent').value;
-            await apiCall('/api/save', { body: { content }, successMsg: 'Saved successfully', errorPrefix: 'Save failed', reload: false });
+            const result = await apiCall('/api/save', { body: { content, version: rawVersion }, successMsg: 'Saved successfully', errorPrefix: 'Save failed', reload: false });
+            if (result.success && result.version) rawVersion = result.version;
         }
 
         // 显示消息
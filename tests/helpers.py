@@ -0,0 +1,45 @@
+# tests/helpers.py - 测试与基准共用的辅助类
+# 功能: MemoryExecutor 内存执行器（按用户保存 crontab 文本，统计远程读写次数），不访问系统 crontab
+# 用法: from tests.helpers import MemoryExecutor; executor = MemoryExecutor({'root': content})
+
+from core.crontab import content_hash
+from executor import SAVE_CONFLICT
+
+
+class MemoryExecutor:
+    """
+    内存执行器: 按用户保存 crontab 文本
+    reads: 全文读取次数（get_crontab / get_crontabs），writes: 写入次数，
+    hash_calls: 哈希读取次数，fetched: 每次批量读取的用户列表
+    """
+
+    def __init__(self, crontabs=None):
+        self.crontabs = dict(crontabs or {})
+        self.reads = 0
+        self.writes = 0
+        self.hash_calls = 0
+        self.fetched = []
+
+    def get_crontab(self, linux_user=''):
+        self.reads += 1
+        return self.crontabs.get(linux_user, '')
+
+    def get_crontabs(self, users=None):
+        self.reads += 1
+        users = list(self.crontabs) if users is None else list(users)
+        self.fetched.append(users)
+        return {u: self.crontabs.get(u, '') for u in users}
+
+    def get_crontab_hashes(self, users):
+        self.hash_calls += 1
+        return {u: content_hash(self.crontabs.get(u, '')) for u in users}
+
+    def save_crontab(self, content, linux_user=''):
+        self.writes += 1
+        self.crontabs[linux_user] = content
+        return True, ''
+
+    def save_crontab_if(self, content, linux_user, expected_hash):
+        if content_hash(self.crontabs.get(linux_user, '')) != expected_hash:
+            return False, SAVE_CONFLICT
+        return self.save_crontab(content, linux_user)
@@ -0,0 +1,141 @@
+# tests/test_analysis.py - 调度分析测试
+# 测试: 每分钟执行次数展开、机器/全局热力图、并发收集、冲突检测与错峰建议
+# 运行: python -m pytest tests/test_analysis.py -v
+
+import unittest
+from collections import Counter
+from datetime import datetime
+from unittest.mock import patch
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config
+from core import analysis
+from core.analysis import (
+    fire_counts, build_heatmap, collect_fleet_tasks, find_collisions, suggest_spread, shift_candidates,
+)
+
+# 2026-10-16 是周五
+DAY = datetime(2026, 10, 16, 15, 30)
+
+
+class TestFireCounts(unittest.TestCase):
+    """测试按分钟展开"""
+
+    def test_weighted_counts(self):
+        counts = fire_counts(Counter({'0 * * * *': 3, '*/30 2 * * *': 1}), DAY)
+        self.assertEqual(len(counts), 1440)
+        self.assertEqual(counts[0], 3)
+        self.assertEqual(counts[120], 4)
+        self.assertEqual(counts[150], 1)
+        self.assertEqual(sum(counts), 3 * 24 + 2)
+
+    def test_week_respects_weekdays(self):
+        counts = fire_counts(Counter({'0 9 * * mon-fri': 1}), DAY, days=7)
+        fired_days = [i // 1440 for i, c in enumerate(counts) if c]
+        # 周五、周一至周四
+        self.assertEqual(fired_days, [0, 3, 4, 5, 6])
+
+    def test_invalid_and_reboot_ignored(self):
+        self.assertEqual(sum(fire_counts(Counter({'@reboot': 1, '99 * * * *': 1}), DAY)), 0)
+
+
+class TestHeatmap(unittest.TestCase):
+    """测试热力图聚合"""
+
+    def test_machines_and_fleet(self):
+        tasks = {
+            'a': [{'schedule': '0 2 * * *'}, {'schedule': '0 2 * * *'}],
+            'b': [{'schedule': '0 2 * * *'}, {'schedule': '*/15 * * * *'}],
+        }
+        heatmap = build_heatmap(tasks, DAY, days=1, slot=60)
+        self.assertEqual(len(heatmap['slots']), 24)
+        self.assertEqual(heatmap['slots'][2], '2026-10-16 02:00')
+        self.assertEqual(heatmap['machines']['a']['slots'][2], 2)
+        self.assertEqual(heatmap['machines']['b']['slots'][2], 5)
+        self.assertEqual(heatmap['machines']['a']['peak'], {'time': '2026-10-16 02:00', 'count': 2})
+        self.assertEqual(heatmap['fleet']['peak_minutes'][0], {'time': '2026-10-16 02:00', 'count': 4})
+        self.assertEqual(heatmap['fleet']['fires'], 3 + 96)
+
+
+@patch.object(config, 'MACHINES', {'ok': {'linux_users': ['root']}, 'down': {'linux_users': ['root']}})
+class TestCollectFleetTasks(unittest.TestCase):
+    """测试并发收集启用任务"""
+
+    def test_enabled_tasks_and_errors(self):
+        def fake_crontabs(machine_id, linux_users):
+            if machine_id == 'down':
+                raise RuntimeError('connect timeout')
+            return {'root': '0 2 * * * /a.sh\n#0 3 * * * /b.sh\n'}
+
+        with patch.object(analysis, 'get_machine_crontabs', side_effect=fake_crontabs):
+            tasks, errors = collect_fleet_tasks(['ok', 'down', 'missing'])
+        self.assertEqual([t['command'] for t in tasks['ok']], ['/a.sh'])
+        self.assertEqual(tasks['ok'][0]['linux_user'], 'root')
+        self.assertEqual(errors, {'down': 'connect timeout'})
+
+
+def backup_storm(machine_id, count, schedule='0 2 * * *'):
+    return [{'id': i, 'linux_user': 'root', 'schedule': schedule, 'command': f'/{machine_id}/b{i}.sh',
+             'version': 'v-' + machine_id} for i in range(count)]
+
+
+class TestCollisions(unittest.TestCase):
+    """测试冲突检测与错峰建议"""
+
+    def test_shift_candidates_keep_cadence(self):
+        current, candidates = shift_candidates('0 2 * * *')
+        self.assertEqual((current, len(candidates)), (0, 60))
+        current, candidates = shift_candidates('5-59/15 * * * *')
+        self.assertEqual(current, 5)
+        self.assertEqual([c[1] for c in candidates][:2], ['*/15 * * * *', '1-59/15 * * * *'])
+        self.assertEqual(shift_candidates('0,30 * * * *'), (None, []))
+
+    def test_host_collisions(self):
+        tasks = {'a': backup_storm('a', 4), 'b': backup_storm('b', 2)}
+        collisions = find_collisions(tasks, DAY, threshold=3)
+        self.assertEqual(len(collisions), 1)
+        self.assertEqual((collisions[0]['machine_id'], collisions[0]['time'], collisions[0]['count']),
+                         ('a', '2026-10-16 02:00', 4))
+        self.assertEqual(len(collisions[0]['tasks']), 4)
+
+    def test_fleet_collisions(self):
+        tasks = {'a': backup_storm('a', 2), 'b': backup_storm('b', 2)}
+        self.assertEqual(find_collisions(tasks, DAY, threshold=3), [])
+        collisions = find_collisions(tasks, DAY, threshold=3, scope='fleet')
+        self.assertEqual((collisions[0]['machine_id'], collisions[0]['count']), (None, 4))
+
+    def test_spread_until_under_threshold(self):
+        tasks = {'a': backup_storm('a', 6)}
+        suggestions, batches = suggest_spread(tasks, DAY, threshold=2)
+        self.assertEqual(len(suggestions), 4)
+        moved = Counter(s['suggested'] for s in suggestions)
+        self.assertTrue(all(n == 1 for n in moved.values()))
+        self.assertTrue(all(s['suggested'].endswith(' 2 * * *') for s in suggestions))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0]['version'], 'v-a')
+        self.assertEqual(batches[0]['operations'][0]['op'], 'update')
+        self.assertEqual(find_collisions({'a': [
+            {**t, 'schedule': next((s['suggested'] for s in suggestions if s['task_id'] == t['id']), t['schedule'])}
+            for t in tasks['a']
+        ]}, DAY, threshold=2), [])
+
+    def test_shift_loads_match_expanded_candidates(self):
+        dates = analysis._window_dates(DAY, 7)
+        counts = fire_counts(Counter({'*/10 * * * mon-fri': 2, '0 2 * * *': 5, '7 * * * *': 1}), DAY, days=7)
+        for schedule in ('5 2 * * sat', '2-59/15 9-17 * * *'):
+            current, candidates = shift_candidates(schedule)
+            spans = analysis._hour_spans(analysis.fire_indices(schedule, dates))
+            peaks, totals = analysis._shift_loads(counts, spans, len(candidates))
+            for offset, expression in candidates:
+                fires = analysis.fire_indices(expression, dates)
+                self.assertEqual((peaks[offset], totals[offset]),
+                                 (max(counts[i] for i in fires), sum(counts[i] for i in fires)))
+
+    def test_no_suggestion_below_threshold(self):
+        self.assertEqual(suggest_spread({'a': backup_storm('a', 2)}, DAY, threshold=2), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,327 @@
+# tests/test_audit.py - 审计日志测试
+# 测试: 按块反向读取、页满即停、before 游标翻页、机器过滤、损坏行跳过、索引查询与增量补齐、压缩段轮转与跨段查询、后台批量写入、流式导出
+# 运行: python -m pytest tests/test_audit.py -v
+
+import os
+import gzip
+import json
+import tempfile
+import threading
+import subprocess
+import unittest
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config, audit
+
+
+def make_record(i, machine='local', user='admin', action=None, hour=0):
+    return {'timestamp': f'2024-01-01 {hour:02d}:{i // 60 % 60:02d}:{i % 60:02d}', 'user': user,
+            'action': action or f'act{i}', 'details': {'machine': machine}}
+
+
+class AuditTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.patches = [
+            patch.object(config, 'AUDIT_LOG', os.path.join(self.tmpdir.name, 'audit.log')),
+            patch.dict(config.AUDIT_CONFIG, {'rotate_bytes': 0, 'rotate_days': 0}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        audit.flush()
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def write(self, records, raw=''):
+        with open(config.AUDIT_LOG, 'a', encoding='utf-8') as f:
+            for r in records:
+                f.write(json.dumps(r, ensure_ascii=False) + '\n')
+            f.write(raw)
+
+
+class TestReverseReader(AuditTestCase):
+    def test_reverse_lines_across_blocks(self):
+        lines = [f'line-{i}-' + 'x' * (i % 7) for i in range(200)]
+        self.write([], '\n'.join(lines) + '\n')
+        with open(config.AUDIT_LOG, 'rb') as f:
+            result = list(audit._reverse_lines(f, os.path.getsize(config.AUDIT_LOG), block_size=16))
+            for offset, line in result:
+                f.seek(offset)
+                self.assertEqual(f.read(len(line)), line)
+        self.assertEqual([line.decode() for _, line in result], lines[::-1])
+
+    def test_pages_with_before_cursor(self):
+        self.write([make_record(i) for i in range(25)])
+        pages, cursor = [], None
+        while True:
+            logs, cursor = audit.query_logs(limit=10, before=audit.parse_cursor(cursor))
+            pages.append([log['action'] for log in logs])
+            if not cursor:
+                break
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), [f'act{i}' for i in range(24, -1, -1)])
+
+    def test_machine_filter_and_bad_lines(self):
+        self.write([make_record(i, 'm1' if i % 3 == 0 else 'm2') for i in range(30)],
+                   '{"truncated": \n')
+        self.write([{'timestamp': '2024-01-02 00:00:00', 'user': 'admin', 'action': 'login', 'details': None}])
+        logs, cursor = audit.query_logs(machine='m1', limit=4)
+        self.assertEqual([log['action'] for log in logs], ['act27', 'act24', 'act21', 'act18'])
+        logs, cursor = audit.query_logs(machine='local', limit=4)
+        self.assertEqual(([log['action'] for log in logs], cursor), (['login'], None))
+
+    def test_missing_file_and_invalid_cursor(self):
+        self.assertEqual(audit.query_logs(), ([], None))
+        with self.assertRaises(ValueError):
+            audit.parse_cursor('abc')
+
+
+class TestIndexedQuery(AuditTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write([make_record(i, machine=f'm{i % 4}', user=('alice', 'bob')[i % 2 == 0 and i % 3 == 0],
+                                action=('save', 'toggle', 'delete')[i % 3], hour=i // 25)
+                    for i in range(100)])
+
+    def expected(self, predicate):
+        with open(config.AUDIT_LOG) as f:
+            return [r for r in map(json.loads, f) if predicate(r)][::-1]
+
+    def test_filters_match_full_scan(self):
+        logs, cursor = audit.query_logs(machine='m2', user='bob', limit=100)
+        self.assertEqual(logs, self.expected(lambda r: r['details']['machine'] == 'm2' and r['user'] == 'bob'))
+        self.assertIsNone(cursor)
+        logs, _ = audit.query_logs(action='delete', since='2024-01-01 01', until=audit.parse_time('2024-01-01 02:59', end=True))
+        self.assertEqual(logs, self.expected(lambda r: r['action'] == 'delete' and '01' <= r['timestamp'][11:13] <= '02'))
+        self.assertEqual(audit.query_logs(machine='m9'), ([], None))
+
+    def test_pagination_with_index(self):
+        pages, cursor = [], None
+        while True:
+            logs, cursor = audit.query_logs(action='toggle', limit=7, before=audit.parse_cursor(cursor))
+            pages.extend(logs)
+            if not cursor:
+                break
+        self.assertEqual(pages, self.expected(lambda r: r['action'] == 'toggle'))
+
+    def test_time_bounds_skip_other_hours(self):
+        audit.update_index()
+        lo, hi = audit._time_bounds('2024-01-01 02', audit.parse_time('2024-01-01 02:30', end=True),
+                                    os.path.getsize(config.AUDIT_LOG))
+        with open(config.AUDIT_LOG, 'rb') as f:
+            f.seek(lo)
+            self.assertTrue(json.loads(f.readline())['timestamp'].startswith('2024-01-01 02'))
+            f.seek(hi)
+            self.assertTrue(json.loads(f.readline())['timestamp'].startswith('2024-01-01 03'))
+
+    def test_incremental_and_unindexed_tail(self):
+        self.assertEqual(audit.update_index(), 100)
+        self.assertEqual(audit.update_index(), 0)
+        with patch.object(audit, 'update_index'):
+            self.write([make_record(0, machine='m1', action='late', hour=9)])
+            logs, _ = audit.query_logs(action='late')
+        self.assertEqual([log['action'] for log in logs], ['late'])
+        self.assertEqual(audit.update_index(), 1)
+
+    def test_crashed_update_is_trimmed(self):
+        audit.update_index()
+        state = audit._read_state()
+        self.write([make_record(0, machine='m1', action='again', hour=5)])
+        audit.update_index()
+        # 模拟上次补齐写入 posting 后、保存状态前中断
+        audit._write_state(state)
+        audit.update_index()
+        logs, _ = audit.query_logs(action='again')
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(len(audit._read_postings('machine', 'm1', float('inf'))), 26)
+
+    def test_rebuild_when_log_replaced(self):
+        audit.update_index()
+        os.remove(config.AUDIT_LOG)
+        self.write([make_record(1, machine='new')])
+        logs, _ = audit.query_logs(machine='m1')
+        self.assertEqual(logs, [])
+        self.assertEqual(len(audit.query_logs(machine='new')[0]), 1)
+
+    def test_log_action_indexes(self):
+        with patch.dict(config.AUDIT_CONFIG, {'async_write': False}):
+            audit.log_action('manual', {'machine': 'm3'})
+        logs, _ = audit.query_logs(user='system', action='manual')
+        self.assertEqual([(log['action'], log['details']) for log in logs], [('manual', {'machine': 'm3'})])
+
+
+class TestRotation(AuditTestCase):
+    def rotate_after(self, records, **conf):
+        self.write(records)
+        with patch.dict(config.AUDIT_CONFIG, conf):
+            audit.update_index()
+
+    def test_rotate_by_size_and_page_across_segments(self):
+        self.rotate_after([make_record(i, hour=1) for i in range(10)], rotate_bytes=1)
+        self.rotate_after([make_record(i, hour=2) for i in range(10, 20)], rotate_bytes=1)
+        self.write([make_record(i, hour=3) for i in range(20, 25)])
+        self.assertEqual([seq for seq, _ in audit.list_segments()], [1, 2])
+        header = audit.segment_header(audit.list_segments()[0][1])
+        self.assertEqual(header, {'segment': 1, 'start': '2024-01-01 01:00:00', 'end': '2024-01-01 01:00:09',
+                                  'records': 10, 'lines': 10})
+        with gzip.open(audit.list_segments()[1][1], 'rt') as f:
+            self.assertEqual(len(f.readlines()), 11)
+
+        pages, cursor = [], None
+        while True:
+            logs, cursor = audit.query_logs(limit=4, before=audit.parse_cursor(cursor))
+            pages.append([log['action'] for log in logs])
+            if not cursor:
+                break
+        self.assertEqual(sum(pages, []), [f'act{i}' for i in range(24, -1, -1)])
+        self.assertEqual([len(p) for p in pages], [4, 4, 4, 4, 4, 4, 1])
+
+    def test_page_filled_at_segment_boundary(self):
+        self.rotate_after([make_record(i) for i in range(5)], rotate_bytes=1)
+        self.rotate_after([make_record(i) for i in range(5, 10)], rotate_bytes=1)
+        self.write([make_record(i) for i in range(10, 13)])
+        logs, cursor = audit.query_logs(limit=8)
+        self.assertEqual(([log['action'] for log in logs], cursor), ([f'act{i}' for i in range(12, 4, -1)], '2:0'))
+        logs, cursor = audit.query_logs(limit=8, before=audit.parse_cursor(cursor))
+        self.assertEqual(([log['action'] for log in logs], cursor), ([f'act{i}' for i in range(4, -1, -1)], None))
+        self.assertEqual(audit._query_segment(1, audit.list_segments()[0][1], lambda log: True, 0), ([], '2:0'))
+
+    def test_rotation_between_page_fetches(self):
+        """两次翻页之间当前文件被轮转: cursor 指向新段中的同一位置，不重复也不遗漏"""
+        for filters in ({}, {'user': 'admin'}):
+            with self.subTest(filters=filters):
+                self.tearDown()
+                self.setUp()
+                self.write([make_record(i) for i in range(10)])
+                logs, cursor = audit.query_logs(limit=4, **filters)
+                actions = [log['action'] for log in logs]
+                with patch.dict(config.AUDIT_CONFIG, {'rotate_bytes': 1}):
+                    audit.update_index()
+                self.write([make_record(i) for i in range(10, 13)])
+                while cursor:
+                    logs, cursor = audit.query_logs(limit=4, before=audit.parse_cursor(cursor), **filters)
+                    actions += [log['action'] for log in logs]
+                self.assertEqual(actions, [f'act{i}' for i in range(9, -1, -1)])
+
+    def test_skips_segments_outside_range(self):
+        self.rotate_after([make_record(i, hour=1) for i in range(5)], rotate_bytes=1)
+        self.rotate_after([make_record(i, hour=5, machine='m1') for i in range(5)], rotate_bytes=1)
+        with patch.object(audit, '_query_segment', wraps=audit._query_segment) as query_segment:
+            logs, _ = audit.query_logs(machine='m1', since='2024-01-01 04', until='2024-01-01 06:00:00')
+        self.assertEqual(len(logs), 5)
+        self.assertEqual([c.args[0] for c in query_segment.call_args_list], [2])
+
+    def test_rotate_by_age_and_resume_interrupted(self):
+        self.rotate_after([make_record(i) for i in range(3)], rotate_days=1)
+        self.assertEqual(len(audit.list_segments()), 1)
+        self.assertFalse(os.path.exists(config.AUDIT_LOG))
+        self.write([make_record(i) for i in range(3, 6)])
+        os.rename(config.AUDIT_LOG, config.AUDIT_LOG + '.rotating')
+        audit.update_index()
+        self.assertEqual(audit.segment_header(audit.list_segments()[-1][1])['records'], 3)
+        self.assertEqual(len(audit.query_logs()[0]), 6)
+        self.assertEqual(audit.parse_cursor('2:17'), (2, 17))
+        with self.assertRaises(ValueError):
+            audit.parse_cursor('0:1')
+
+
+class TestAsyncWriter(AuditTestCase):
+    def test_batched_writes_are_whole_lines(self):
+        writes = []
+        real_write = os.write
+
+        def record_write(fd, data):
+            writes.append(bytes(data))
+            return real_write(fd, data)
+
+        with patch.object(audit, '_write_records', wraps=audit._write_records) as write_records:
+            with patch.object(audit.os, 'write', record_write):
+                threads = [threading.Thread(target=lambda n=n: [audit.log_action('bulk', {'n': n, 'i': i})
+                                                                for i in range(50)])
+                           for n in range(4)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                audit.flush()
+        self.assertTrue(all(w.endswith(b'\n') for w in writes))
+        self.assertLessEqual(write_records.call_count, 200)
+        with open(config.AUDIT_LOG) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(sorted((r['details']['n'], r['details']['i']) for r in records),
+                         [(n, i) for n in range(4) for i in range(50)])
+        for n in range(4):
+            self.assertEqual([r['details']['i'] for r in records if r['details']['n'] == n], list(range(50)))
+
+    def test_query_sees_queued_records(self):
+        audit.log_action('queued')
+        self.assertEqual([log['action'] for log in audit.query_logs(action='queued')[0]], ['queued'])
+
+    def test_processes_do_not_interleave(self):
+        script = (
+            'import sys; sys.path.insert(0, sys.argv[1]); from core import config, audit; '
+            'config.AUDIT_LOG = sys.argv[2]; config.AUDIT_CONFIG.update(rotate_bytes=0, rotate_days=0); '
+            '[audit.log_action("proc", {"pad": "x" * 3000, "i": i}) for i in range(200)]'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        procs = [subprocess.Popen([sys.executable, '-c', script, root, config.AUDIT_LOG]) for _ in range(3)]
+        self.assertEqual([p.wait(timeout=60) for p in procs], [0, 0, 0])
+        with open(config.AUDIT_LOG) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 600)
+        self.assertEqual(len(audit.query_logs(action='proc', limit=1000)[0]), 600)
+
+
+class TestExport(AuditTestCase):
+    def test_exports_segments_then_active_in_order(self):
+        self.write([make_record(i, machine=f'm{i % 2}', hour=1) for i in range(10)])
+        with patch.dict(config.AUDIT_CONFIG, {'rotate_bytes': 1}):
+            audit.update_index()
+        self.write([make_record(i, machine=f'm{i % 2}', hour=2) for i in range(10, 20)], '{"partial')
+        lines = list(audit.export_lines(machine='m1'))
+        self.assertEqual([json.loads(line)['action'] for line in lines], [f'act{i}' for i in range(1, 20, 2)])
+        self.assertTrue(all(line.endswith(b'\n') for line in lines))
+        with open(audit.list_segments()[0][1], 'rb') as f:
+            self.assertIn(lines[0], gzip.decompress(f.read()))
+
+        lines = list(audit.export_lines(since='2024-01-01 02', until=audit.parse_time('2024-01-01 02:00:12', end=True)))
+        self.assertEqual([json.loads(line)['action'] for line in lines], ['act10', 'act11', 'act12'])
+
+    def test_rotation_during_export(self):
+        self.write([make_record(i) for i in range(5)])
+        lines = audit.export_lines()
+        first = next(lines)
+        with patch.dict(config.AUDIT_CONFIG, {'rotate_bytes': 1}):
+            audit.update_index()
+        self.assertEqual(len([first] + list(lines)), 5)
+
+    def test_rotation_while_taking_snapshot(self):
+        self.write([make_record(i) for i in range(5)])
+        list_segments = audit.list_segments
+        threads = []
+
+        def rotate_then_list():
+            # 另一个 worker 在打开当前文件之后、列出段之前尝试轮转
+            def rotate():
+                with patch.dict(config.AUDIT_CONFIG, {'rotate_bytes': 1}):
+                    audit.update_index()
+            threads.append(threading.Thread(target=rotate))
+            threads[0].start()
+            threads[0].join(0.2)
+            return list_segments()
+
+        with patch.object(audit, 'list_segments', rotate_then_list):
+            lines = list(audit.export_lines(since='2024-01-01'))
+        threads[0].join()
+        self.assertEqual([json.loads(line)['action'] for line in lines], [f'act{i}' for i in range(5)])
+        self.assertEqual(len(audit.list_segments()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+# tests/test_backups.py - 备份存储测试
+# 测试: 内容寻址对象、连续重复跳过、跨机器共享、多进程追加、保留数量、旧版 .bak 迁移、未引用对象清理、关键帧与差异链、版本统计与分页
+# 运行: python -m pytest tests/test_backups.py -v
+
+import os
+import json
+import zlib
+import tempfile
+import subprocess
+import unittest
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config, backups
+
+
+class BackupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.patches = [
+            patch.object(config, 'BACKUP_DIR', os.path.join(self.tmpdir.name, 'backups')),
+            patch.dict(config.BACKUP_CONFIG, {'keep': 3}),
+            patch.dict(backups._reconstructed, clear=True),
+            patch.dict(backups._manifests, clear=True),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def objects(self):
+        root = os.path.join(config.BACKUP_DIR, backups.OBJECTS_DIR_NAME)
+        return sorted(p + n for p in os.listdir(root) for n in os.listdir(os.path.join(root, p)))
+
+
+class TestBackupStore(BackupTestCase):
+    def test_consecutive_duplicates_skipped(self):
+        self.assertIsNotNone(backups.add_backup('m1', 'root', 'a\n', 'admin'))
+        self.assertIsNone(backups.add_backup('m1', 'root', 'a\n', 'admin'))
+        backups.add_backup('m1', 'root', 'b\n', 'admin')
+        backups.add_backup('m1', 'root', 'a\n', 'admin')
+        entries = backups.list_backups('m1', 'root')
+        self.assertEqual([backups.read_object(e['hash']) for e in entries], ['a\n', 'b\n', 'a\n'])
+        self.assertEqual(len(set(e['filename'] for e in entries)), 3)
+        self.assertEqual(backups.get_backup('m1', 'root', entries[1]['filename']), 'b\n')
+
+    def test_objects_shared_across_machines(self):
+        backups.add_backup('m1', 'root', 'same\n', 'admin')
+        backups.add_backup('m2', 'www', 'same\n', 'system')
+        self.assertEqual(self.objects(), [backups.object_hash('same\n')])
+        self.assertEqual(backups.last_backup_hash('m2', 'www'), backups.object_hash('same\n'))
+
+    def test_backups_from_other_process_visible(self):
+        script = (
+            'import sys; sys.path.insert(0, sys.argv[1]); from core import config, backups; '
+            'config.BACKUP_DIR = sys.argv[2]; backups.add_backup("m1", "root", "y\\n", "other")'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        backups.add_backup('m1', 'root', 'x\n', 'admin')
+        subprocess.run([sys.executable, '-c', script, root, config.BACKUP_DIR], check=True, timeout=60)
+        self.assertEqual(backups.last_backup_hash('m1', 'root'), backups.object_hash('y\n'))
+        self.assertIsNotNone(backups.add_backup('m1', 'root', 'x\n', 'admin'))
+        self.assertEqual([e['username'] for e in backups.list_backups('m1', 'root')], ['admin', 'other', 'admin'])
+
+    def test_manifest_replaced_with_reused_inode(self):
+        backups.add_backup('m1', 'root', 'a\n', 'admin')
+        subdir = os.path.join(config.BACKUP_DIR, 'm1', 'root')
+        path = os.path.join(subdir, backups.MANIFEST_NAME)
+        backups._read_manifest(subdir)
+        # 其他进程改写 manifest 后新文件恰好复用了同一个 inode（原地改写模拟）
+        entry = dict(backups.list_backups('m1', 'root')[0], filename='other.bak', username='other')
+        with open(path, 'r+') as f:
+            f.write(json.dumps(entry) + '\n' + json.dumps(dict(entry, filename='next.bak')) + '\n')
+        self.assertEqual([e['filename'] for e in backups._read_manifest(subdir)], ['other.bak', 'next.bak'])
+
+    def test_keep_and_prune(self):
+        for i in range(5):
+            backups.add_backup('m1', 'root', f'{i}\n', 'admin')
+        entries = backups.list_backups('m1', 'root')
+        self.assertEqual([backups.read_object(e['hash']) for e in entries], ['4\n', '3\n', '2\n'])
+        self.assertEqual(backups.prune_objects(), 2)
+        self.assertEqual(self.objects(), sorted(e['hash'] for e in entries))
+
+    def test_prune_waits_for_backup_in_other_process(self):
+        """其他 worker 已写入对象、尚未追加 manifest 条目时清理不删除该对象"""
+        script = (
+            'import sys, time; sys.path.insert(0, sys.argv[1]); from core import config, backups; '
+            'config.BACKUP_DIR = sys.argv[2]; store = backups.store_object\n'
+            'def slow(*args, **kwargs):\n'
+            '    digest = store(*args, **kwargs); print("stored", flush=True); time.sleep(0.5); return digest\n'
+            'backups.store_object = slow; backups.add_backup("m1", "root", "late\\n", "other")'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        backups.add_backup('m1', 'root', 'x\n', 'admin')
+        proc = subprocess.Popen([sys.executable, '-c', script, root, config.BACKUP_DIR],
+                                stdout=subprocess.PIPE, text=True)
+        try:
+            self.assertEqual(proc.stdout.readline().strip(), 'stored')
+            self.assertEqual(backups.prune_objects(), 0)
+        finally:
+            proc.stdout.close()
+            proc.wait(timeout=60)
+        self.assertEqual(backups.read_object(backups.last_backup_hash('m1', 'root')), 'late\n')
+
+    def test_prune_once_per_interval(self):
+        for i in range(5):
+            backups.add_backup('m1', 'root', f'{i}\n', 'admin')
+        self.assertEqual(backups.prune_objects_if_due(3600), 2)
+        backups.add_backup('m1', 'root', '5\n', 'admin')
+        self.assertIsNone(backups.prune_objects_if_due(3600))
+        self.assertEqual(backups.prune_objects_if_due(0), 1)
+
+    def test_legacy_migration(self):
+        subdir = os.path.join(config.BACKUP_DIR, 'm1', 'root')
+        os.makedirs(subdir)
+        for name, content in [('crontab_20240101_000000_admin.bak', 'x\n'),
+                              ('crontab_20240102_000000_admin.bak', 'x\n'),
+                              ('crontab_20240103_000000_ops_team.bak', 'y\n')]:
+            with open(os.path.join(subdir, name), 'w') as f:
+                f.write(content)
+        # 读取接口不迁移，也不删除旧文件
+        self.assertEqual(backups.list_backups('m1', 'root'), [])
+        self.assertEqual(len(os.listdir(subdir)), 3)
+        self.assertEqual(backups.migrate_legacy_backups(), 1)
+        entries = backups.list_backups('m1', 'root')
+        self.assertEqual([(e['timestamp'], e['username']) for e in entries],
+                         [('20240103_000000', 'ops_team'), ('20240101_000000', 'admin')])
+        self.assertEqual(backups.get_backup('m1', 'root', 'crontab_20240103_000000_ops_team.bak'), 'y\n')
+        self.assertEqual([name for name in os.listdir(subdir) if name.endswith('.bak')], [])
+        self.assertEqual(backups.migrate_legacy_backups(), 0)
+        self.assertIsNone(backups.add_backup('m1', 'root', 'y\n', 'admin'))
+
+    def test_stats(self):
+        backups.add_backup('m1', 'root', 'A=1\n0 1 * * * /a.sh\n#0 2 * * * /b.sh', 'admin')
+        backups.add_backup('m1', 'root', 'A=1\n0 1 * * * /a.sh\n0 2 * * * /b.sh\n0 3 * * * /c.sh\n', 'admin')
+        second, first = backups.list_backups('m1', 'root')
+        self.assertEqual({k: first[k] for k in ('size', 'lines', 'tasks', 'added', 'removed')},
+                         {'size': 36, 'lines': 3, 'tasks': 2, 'added': 2, 'removed': 0})
+        self.assertEqual({k: second[k] for k in ('lines', 'tasks', 'added', 'removed')},
+                         {'lines': 4, 'tasks': 3, 'added': 2, 'removed': 1})
+
+    def test_query_pages_and_time_range(self):
+        subdir = os.path.join(config.BACKUP_DIR, 'm1', 'root')
+        os.makedirs(subdir)
+        for day in range(1, 4):
+            with open(os.path.join(subdir, f'crontab_2024010{day}_120000_admin.bak'), 'w') as f:
+                f.write(f'{day}\n')
+        backups.migrate_legacy_backups()
+        page, cursor = backups.query_backups('m1', 'root', limit=2)
+        self.assertEqual([e['timestamp'][:8] for e in page], ['20240103', '20240102'])
+        page, cursor = backups.query_backups('m1', 'root', limit=2, cursor=cursor)
+        self.assertEqual(([e['timestamp'][:8] for e in page], cursor), (['20240101'], None))
+        page, cursor = backups.query_backups('m1', 'root', since='20240102_000000', until='20240102_235959')
+        self.assertEqual(([e['timestamp'][:8] for e in page], cursor), (['20240102'], None))
+        with self.assertRaises(KeyError):
+            backups.query_backups('m1', 'root', cursor='missing.bak')
+
+    def test_manifest_tail_read(self):
+        backups.add_backup('m1', 'root', 'a\n', 'admin')
+        subdir = os.path.join(config.BACKUP_DIR, 'm1', 'root')
+        first = backups._read_manifest(subdir)
+        with open(os.path.join(subdir, backups.MANIFEST_NAME), 'a') as f:
+            f.write('{"filename": "x.bak", "timestamp": "20990101_000000", "username": "ext", "hash": "00"}\n{"partial')
+        entries = backups._read_manifest(subdir)
+        self.assertEqual([e['filename'] for e in entries][1:], ['x.bak'])
+        self.assertEqual(len(first), 1)
+        with open(os.path.join(subdir, backups.MANIFEST_NAME), 'a') as f:
+            f.write('": 1}\n')
+        self.assertEqual(len(backups._read_manifest(subdir)), 3)
+
+    def test_missing(self):
+        self.assertEqual(backups.list_backups('none', 'root'), [])
+        self.assertIsNone(backups.last_backup_hash('none', 'root'))
+        self.assertIsNone(backups.get_backup('none', 'root', 'crontab_x.bak'))
+        self.assertIsNone(backups.read_object('../../etc/passwd'))
+        for machine_id, linux_user in [('..', 'x'), ('m1', '../..'), ('a/b', 'root'), ('m1', '.')]:
+            with self.assertRaises(ValueError):
+                backups.list_backups(machine_id, linux_user)
+
+
+class TestDeltaStorage(BackupTestCase):
+    def setUp(self):
+        super().setUp()
+        p = patch.dict(config.BACKUP_CONFIG, {'keep': 50, 'keyframe_interval': 4})
+        p.start()
+        self.patches.append(p)
+
+    def versions(self, count):
+        lines = [f'{i} * * * * /opt/jobs/task_{i}.sh >> /var/log/task_{i}.log 2>&1\n' for i in range(60)]
+        for v in range(count):
+            lines[v % 60] = f'# v{v} ' + lines[v % 60]
+            yield ''.join(lines)
+
+    def header(self, digest):
+        with open(backups._object_path(digest), 'rb') as f:
+            return zlib.decompress(f.read()).split(b'\n', 1)[0].decode()
+
+    def test_chain_roundtrip_and_keyframe_interval(self):
+        contents = list(self.versions(10))
+        for content in contents:
+            backups.add_backup('m1', 'root', content, 'admin')
+        hashes = [backups.object_hash(c) for c in contents]
+        self.assertEqual([self.header(h) == 'K' for h in hashes],
+                         [True, False, False, False, True, False, False, False, True, False])
+        self.assertEqual(self.header(hashes[3]), f'D {hashes[2]} 3')
+        self.assertEqual(self.header(hashes[5]), f'D {hashes[4]} 1')
+        backups._reconstructed.clear()
+        entries = list(reversed(backups.list_backups('m1', 'root')))
+        self.assertEqual([backups.get_backup('m1', 'root', e['filename']) for e in entries], contents)
+
+    def test_delta_smaller_than_keyframe(self):
+        first, second = self.versions(2)
+        backups.store_object(first)
+        digest = backups.store_object(second, base=backups.object_hash(first))
+        size = os.path.getsize(backups._object_path(digest))
+        self.assertLess(size, len(zlib.compress(second.encode())) / 2)
+
+    def test_legacy_plain_object_as_base(self):
+        old = 'plain\nold\n'
+        path = backups._object_path(backups.object_hash(old))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(old)
+        self.assertEqual(backups.read_object(backups.object_hash(old)), old)
+        digest = backups.store_object(old + 'new\n', base=backups.object_hash(old))
+        backups._reconstructed.clear()
+        self.assertEqual(backups.read_object(digest), old + 'new\n')
+
+    def test_prune_keeps_delta_bases(self):
+        config.BACKUP_CONFIG['keep'] = 2
+        contents = list(self.versions(3))
+        for content in contents:
+            backups.add_backup('m1', 'root', content, 'admin')
+        self.assertEqual(backups.prune_objects(), 0)
+        backups._reconstructed.clear()
+        self.assertEqual(backups.read_object(backups.object_hash(contents[2])), contents[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
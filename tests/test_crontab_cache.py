@@ -0,0 +1,160 @@
+# tests/test_crontab_cache.py - crontab 读取缓存测试
+# 测试: 读取缓存命中、TTL、保存失效、批量读取预热、请求内复用、解析结果缓存
+# 运行: python -m pytest tests/test_crontab_cache.py -v
+
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config
+from core import crontab as core_crontab
+from tests.helpers import MemoryExecutor
+
+
+class ReadCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.executor = MemoryExecutor({'root': '0 * * * * /a.sh\n'})
+        self.patches = [
+            patch.object(config, 'BACKUP_DIR', self.tmpdir.name),
+            patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 60}),
+            patch.object(core_crontab, 'get_machine_executor', return_value=self.executor),
+            patch.dict(core_crontab._crontab_cache, clear=True),
+            patch.dict(core_crontab._known_hashes, clear=True),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+
+class TestCrontabReadCache(ReadCacheTestCase):
+    """测试 get_crontab_raw 读取缓存"""
+
+    def test_repeated_reads_hit_cache(self):
+        core_crontab.get_crontab_raw('m1', 'root')
+        core_crontab.parse_crontab('m1', 'root')
+        core_crontab.get_all_tasks('m1', 'root')
+        self.assertEqual(self.executor.reads, 1)
+
+    def test_keys_are_per_machine_and_user(self):
+        core_crontab.get_crontab_raw('m1', 'root')
+        core_crontab.get_crontab_raw('m1', 'www')
+        core_crontab.get_crontab_raw('m2', 'root')
+        self.assertEqual(self.executor.reads, 3)
+
+    def test_ttl_disabled(self):
+        with patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 0}):
+            core_crontab.get_crontab_raw('m1', 'root')
+            core_crontab.get_crontab_raw('m1', 'root')
+        self.assertEqual(self.executor.reads, 2)
+
+    def test_save_invalidates(self):
+        core_crontab.get_crontab_raw('m1', 'root')
+        core_crontab.save_crontab('0 1 * * * /b.sh\n', 'admin', 'm1', 'root')
+        self.assertEqual(core_crontab.get_crontab_raw('m1', 'root'), '0 1 * * * /b.sh\n')
+
+    def test_batch_read_primes_cache(self):
+        core_crontab.get_machine_crontabs('m1', ['root', 'www'])
+        core_crontab.get_crontab_raw('m1', 'root')
+        core_crontab.get_crontab_raw('m1', 'www')
+        self.assertEqual(self.executor.reads, 1)
+
+    def test_invalidated_read_not_cached(self):
+        """读取过程中发生失效，读取结果不得写入缓存"""
+        original = self.executor.get_crontab
+
+        def racing_read(linux_user=''):
+            content = original(linux_user)
+            core_crontab.invalidate_crontab_cache('m1', 'root')
+            return content
+
+        self.executor.get_crontab = racing_read
+        core_crontab.get_crontab_raw('m1', 'root')
+        self.assertNotIn(('m1', 'root'), core_crontab._crontab_cache)
+
+
+class TestRequestScopedReads(ReadCacheTestCase):
+    """测试默认配置（TTL 关闭）下同一请求内复用读取结果"""
+
+    def setUp(self):
+        super().setUp()
+        p = patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 0})
+        p.start()
+        self.patches.append(p)
+        self.app = Flask(__name__)
+
+    def test_reused_within_request_only(self):
+        with self.app.test_request_context():
+            core_crontab.get_crontab_raw('m1', 'root')
+            core_crontab.parse_crontab('m1', 'root')
+        self.assertEqual(self.executor.reads, 1)
+        # 另一个 worker 保存后，下一个请求读到新内容
+        self.executor.crontabs['root'] = '0 2 * * * /c.sh\n'
+        with self.app.test_request_context():
+            self.assertEqual(core_crontab.get_crontab_raw('m1', 'root'), '0 2 * * * /c.sh\n')
+        self.assertEqual(self.executor.reads, 2)
+
+    def test_save_invalidates_within_request(self):
+        with self.app.test_request_context():
+            core_crontab.get_crontab_raw('m1', 'root')
+            core_crontab.save_crontab('0 1 * * * /b.sh\n', 'admin', 'm1', 'root')
+            self.assertEqual(core_crontab.get_crontab_raw('m1', 'root'), '0 1 * * * /b.sh\n')
+        self.assertEqual(core_crontab._crontab_cache, {})
+
+
+class TestParseCache(unittest.TestCase):
+    """测试 parse_crontab_content 按内容哈希缓存"""
+
+    CONTENT = "# 维护\n0 3 * * * /cleanup.sh\n#0 4 * * * /off.sh\n"
+
+    def setUp(self):
+        self.patches = [
+            patch.dict(config.CACHE_CONFIG, {'parse_entries': 2}),
+            patch.dict(core_crontab._parse_cache_stats, {'hits': 0, 'misses': 0}),
+            patch.object(core_crontab, '_parse_cache', core_crontab.OrderedDict()),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+
+    def test_hit_returns_equal_result(self):
+        first = core_crontab.parse_crontab_content(self.CONTENT)
+        second = core_crontab.parse_crontab_content(self.CONTENT)
+        self.assertEqual(first, second)
+        stats = core_crontab.get_parse_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_result_mutation_does_not_leak(self):
+        groups = core_crontab.parse_crontab_content(self.CONTENT)
+        groups[0]['tasks'][0]['enabled'] = False
+        groups[0]['tasks'].clear()
+        again = core_crontab.parse_crontab_content(self.CONTENT)
+        self.assertTrue(again[0]['tasks'][0]['enabled'])
+
+    def test_bounded_lru(self):
+        for i in range(3):
+            core_crontab.parse_crontab_content(f"0 {i} * * * /job.sh\n")
+        self.assertEqual(core_crontab.get_parse_cache_stats()['size'], 2)
+        core_crontab.parse_crontab_content("0 0 * * * /job.sh\n")
+        self.assertEqual(core_crontab.get_parse_cache_stats()['misses'], 4)
+
+    def test_disabled(self):
+        with patch.dict(config.CACHE_CONFIG, {'parse_entries': 0}):
+            core_crontab.parse_crontab_content(self.CONTENT)
+        self.assertEqual(core_crontab.get_parse_cache_stats()['size'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
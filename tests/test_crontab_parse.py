@@ -1,5 +1,5 @@
 # tests/test_crontab_parse.py - Crontab 解析逻辑单元测试
-# 测试: parse_crontab 分组规则、任务识别、注释处理
+# 测试: parse_crontab 分组规则、任务识别、注释处理、词法分析
 # 运行: python -m pytest tests/test_crontab_parse.py -v
 
 import unittest
@@ -9,6 +9,8 @@ import sys, os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from core.crontab import (
+    tokenize_crontab,
+    parse_crontab_content,
     is_cron_task_line,
     validate_cron_field,
     validate_cron_schedule,
@@ -40,6 +42,40 @@ class TestIsCronTaskLine(unittest.TestCase):
         self.assertFalse(is_cron_task_line('MAILTO=admin@example.com'))
 
 
+class TestTokenizeCrontab(unittest.TestCase):
+    """测试 tokenize_crontab 单遍分类"""
+
+    def test_kinds(self):
+        raw = "SHELL=/bin/bash\n\n# 备份\n0 2 * * * /backup.sh\n#@daily /off.sh\nnot a cron line"
+        kinds = [t.kind for t in tokenize_crontab(raw)]
+        self.assertEqual(kinds, ['env', 'blank', 'comment', 'task', 'disabled', 'invalid'])
+
+    def test_macros_and_names(self):
+        tokens = tokenize_crontab("@reboot /start.sh\n0 9 * JAN-jun mon,fri /report.sh\n@Daily /x.sh")
+        self.assertEqual([(t.kind, t.schedule, t.command) for t in tokens], [
+            ('task', '@reboot', '/start.sh'),
+            ('task', '0 9 * JAN-jun mon,fri', '/report.sh'),
+            ('task', '@Daily', '/x.sh'),
+        ])
+
+    def test_unknown_names_are_not_tasks(self):
+        kinds = [t.kind for t in tokenize_crontab("#1 2 3 four five six\n@sometimes /x.sh")]
+        self.assertEqual(kinds, ['comment', 'invalid'])
+
+    def test_errors_only_when_validating(self):
+        raw = "60 * * * * /bad.sh\n#0 3 * foo * /x.sh\n@daily"
+        self.assertEqual([t.error for t in tokenize_crontab(raw)], [None, None, None])
+        errors = [t.error for t in tokenize_crontab(raw, validate=True)]
+        self.assertIn('Invalid minute', errors[0])
+        self.assertIsNotNone(errors[1])
+        self.assertIn('5 fields', errors[2])
+
+    def test_parse_macro_task(self):
+        groups = parse_crontab_content("# 启动\n@reboot /start.sh\n#@hourly /sync.sh\n")
+        tasks = groups[0]['tasks']
+        self.assertEqual([(t['schedule'], t['enabled']) for t in tasks], [('@reboot', True), ('@hourly', False)])
+
+
 class TestValidateCronField(unittest.TestCase):
     """测试单个 cron 字段验证"""
 
@@ -110,6 +146,14 @@ class TestValidateCronSchedule(unittest.TestCase):
             ok, err = validate_cron_schedule(expr)
             self.assertFalse(ok, f'{expr} ({desc}) should be invalid')
 
+    def test_macros_and_names(self):
+        for expr in ['@daily', '@reboot', '@YEARLY', '0 9 * jan-mar mon-fri', '0 0 1 Dec *']:
+            ok, err = validate_cron_schedule(expr)
+            self.assertTrue(ok, f'{expr} should be valid, got: {err}')
+        for expr in ['@sometimes', '0 0 * foo *', '0 0 * * funday', '0 jan * * *']:
+            ok, _ = validate_cron_schedule(expr)
+            self.assertFalse(ok, f'{expr} should be invalid')
+
     def test_weekday_7_valid(self):
         """0 和 7 都表示周日"""
         ok, _ = validate_cron_schedule('0 0 * * 7')
@@ -188,6 +232,10 @@ PATH=/usr/bin
         ok, errors = validate_crontab_content('')
         self.assertTrue(ok)
 
+    def test_macro_lines_pass(self):
+        ok, errors = validate_crontab_content("@reboot /start.sh\n#@daily /off.sh\n0 9 * * mon /w.sh\n")
+        self.assertTrue(ok, errors)
+
 
 class TestParseCrontab(unittest.TestCase):
     """测试 parse_crontab 分组解析（需要 mock executor）"""
@@ -0,0 +1,61 @@
+# tests/test_diff.py - 版本差异测试
+# 测试: 行级操作、上下文省略、unified 格式、按哈希对缓存
+# 运行: python -m pytest tests/test_diff.py -v
+
+import os
+import unittest
+from unittest.mock import patch
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config, diff
+
+OLD = ''.join(f'{i} * * * * /job{i}.sh\n' for i in range(10))
+NEW = OLD.replace('3 * * * * /job3.sh\n', '3 * * * * /job3.sh --fast\n').replace('9 * * * * /job9.sh\n', '')
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.dict(diff._diff_cache, clear=True),
+            patch.dict(diff._diff_cache_stats, {'hits': 0, 'misses': 0}),
+            patch.dict(config.CACHE_CONFIG, {'diff_entries': 2}),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+
+    def test_line_ops_rebuild_both_sides(self):
+        result = diff.diff_contents(OLD, NEW)
+        self.assertEqual((result['added'], result['removed']), (1, 2))
+        old = [l for op, lines in result['ops'] if op in '=-' for l in lines]
+        new = [l for op, lines in result['ops'] if op in '=+' for l in lines]
+        self.assertEqual(('\n'.join(old), '\n'.join(new)), (OLD, NEW))
+
+    def test_context_elides_unchanged_lines(self):
+        ops = diff.diff_contents(OLD, NEW, context=1)['ops']
+        self.assertEqual([op for op, _ in ops], ['~', '=', '-', '+', '=', '~', '=', '-', '='])
+        self.assertEqual(ops[0], ['~', 2])
+        self.assertEqual(ops[5], ['~', 3])
+
+    def test_unified(self):
+        text = diff.diff_contents(OLD, NEW, fmt='unified', context=0)['diff']
+        self.assertIn('-3 * * * * /job3.sh\n+3 * * * * /job3.sh --fast\n', text)
+        self.assertIn('-9 * * * * /job9.sh\n', text)
+        with self.assertRaises(ValueError):
+            diff.diff_contents(OLD, NEW, fmt='html')
+
+    def test_memoized_by_hash_pair(self):
+        first = diff.diff_contents(OLD, NEW)
+        self.assertIs(diff.diff_contents(''.join([OLD]), NEW), first)
+        self.assertIsNot(diff.diff_contents(NEW, OLD), first)
+        diff.diff_contents(OLD, OLD)
+        self.assertEqual(diff.get_diff_cache_stats(), {'hits': 1, 'misses': 3, 'size': 2, 'max_size': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+# tests/test_executor.py - 执行器单元测试
+# 测试: 批量读取 crontab 的脚本构造与输出解析
+# 运行: python -m pytest tests/test_executor.py -v
+
+import os
+import hashlib
+import socket
+import stat
+import tempfile
+import unittest
+
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from executor import (
+    HAS_PARAMIKO, LocalExecutor, SimulatedExecutor, SimulatedFailure, SAVE_CONFLICT, get_executor,
+    build_crontabs_script, parse_crontabs_output, parse_hashes_output,
+)
+from core import config
+from core.at_jobs import parse_atq_output, wrap_command_for_history
+
+FAKE_CRONTAB = """#!/bin/sh
+[ "$1" = "-u" ] && u=$2 || u=me
+[ "$u" = nobody ] && { echo "no crontab for nobody" >&2; exit 1; }
+printf '# %s\\n0 * * * * echo %s\\n' "$u" "$u"
+"""
+
+
+class TestParseCrontabsOutput(unittest.TestCase):
+    """测试批量输出解析"""
+
+    def test_multiple_users(self):
+        output = (
+            '@@M BEGIN root\n0 * * * * a\n# tail\n\n@@M END 0\n'
+            '@@M BEGIN www\n\n@@M END 1\n'
+        )
+        result = parse_crontabs_output(output, '@@M')
+        self.assertEqual(result, {'root': '0 * * * * a\n# tail\n', 'www': ''})
+
+    def test_content_without_trailing_newline(self):
+        result = parse_crontabs_output('@@M BEGIN root\n0 * * * * a\n@@M END 0\n', '@@M')
+        self.assertEqual(result, {'root': '0 * * * * a'})
+
+    def test_foreign_marker_ignored(self):
+        output = '@@M BEGIN root\n@@X END 0\n0 * * * * a\n\n@@M END 0\n'
+        result = parse_crontabs_output(output, '@@M')
+        self.assertEqual(result, {'root': '@@X END 0\n0 * * * * a\n'})
+
+    def test_users_are_quoted(self):
+        script = build_crontabs_script(["o'x", 'root'], '@@M')
+        self.assertIn("'o'\"'\"'x'", script)
+
+
+class TestLocalGetCrontabs(unittest.TestCase):
+    """测试本地执行器一次调用读取多个用户"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'crontab')
+        with open(path, 'w') as f:
+            f.write(FAKE_CRONTAB)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.old_path = os.environ['PATH']
+        os.environ['PATH'] = self.tmpdir.name + os.pathsep + self.old_path
+
+    def tearDown(self):
+        os.environ['PATH'] = self.old_path
+        self.tmpdir.cleanup()
+
+    def test_get_crontabs(self):
+        result = LocalExecutor().get_crontabs(['root', 'nobody', ''])
+        self.assertEqual(result['root'], '# root\n0 * * * * echo root\n')
+        self.assertEqual(result['nobody'], '')
+        self.assertEqual(result[''], '# me\n0 * * * * echo me\n')
+
+    def test_matches_single_fetch(self):
+        executor = LocalExecutor()
+        self.assertEqual(executor.get_crontabs(['www'])['www'], executor.get_crontab('www'))
+
+    def test_empty_user_list(self):
+        self.assertEqual(LocalExecutor().get_crontabs([]), {})
+
+    def test_get_crontab_hashes(self):
+        executor = LocalExecutor()
+        hashes = executor.get_crontab_hashes(['root', 'nobody'])
+        self.assertEqual(hashes['root'], hashlib.sha256(executor.get_crontab('root').encode()).hexdigest())
+        self.assertEqual(hashes['nobody'], hashlib.sha256(b'').hexdigest())
+
+
+class TestParseHashesOutput(unittest.TestCase):
+    """测试哈希输出解析"""
+
+    def test_parse(self):
+        digest = 'ab' * 32
+        output = f'@@M\troot\t{digest}  -\n@@M\twww\tnot-a-hash\n@@X\tdb\t{digest}  -\n'
+        self.assertEqual(parse_hashes_output(output, '@@M'), {'root': digest})
+
+
+
+class TestSimulatedExecutor(unittest.TestCase):
+    """测试模拟执行器"""
+
+    def test_factory_and_payload(self):
+        executor = get_executor({'type': 'simulated', 'linux_users': ['root', 'www'], 'payload_lines': 30, 'seed': 7})
+        self.assertIsInstance(executor, SimulatedExecutor)
+        crontabs = executor.get_crontabs(['root', 'www', 'nobody'])
+        self.assertEqual(len(crontabs['root'].splitlines()), 30)
+        self.assertNotEqual(crontabs['root'], crontabs['www'])
+        self.assertEqual(crontabs['nobody'], '')
+        self.assertEqual(executor.list_crontab_users(), ['root', 'www'])
+
+    def test_save_if_and_hashes(self):
+        executor = SimulatedExecutor(['root'])
+        current = executor.get_crontab('root')
+        expected = hashlib.sha256(current.encode()).hexdigest()
+        self.assertEqual(executor.get_crontab_hashes(['root']), {'root': expected})
+        self.assertEqual(executor.save_crontab_if('x\n', 'root', 'stale'), (False, SAVE_CONFLICT))
+        self.assertEqual(executor.save_crontab_if('x\n', 'root', expected), (True, ''))
+        self.assertEqual(executor.get_crontab('root'), 'x\n')
+
+    def test_external_changes(self):
+        executor = SimulatedExecutor(['root'], change_rate=1.0)
+        first = executor.get_crontab_hashes(['root'])
+        self.assertNotEqual(executor.get_crontab_hashes(['root']), first)
+
+    def test_failure_rate(self):
+        executor = SimulatedExecutor(['root'], failure_rate=1.0)
+        with self.assertRaises(SimulatedFailure):
+            executor.get_crontab('root')
+        self.assertFalse(executor.test_connection()[0])
+
+    def test_at_job_lifecycle(self):
+        executor = SimulatedExecutor(['root'])
+        wrapped = wrap_command_for_history("echo 'hi'", 'h1').replace("'", "'\\''")
+        _, output, _ = executor.run_command(f"cd /tmp && printf '%s\\n' '{wrapped}' | at now + 5 minutes 2>&1")
+        self.assertIn('job 1 at ', output)
+        self.assertEqual([j['job_id'] for j in parse_atq_output(executor.run_command('atq')[1])], ['1'])
+        self.assertIn("echo 'hi'", executor.run_command('at -c 1')[1])
+        self.assertEqual(executor.run_command('atrm 1')[0], 0)
+        self.assertEqual(executor.run_command('at -c 1')[0], 1)
+
+        executor.run_command(f"cd /tmp && printf '%s\\n' '{wrapped}' | at now 2>&1")
+        done = f'{config.AT_DONE_PREFIX}h1'
+        self.assertEqual(executor.run_command(f'cat {done} 2>/dev/null && rm -f {done}'), (0, '0\n', ''))
+        self.assertEqual(executor.run_command('atq')[1], '')
+
+    def test_bad_at_time(self):
+        executor = SimulatedExecutor(['root'])
+        for spec, output in [('', 'Garbled time\n'), ('   ', 'Garbled time\n'),
+                             ('tomorrow noon', 'syntax error. Last token seen: noon\nGarbled time\n')]:
+            result = executor.run_command(f"cd /tmp && printf '%s\\n' 'echo hi' | at {spec} 2>&1")
+            self.assertEqual(result, (1, output, ''), spec)
+        self.assertEqual(executor.run_command('atq')[1], '')
+
+    def test_simulated_fleet_config(self):
+        machines = config.simulated_fleet(3, latency=0.5)
+        self.assertEqual(list(machines), ['sim-0001', 'sim-0002', 'sim-0003'])
+        self.assertEqual(machines['sim-0002']['seed'], 2)
+        self.assertEqual(machines['sim-0002']['latency'], 0.5)
+
+
+
+@unittest.skipUnless(HAS_PARAMIKO and os.path.exists('/bin/sh'), 'requires paramiko and /bin/sh')
+class TestSSHExecutorStandIn(unittest.TestCase):
+    """通过本地 SSH 替身服务器测试 SSHExecutor 的真实 SSH 路径"""
+
+    @classmethod
+    def setUpClass(cls):
+        from benchmarks.ssh_server import SSHStandIn
+        cls.server = SSHStandIn(crontabs={'root': '0 * * * * a\n', 'www': '5 * * * * b\n'})
+        cls.server.start()
+        cls.executor = get_executor(cls.server.machine_config())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.close()
+        cls.server.stop()
+
+    def test_read_and_hashes(self):
+        self.assertEqual(
+            self.executor.get_crontabs(['root', 'www', 'nobody']),
+            {'root': '0 * * * * a\n', 'www': '5 * * * * b\n', 'nobody': ''},
+        )
+        self.assertEqual(self.executor.get_crontab('www'), '5 * * * * b\n')
+        expected = hashlib.sha256(b'5 * * * * b\n').hexdigest()
+        self.assertEqual(self.executor.get_crontab_hashes(['www'])['www'], expected)
+
+    def test_save_if(self):
+        self.server.set_crontab('db', 'old\n')
+        expected = hashlib.sha256(b'old\n').hexdigest()
+        self.assertEqual(self.executor.save_crontab_if('new\n', 'db', 'stale'), (False, SAVE_CONFLICT))
+        self.assertEqual(self.executor.save_crontab_if('new\n', 'db', expected), (True, ''))
+        self.assertEqual(self.server.get_crontab('db'), 'new\n')
+
+    def test_at_commands(self):
+        _, output, _ = self.executor.run_command("cd /tmp && printf '%s\\n' 'echo hi' | at now + 5 minutes 2>&1")
+        job_id = output.split('job ')[1].split()[0]
+        self.assertIn(job_id, [j['job_id'] for j in parse_atq_output(self.executor.run_command('atq')[1])])
+        self.assertIn('echo hi', self.executor.run_command(f'at -c {job_id}')[1])
+        self.assertEqual(self.executor.run_command(f'atrm {job_id}')[0], 0)
+
+    def test_nodelay(self):
+        sock = self.executor._get_transport().sock
+        self.assertTrue(sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+
+if __name__ == '__main__':
+    unittest.main()
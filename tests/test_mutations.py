@@ -0,0 +1,118 @@
+# tests/test_mutations.py - crontab 内容变换测试
+# 测试: 单个变换函数、批量顺序应用、整批失败
+# 运行: python -m pytest tests/test_mutations.py -v
+
+import unittest
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import mutations
+from core.crontab import parse_crontab_content
+
+CRONTAB = """# 系统维护
+0 3 * * * /cleanup.sh
+#0 4 * * * /disabled.sh
+
+# 备份任务
+# 数据库
+0 2 * * * /backup.sh
+"""
+
+
+def apply(fn, raw=CRONTAB, **params):
+    return fn(raw, parse_crontab_content(raw), **params)
+
+
+class TestMutations(unittest.TestCase):
+    """测试单个变换函数"""
+
+    def test_toggle_task(self):
+        raw, details = apply(mutations.toggle_task, task_id=1)
+        self.assertIn('\n0 4 * * * /disabled.sh\n', raw)
+        self.assertEqual(details['action'], 'enable')
+
+    def test_toggle_task_explicit_state(self):
+        raw, _ = apply(mutations.toggle_task, task_id=0, enabled=True)
+        self.assertEqual(raw, CRONTAB)
+
+    def test_delete_last_task_removes_group_title(self):
+        raw, details = apply(mutations.delete_task, task_id=2)
+        self.assertNotIn('# 备份任务', raw)
+        self.assertEqual(details['group_deleted'], '备份任务')
+
+    def test_macro_task(self):
+        raw, _ = apply(mutations.toggle_task, "#@daily /d.sh\n", task_id=0)
+        self.assertEqual(raw, "@daily /d.sh\n")
+        raw, _ = apply(mutations.update_task, raw, task_id=0, schedule='@reboot    ', command='/d.sh')
+        self.assertEqual(raw, "@reboot /d.sh\n")
+
+    def test_not_found(self):
+        with self.assertRaisesRegex(ValueError, 'Task not found'):
+            apply(mutations.toggle_task, task_id=9)
+        with self.assertRaisesRegex(ValueError, 'Task group not found'):
+            apply(mutations.delete_group, group_id=9)
+
+    def test_invalid_schedule(self):
+        with self.assertRaises(ValueError):
+            apply(mutations.update_task, task_id=0, schedule='61 * * * *', command='/x')
+
+    def test_move_task_to_end(self):
+        raw, details = apply(mutations.move_task_to_end, task_id=0, to_group_id=1)
+        self.assertTrue(raw.rstrip('\n').endswith('0 2 * * * /backup.sh\n0 3 * * * /cleanup.sh'))
+        self.assertEqual((details['from_group'], details['to_group']), (0, 1))
+
+
+class TestApplyOperations(unittest.TestCase):
+    """测试批量顺序应用"""
+
+    def test_sequential_ids(self):
+        # 删除任务 0 后，原任务 1 变为任务 0
+        raw, details = mutations.apply_operations(CRONTAB, [
+            {'op': 'delete', 'task_id': 0},
+            {'op': 'toggle', 'task_id': 0},
+        ])
+        self.assertNotIn('/cleanup.sh', raw)
+        self.assertIn('\n0 4 * * * /disabled.sh', raw)
+        self.assertEqual([d['op'] for d in details], ['delete', 'toggle'])
+
+    def test_rename_group_and_task(self):
+        raw, _ = mutations.apply_operations(CRONTAB, [
+            {'op': 'rename', 'group_id': 0, 'title': '维护'},
+            {'op': 'rename', 'task_id': 2, 'name': 'db'},
+        ])
+        self.assertIn('# 维护\n', raw)
+        self.assertIn('# db\n0 2 * * * /backup.sh', raw)
+
+    def test_move_before_task(self):
+        raw, _ = mutations.apply_operations(CRONTAB, [
+            {'op': 'move', 'task_id': 2, 'to_task_id': 0, 'insert_before': True},
+        ])
+        self.assertTrue(raw.startswith('# 系统维护\n# 数据库\n0 2 * * * /backup.sh\n0 3 * * *'))
+
+    def test_matches_individual_application(self):
+        operations = [
+            {'op': 'toggle', 'task_id': 0},
+            {'op': 'add_to_group', 'group_id': 1, 'schedule': '0 6 * * *', 'command': '/new.sh'},
+            {'op': 'update', 'task_id': 1, 'schedule': '0 5 * * *', 'command': '/disabled.sh'},
+        ]
+        batched, _ = mutations.apply_operations(CRONTAB, operations)
+        raw = CRONTAB
+        raw, _ = apply(mutations.toggle_task, raw, task_id=0)
+        raw, _ = apply(mutations.add_task_to_group, raw, group_id=1, schedule='0 6 * * *', command='/new.sh')
+        raw, _ = apply(mutations.update_task, raw, task_id=1, schedule='0 5 * * *', command='/disabled.sh')
+        self.assertEqual(batched, raw)
+
+    def test_error_names_operation(self):
+        with self.assertRaisesRegex(ValueError, r'Operation 2 \(toggle\): Task not found'):
+            mutations.apply_operations(CRONTAB, [{'op': 'delete', 'task_id': 0}, {'op': 'toggle', 'task_id': 2}])
+        with self.assertRaisesRegex(ValueError, 'unknown op'):
+            mutations.apply_operations(CRONTAB, [{'op': 'chmod'}])
+        with self.assertRaisesRegex(ValueError, 'missing task_id'):
+            mutations.apply_operations(CRONTAB, [{'op': 'delete'}])
+        with self.assertRaises(ValueError):
+            mutations.apply_operations(CRONTAB, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,337 @@
+# tests/test_routes.py - Crontab 路由集成测试
+# 测试: 通过 Flask test client 调用 API，执行器为内存实现
+# 运行: python -m pytest tests/test_routes.py -v
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from flask import Flask
+
+from core import config, audit, backups
+from core import crontab as core_crontab
+from core.auth import init_auth
+from routes import register_blueprints
+from tests.helpers import MemoryExecutor
+
+CRONTAB = """# 系统维护
+0 3 * * * /cleanup.sh
+#0 4 * * * /disabled.sh
+
+# 备份任务
+# 数据库
+0 2 * * * /backup.sh
+"""
+
+
+class RouteTestCase(unittest.TestCase):
+    """路由测试基类: 免登录 admin、临时备份/日志目录、内存执行器"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.executor = MemoryExecutor({'root': CRONTAB})
+        self.patches = [
+            patch.object(config, 'AUTH_ENABLED', False),
+            patch.object(config, 'AUTH_BYPASS_USERNAME', 'admin'),
+            patch.object(config, 'USERS', {'admin': {'password': 'x', 'role': 'admin', 'machines': ['*']}}),
+            patch.object(config, 'MACHINES', {'local': {'type': 'local', 'linux_users': ['root']}}),
+            patch.object(config, 'BACKUP_DIR', os.path.join(self.tmpdir.name, 'backups')),
+            patch.object(config, 'AUDIT_LOG', os.path.join(self.tmpdir.name, 'audit.log')),
+            patch.dict(core_crontab._executors, {'local': self.executor}, clear=True),
+            patch.dict(core_crontab._crontab_cache, clear=True),
+            patch.dict(core_crontab._known_hashes, clear=True),
+        ]
+        for p in self.patches:
+            p.start()
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        init_auth(app)
+        register_blueprints(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        audit.flush()
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def post(self, url, **body):
+        body.setdefault('machine_id', 'local')
+        body.setdefault('linux_user', 'root')
+        return self.client.post(url, json=body)
+
+    @property
+    def content(self):
+        return self.executor.crontabs['root']
+
+
+class TestConditionalGet(RouteTestCase):
+    """测试 ETag / If-None-Match / If-Match"""
+
+    def test_raw_etag_and_304(self):
+        resp = self.client.get('/api/raw/local/root')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+        self.assertEqual(etag.strip('"'), resp.get_json()['version'])
+
+        resp = self.client.get('/api/raw/local/root', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.get_data(), b'')
+
+    def test_tasks_etag_changes_with_content(self):
+        etag = self.client.get('/api/tasks/local/root').headers['ETag']
+        self.post('/api/toggle/0')
+        resp = self.client.get('/api/tasks/local/root', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_save_if_match_precondition(self):
+        version = self.client.get('/api/raw/local/root').get_json()['version']
+        self.executor.crontabs['root'] += '0 5 * * * /external.sh\n'
+        core_crontab.invalidate_crontab_cache('local', 'root')
+
+        resp = self.post('/api/save', content='0 1 * * * /mine.sh\n', version=version)
+        self.assertEqual(resp.status_code, 412)
+        self.assertIn('/external.sh', self.content)
+
+        resp = self.client.post('/api/save', json={
+            'machine_id': 'local', 'linux_user': 'root', 'content': '0 1 * * * /mine.sh\n'
+        }, headers={'If-Match': f'"{version}"'})
+        self.assertEqual(resp.status_code, 412)
+
+    def test_save_returns_new_version(self):
+        version = self.client.get('/api/raw/local/root').get_json()['version']
+        resp = self.post('/api/save', content='0 1 * * * /mine.sh\n', version=version)
+        self.assertEqual(resp.status_code, 200)
+        new_version = resp.get_json()['version']
+        self.assertEqual(self.client.get('/api/raw/local/root').get_json()['version'], new_version)
+
+
+class TestSingleFetchMutation(RouteTestCase):
+    """测试修改操作只读取一次远程内容，并在写入时检测并发修改"""
+
+    def test_one_remote_read_per_mutation(self):
+        with patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 0}):
+            for url, body in [
+                ('/api/toggle/0', {}),
+                ('/api/update/1', {'schedule': '0 5 * * *', 'command': '/disabled.sh'}),
+                ('/api/reorder_tasks', {'from_task_id': 2, 'from_group_id': 1,
+                                        'to_task_id': 0, 'to_group_id': 0}),
+            ]:
+                self.executor.reads = 0
+                resp = self.post(url, **body)
+                self.assertEqual(resp.status_code, 200, url)
+                self.assertEqual(self.executor.reads, 1, url)
+
+    def test_backup_written_from_read_content(self):
+        self.post('/api/toggle/0')
+        entries = backups.list_backups('local', 'root')
+        self.assertEqual(backups.get_backup('local', 'root', entries[0]['filename']), CRONTAB)
+
+    def test_concurrent_change_conflicts(self):
+        original = self.executor.get_crontab
+
+        def read_then_external_edit(linux_user=''):
+            content = original(linux_user)
+            self.executor.crontabs[linux_user] = content + '0 9 * * * /external.sh\n'
+            return content
+
+        self.executor.get_crontab = read_then_external_edit
+        resp = self.post('/api/toggle/0')
+        self.assertEqual(resp.status_code, 409)
+        self.assertIn('/external.sh', self.content)
+        self.assertTrue(self.content.startswith('# 系统维护\n0 3 * * *'))
+
+    def test_stale_client_version_rejected(self):
+        version = self.client.get('/api/tasks/local/root').get_json()['version']
+        self.post('/api/toggle/0')
+        resp = self.post('/api/toggle/0', version=version)
+        self.assertEqual(resp.status_code, 412)
+
+
+class TestBackupRoutes(RouteTestCase):
+    """测试备份列表、内容与回滚"""
+
+    def test_list_content_restore(self):
+        self.post('/api/toggle/0')
+        self.post('/api/toggle/0')
+        listed = self.client.get('/api/backups/local/root').get_json()['backups']
+        self.assertEqual(len(listed), 2)
+        oldest = listed[-1]['filename']
+        resp = self.client.get(f'/api/backup/local/root/{oldest}')
+        self.assertEqual(resp.get_json()['content'], CRONTAB)
+        self.post('/api/toggle/0')
+        self.assertEqual(self.post(f'/api/restore/local/root/{oldest}').status_code, 200)
+        self.assertEqual(self.content, CRONTAB)
+        self.assertEqual(self.client.get('/api/backup/local/root/crontab_none.bak').status_code, 404)
+
+    def test_pagination_and_stats(self):
+        for _ in range(5):
+            self.post('/api/toggle/0')
+        pages, cursor = [], None
+        while True:
+            url = '/api/backups/local/root?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            data = self.client.get(url).get_json()
+            pages.append([b['filename'] for b in data['backups']])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual([len(p) for p in pages], [2, 2, 1])
+        listed = self.client.get('/api/backups/local/root').get_json()['backups']
+        self.assertEqual(sum(pages, []), [b['filename'] for b in listed])
+        self.assertEqual((listed[-1]['tasks'], listed[-1]['added'], listed[-1]['removed']), (3, 3, 0))
+        self.assertEqual((listed[0]['added'], listed[0]['removed']), (1, 1))
+        self.assertEqual(listed[0]['size'], len(CRONTAB.encode()))
+
+        self.assertEqual(self.client.get('/api/backups/local/root?until=2000-01-01').get_json()['backups'], [])
+        self.assertEqual(len(self.client.get('/api/backups/local/root?since=2000-01-01').get_json()['backups']), 5)
+        self.assertEqual(self.client.get('/api/backups/local/root?cursor=nope.bak').status_code, 400)
+        self.assertEqual(self.client.get('/api/backups/local/root?since=yesterday').status_code, 400)
+
+    def test_unknown_machine_or_user_rejected(self):
+        outside = os.path.join(self.tmpdir.name, 'outside')
+        os.makedirs(outside)
+        with open(os.path.join(outside, 'crontab_20240101_000000_x.bak'), 'w') as f:
+            f.write('* * * * * /x\n')
+        for url in ['/api/backups/%2E%2E/outside', '/api/backups/local/www', '/api/backups/other/root',
+                    '/api/backup/local/..%2F..%2Fx/crontab_1.bak', '/api/diff/local/www?from=current']:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+        self.assertEqual(os.listdir(outside), ['crontab_20240101_000000_x.bak'])
+        self.assertEqual(self.post('/api/restore/local/www/crontab_1.bak').status_code, 404)
+
+    def test_diff(self):
+        self.post('/api/toggle/0')
+        oldest = self.client.get('/api/backups/local/root').get_json()['backups'][-1]['filename']
+        data = self.client.get(f'/api/diff/local/root?from={oldest}').get_json()
+        self.assertEqual((data['added'], data['removed']), (1, 1))
+        self.assertIn(['-', ['0 3 * * * /cleanup.sh']], data['ops'])
+        self.assertIn(['+', ['#0 3 * * * /cleanup.sh']], data['ops'])
+        self.assertEqual(data['to_version'], core_crontab.content_hash(self.content))
+
+        by_hash = self.client.get(f'/api/diff/local/root?from={data["from_version"]}&format=unified').get_json()
+        self.assertIn('-0 3 * * * /cleanup.sh\n+#0 3 * * * /cleanup.sh\n', by_hash['diff'])
+        self.assertEqual(self.client.get(f'/api/diff/local/root?from={"0" * 64}').status_code, 404)
+        self.assertEqual(self.client.get('/api/diff/local/root?from=current&format=html').status_code, 400)
+        self.assertEqual(self.client.get('/api/diff/local/root').status_code, 400)
+        bare = self.client.get(f'/api/diff?from={oldest}')
+        self.assertEqual(bare.status_code, 200)
+        self.assertEqual(bare.get_json()['ops'], data['ops'])
+
+
+class TestAuditRoutes(RouteTestCase):
+    """测试审计日志查询与导出"""
+
+    def test_export_ndjson_and_csv(self):
+        self.post('/api/toggle/0')
+        self.post('/api/toggle/1')
+        resp = self.client.get('/api/audit_export?machine=local&action=toggle_task')
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        self.assertIn('attachment', resp.headers['Content-Disposition'])
+        records = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([r['details']['task_id'] for r in records], [0, 1])
+
+        rows = self.client.get('/api/audit_export?format=csv&user=admin').get_data(as_text=True).splitlines()
+        self.assertEqual(rows[0], 'timestamp,user,action,machine,details')
+        self.assertEqual([row.split(',')[2] for row in rows[1:3]], ['toggle_task', 'toggle_task'])
+        self.assertEqual(self.client.get('/api/audit_export?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/audit_export?since=soon').status_code, 400)
+
+    def test_export_requires_admin(self):
+        with patch.dict(config.USERS['admin'], {'role': 'editor'}):
+            self.assertEqual(self.client.get('/api/audit_export').status_code, 403)
+
+    def test_query_filters(self):
+        self.post('/api/toggle/0')
+        data = self.client.get('/api/audit_logs/local?action=toggle_task&limit=1').get_json()
+        self.assertEqual([log['action'] for log in data['logs']], ['toggle_task'])
+        self.assertEqual(self.client.get('/api/audit_logs/local?action=nope').get_json()['logs'], [])
+        self.assertEqual(self.client.get('/api/audit_logs?before=x').status_code, 400)
+
+
+class TestBatch(RouteTestCase):
+    """测试 /api/batch: 一次读取、一次写入、一次备份、一条审计日志"""
+
+    OPERATIONS = [
+        {'op': 'toggle', 'task_id': 0},
+        {'op': 'toggle', 'task_id': 1},
+        {'op': 'rename', 'group_id': 1, 'title': '备份'},
+        {'op': 'add_to_group', 'group_id': 0, 'schedule': '0 6 * * *', 'command': '/new.sh'},
+    ]
+
+    def test_single_read_modify_write(self):
+        with patch.dict(config.CACHE_CONFIG, {'crontab_ttl': 0}):
+            resp = self.post('/api/batch', operations=self.OPERATIONS)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['applied'], 4)
+        self.assertEqual((self.executor.reads, self.executor.writes), (1, 1))
+        self.assertEqual(self.content, (
+            "# 系统维护\n#0 3 * * * /cleanup.sh\n0 4 * * * /disabled.sh\n#0 6 * * * /new.sh\n\n"
+            "# 备份\n# 数据库\n0 2 * * * /backup.sh\n"
+        ))
+        self.assertEqual(self.client.get('/api/raw/local/root').get_json()['version'],
+                         resp.get_json()['version'])
+
+        self.assertEqual(len(backups.list_backups('local', 'root')), 1)
+        audit.flush()
+        with open(config.AUDIT_LOG) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual([e['action'] for e in entries], ['batch'])
+        self.assertEqual(len(entries[0]['details']['operations']), 4)
+
+    def test_failed_operation_saves_nothing(self):
+        resp = self.post('/api/batch', operations=self.OPERATIONS + [{'op': 'delete', 'task_id': 99}])
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('Operation 5 (delete)', resp.get_json()['error'])
+        self.assertEqual(self.executor.writes, 0)
+        self.assertEqual(self.content, CRONTAB)
+
+    def test_stale_version(self):
+        resp = self.post('/api/batch', operations=self.OPERATIONS, version='0' * 64)
+        self.assertEqual(resp.status_code, 412)
+
+
+class TestNextRuns(RouteTestCase):
+    """测试 /api/next_runs: 一次返回机器上所有用户启用任务的执行时间"""
+
+    def test_all_users_sorted(self):
+        self.executor.crontabs['www'] = '*/5 * * * * /often.sh\n'
+        with patch.dict(config.MACHINES, {'local': {'type': 'local', 'linux_users': ['root', 'www']}}):
+            resp = self.client.get('/api/next_runs/local?count=2')
+        self.assertEqual(resp.status_code, 200)
+        tasks = resp.get_json()['tasks']
+        firsts = [t['next_runs'][0] for t in tasks]
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(sorted(t['command'] for t in tasks), ['/backup.sh', '/cleanup.sh', '/often.sh'])
+        self.assertTrue(all(len(t['next_runs']) == 2 for t in tasks))
+        self.assertEqual(self.executor.reads, 1)
+
+
+class TestHeatmapRoute(RouteTestCase):
+    """测试 /api/analysis/heatmap"""
+
+    def test_week_heatmap(self):
+        resp = self.client.get('/api/analysis/heatmap?window=week&slot=1440&start=2026-10-16')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.get_json()
+        self.assertEqual(len(data['slots']), 7)
+        self.assertEqual(data['machines']['local']['slots'], [2] * 7)
+
+    def test_collision_batches_apply(self):
+        self.executor.crontabs['root'] = ''.join(f'0 2 * * * /job{i}.sh\n' for i in range(4))
+        resp = self.client.get('/api/analysis/collisions?threshold=2')
+        data = resp.get_json()
+        self.assertEqual(data['collisions'][0]['count'], 4)
+        for body in data['batches']:
+            self.assertEqual(self.client.post('/api/batch', json=body).status_code, 200)
+        self.assertEqual(self.client.get('/api/analysis/collisions?threshold=2').get_json()['collisions'], [])
+
+    def test_invalid_slot(self):
+        self.assertEqual(self.client.get('/api/analysis/heatmap?slot=7').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
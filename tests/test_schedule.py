@@ -0,0 +1,105 @@
+# tests/test_schedule.py - cron 表达式编译与下次执行时间测试
+# 测试: 字段位图、名称与宏、Vixie 日/星期规则、跨月跨年、执行时间按分钟缓存
+# 运行: python -m pytest tests/test_schedule.py -v
+
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core.crontab import add_next_runs, parse_crontab, parse_crontab_content, _next_run_times
+from core.schedule import compile_schedule, next_runs
+
+# 2026-10-16 是周五
+NOW = datetime(2026, 10, 16, 12, 34, 56)
+
+
+def runs(schedule, count=3, start=NOW):
+    return [dt.strftime('%Y-%m-%d %H:%M') for dt in next_runs(schedule, count, start)]
+
+
+class TestCompileSchedule(unittest.TestCase):
+    """测试表达式编译"""
+
+    def test_field_bitsets(self):
+        compiled = compile_schedule('*/20 1-3 1,15 * *')
+        self.assertEqual(compiled.minutes, 1 << 0 | 1 << 20 | 1 << 40)
+        self.assertEqual(compiled.hours, 0b1110)
+        self.assertEqual(compiled.days, 1 << 1 | 1 << 15)
+        self.assertTrue(compiled.dow_star)
+        self.assertFalse(compiled.dom_star)
+
+    def test_names_and_sunday_seven(self):
+        self.assertEqual(compile_schedule('0 0 * jan-mar mon-fri'), compile_schedule('0 0 * 1-3 1-5'))
+        self.assertEqual(compile_schedule('0 0 * * 7').weekdays, 1)
+
+    def test_macros(self):
+        self.assertEqual(compile_schedule('@daily'), compile_schedule('0 0 * * *'))
+        self.assertIsNone(compile_schedule('@reboot'))
+        self.assertEqual(next_runs('@reboot', 3, NOW), [])
+
+    def test_invalid(self):
+        for schedule in ['60 * * * *', '* * * *', '*/0 * * * *', '0 0 * foo *', '@sometimes']:
+            with self.assertRaises(ValueError, msg=schedule):
+                compile_schedule(schedule)
+
+
+class TestNextRuns(unittest.TestCase):
+    """测试下次执行时间计算"""
+
+    def test_every_quarter_hour(self):
+        self.assertEqual(runs('*/15 * * * *'), ['2026-10-16 12:45', '2026-10-16 13:00', '2026-10-16 13:15'])
+
+    def test_current_minute_excluded(self):
+        self.assertEqual(runs('34 12 * * *', 1), ['2026-10-17 12:34'])
+
+    def test_step_from_start_value(self):
+        self.assertEqual(runs('5/20 * * * *', 2), ['2026-10-16 12:45', '2026-10-16 13:05'])
+
+    def test_dom_dow_or_rule(self):
+        # 日与星期都被限制时任一匹配即执行：每月 1 日或每个周五
+        self.assertEqual(runs('0 0 1 * 5'), ['2026-10-23 00:00', '2026-10-30 00:00', '2026-11-01 00:00'])
+
+    def test_dom_dow_and_when_star(self):
+        # 星期字段为 * 时只看日期
+        self.assertEqual(runs('0 0 1 * *', 1), ['2026-11-01 00:00'])
+        self.assertEqual(runs('0 9 * * mon', 1), ['2026-10-19 09:00'])
+
+    def test_year_rollover_and_leap_day(self):
+        self.assertEqual(runs('0 0 1 1 *', 1), ['2027-01-01 00:00'])
+        self.assertEqual(runs('0 0 29 2 *', 1), ['2028-02-29 00:00'])
+
+    def test_never_runs(self):
+        self.assertEqual(runs('0 0 30 2 *'), [])
+
+
+class TestAddNextRuns(unittest.TestCase):
+    """测试任务附带 next_runs"""
+
+    def test_enabled_only(self):
+        groups = parse_crontab_content("0 3 * * * /a.sh\n#0 4 * * * /b.sh\n")
+        add_next_runs(groups, count=2, now=NOW)
+        enabled, disabled = groups[0]['tasks']
+        self.assertEqual(enabled['next_runs'], ['2026-10-17 03:00', '2026-10-18 03:00'])
+        self.assertEqual(disabled['next_runs'], [])
+
+    @patch('core.crontab.get_crontab_raw', return_value='0 3 * * * /a.sh\n')
+    def test_parse_crontab_skips_next_runs(self, mock_raw):
+        self.assertNotIn('next_runs', parse_crontab('local', 'root')[0]['tasks'][0])
+
+    def test_same_schedule_computed_once_per_minute(self):
+        groups = parse_crontab_content("0 3 * * * /a.sh\n0 3 * * * /b.sh\n")
+        _next_run_times.cache_clear()
+        with patch('core.crontab.next_runs', wraps=next_runs) as compute:
+            add_next_runs(groups, count=2, now=NOW)
+            add_next_runs(groups, count=2, now=NOW.replace(second=0))
+            self.assertEqual(compute.call_count, 1)
+            add_next_runs(groups, count=2, now=NOW.replace(minute=35))
+            self.assertEqual(compute.call_count, 2)
+        self.assertEqual([t['next_runs'] for t in groups[0]['tasks']], [['2026-10-17 03:00', '2026-10-18 03:00']] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
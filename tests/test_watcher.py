@@ -0,0 +1,169 @@
+# tests/test_watcher.py - crontab 变化检测调度测试
+# 测试: 到期提交、超时标记、失败退避、统计、哈希变化检测、其他 worker 保存的识别、本工具保存版本的备份
+# 运行: python -m pytest tests/test_watcher.py -v
+
+import time
+import tempfile
+import subprocess
+import unittest
+from unittest.mock import patch
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from core import config
+from core import crontab as core_crontab
+from core.watcher import CrontabWatcher
+from tests.helpers import MemoryExecutor
+
+MACHINES = {
+    'a': {'type': 'local', 'linux_users': ['root']},
+    'b': {'type': 'local', 'linux_users': ['root', 'www']},
+}
+
+
+@patch.object(config, 'MACHINES', MACHINES)
+class TestCrontabWatcher(unittest.TestCase):
+    """测试 CrontabWatcher 调度逻辑（不启动线程，手动驱动）"""
+
+    def setUp(self):
+        self.watcher = CrontabWatcher(interval=60, max_workers=2, deadline=30, jitter=0, max_backoff=300)
+
+    def drain(self):
+        jobs = []
+        while not self.watcher._queue.empty():
+            jobs.append(self.watcher._queue.get())
+        return jobs
+
+    def test_initial_checks_spread_within_interval(self):
+        self.watcher.tick(now=1000)
+        for state in self.watcher._machines.values():
+            self.assertTrue(1000 <= state['next_due'] <= 1060)
+        self.watcher.tick(now=1061)
+        self.assertEqual(sorted(m for m, _ in self.drain()), ['a', 'b'])
+
+    def test_running_machine_not_resubmitted(self):
+        self.watcher.tick(now=1000)
+        self.watcher.tick(now=1061)
+        self.drain()
+        self.watcher.tick(now=1062)
+        self.assertEqual(self.drain(), [])
+
+    def test_deadline_marks_failure(self):
+        self.watcher.tick(now=1000)
+        self.watcher.tick(now=1061)
+        self.drain()
+        self.watcher.tick(now=1100)
+        stats = self.watcher.stats()
+        self.assertEqual(stats['timeouts'], 2)
+        self.assertEqual(self.watcher._machines['a']['failures'], 1)
+
+    @patch('core.watcher.check_machine_crontabs')
+    def test_failure_backoff_and_recovery(self, mock_check):
+        mock_check.side_effect = RuntimeError('connect timeout')
+        self.watcher._check('a', ['root'])
+        self.watcher._check('a', ['root'])
+        state = self.watcher._machines['a']
+        self.assertEqual(state['failures'], 2)
+        self.assertAlmostEqual(state['next_due'] - time.time(), 240, delta=5)
+
+        mock_check.side_effect = None
+        mock_check.return_value = ['root']
+        self.watcher._check('a', ['root'])
+        self.assertEqual(state['failures'], 0)
+        self.assertEqual(self.watcher.stats()['changes'], 1)
+
+    @patch('core.watcher.check_machine_crontabs')
+    def test_backoff_capped(self, mock_check):
+        mock_check.side_effect = RuntimeError('down')
+        for _ in range(10):
+            self.watcher._check('a', ['root'])
+        self.assertLessEqual(self.watcher._machines['a']['next_due'] - time.time(), 301)
+
+    @patch('core.watcher.check_machine_crontabs', return_value=[])
+    def test_cycle_statistics(self, mock_check):
+        self.watcher.tick(now=1000)
+        self.watcher._check('a', ['root'])
+        self.assertIsNone(self.watcher.stats()['cycle_seconds']['last'])
+        self.watcher._check('b', ['root', 'www'])
+        stats = self.watcher.stats()
+        self.assertIsNotNone(stats['cycle_seconds']['last'])
+        self.assertEqual(stats['checks'], 2)
+        self.assertIsNotNone(stats['check_seconds']['p95'])
+
+
+class TestHashChangeDetection(unittest.TestCase):
+    """测试基于哈希的变化检测：内容不变时不拉取全文"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.executor = MemoryExecutor({'root': '0 * * * * /a.sh\n', 'www': '0 1 * * * /b.sh\n'})
+        self.patches = [
+            patch.object(config, 'BACKUP_DIR', self.tmpdir.name),
+            patch.object(core_crontab, 'get_machine_executor', return_value=self.executor),
+            patch.object(core_crontab, 'log_action'),
+            patch.dict(core_crontab._known_hashes, clear=True),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.tmpdir.cleanup()
+
+    def test_first_check_fetches_all(self):
+        changed = core_crontab.check_machine_crontabs('m1', ['root', 'www'])
+        self.assertEqual(changed, ['root', 'www'])
+        self.assertEqual(self.executor.fetched, [['root', 'www']])
+
+    def test_unchanged_skips_fetch(self):
+        core_crontab.check_machine_crontabs('m1', ['root', 'www'])
+        self.executor.fetched.clear()
+        self.assertEqual(core_crontab.check_machine_crontabs('m1', ['root', 'www']), [])
+        self.assertEqual(self.executor.fetched, [])
+        self.assertEqual(self.executor.hash_calls, 2)
+
+    def test_only_changed_user_fetched(self):
+        core_crontab.check_machine_crontabs('m1', ['root', 'www'])
+        self.executor.fetched.clear()
+        self.executor.crontabs['www'] = '0 2 * * * /b.sh\n'
+        self.assertEqual(core_crontab.check_machine_crontabs('m1', ['root', 'www']), ['www'])
+        self.assertEqual(self.executor.fetched, [['www']])
+
+    def test_save_from_other_worker_not_external(self):
+        """另一个进程（worker）的检测不把本工具的保存视为外部修改"""
+        core_crontab.check_machine_crontabs('m1', ['root'])
+        core_crontab.save_crontab('0 5 * * * /a.sh\n', 'admin', 'm1', 'root')
+        script = (
+            'import sys; sys.path.insert(0, sys.argv[1]); from core import config, crontab; '
+            'config.BACKUP_DIR = sys.argv[2]; config.AUDIT_LOG = sys.argv[2] + "/audit.log"; '
+            'print(crontab.check_crontab_content("m1", "root", sys.argv[3]), '
+            'crontab.check_crontab_content("m1", "root", "0 6 * * * /a.sh\\n"))'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, '-c', script, root, config.BACKUP_DIR, self.executor.crontabs['root']],
+                                check=True, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.stdout.split(), ['False', 'True'])
+
+    def test_tool_saved_version_kept_in_history(self):
+        """本工具保存的版本被检测写入备份历史（不记为外部修改），外部修改后仍可恢复"""
+        from core import backups
+        core_crontab.check_machine_crontabs('m1', ['root'])
+        saved = '0 5 * * * /a.sh\n'
+        core_crontab.save_crontab(saved, 'admin', 'm1', 'root')
+        self.assertEqual(core_crontab.check_machine_crontabs('m1', ['root']), [])
+        self.executor.crontabs['root'] = '0 6 * * * /a.sh\n'
+        self.assertEqual(core_crontab.check_machine_crontabs('m1', ['root']), ['root'])
+
+        actions = [c.args[0] for c in core_crontab.log_action.call_args_list]
+        self.assertEqual(actions.count('external_change_detected'), 1)
+        entry = next(e for e in backups.list_backups('m1', 'root') if e['hash'] == backups.object_hash(saved))
+        restored = backups.get_backup('m1', 'root', entry['filename'])
+        self.assertEqual(restored, saved)
+        core_crontab.save_crontab(restored, 'admin', 'm1', 'root')
+        self.assertEqual(self.executor.crontabs['root'], saved)
+
+
+if __name__ == '__main__':
+    unittest.main()